@@ -0,0 +1,67 @@
+
+# Import libraries
+import pandas as pd                                         # For grouped aggregation over events
+
+# ----------------------------------------------------------------- #
+#                       PRODUCT ALERT ENGINE                        #
+# ----------------------------------------------------------------- #
+
+# Compute the alert table of every product in one grouped pass.
+# The table is indexed by 'ProductID' (in order of first appearance) and has
+#   'ExpiryDate'          : use-by date of the first event of the product
+#   'ExpiryLocation'      : location of the first event of the product
+#   'Expired'             : True if the use-by date is on or before current_date
+#   'TemperatureConstant' : True if the product has a single temperature value
+#   'WeightConstant'      : True if the product has a single weight value
+#   'FirstTemperature'    : temperature of the first event of the product
+#   'FirstWeight'         : weight of the first event of the product
+def compute_product_alerts( df_txhistory, current_date ):
+    grouped = df_txhistory.groupby( 'ProductID', sort = False )
+    first   = grouped[ [ 'UseByDate', 'Location', 'Temperature', 'Weight' ] ].first()
+    counts  = grouped[ [ 'Temperature', 'Weight' ] ].nunique()
+
+    result = pd.DataFrame( index = first.index )
+    result[ 'ExpiryDate'          ] = pd.to_datetime( first[ 'UseByDate' ], errors = 'coerce' ).dt.normalize()
+    result[ 'ExpiryLocation'      ] = first[ 'Location' ]
+    result[ 'Expired'             ] = result[ 'ExpiryDate' ] <= pd.Timestamp( current_date )
+    result[ 'TemperatureConstant' ] = counts[ 'Temperature' ] <= 1
+    result[ 'WeightConstant'      ] = counts[ 'Weight'      ] <= 1
+    result[ 'FirstTemperature'    ] = first[ 'Temperature' ]
+    result[ 'FirstWeight'         ] = first[ 'Weight'      ]
+    return result
+
+# Update an alert table with new events (appended after the events it was
+# computed from) without going over the old events again: the alerts of
+# the new events are computed alone and merged product by product.
+# The result is the same as compute_product_alerts over all the events.
+def merge_product_alerts( product_alerts, df_new, current_date ):
+    new_alerts = compute_product_alerts( df_new, current_date )
+    known      = new_alerts.index.isin( product_alerts.index )
+    old        = product_alerts.loc[ new_alerts.index[ known ] ]
+    new        = new_alerts[ known ]
+
+    # A value stays constant if it was constant before, is constant in the
+    # new events, and did not change from the old value (missing values
+    # are ignored, as in nunique)
+    updates = old.copy()
+    for column, first in [ ( 'TemperatureConstant', 'FirstTemperature' ), ( 'WeightConstant', 'FirstWeight' ) ]:
+        same = ( old[ first ] == new[ first ] ) | old[ first ].isna() | new[ first ].isna()
+        updates[ column ] = old[ column ] & new[ column ] & same
+        updates[ first  ] = old[ first ].where( old[ first ].notna(), new[ first ] )
+
+    result = product_alerts.copy()
+    result.loc[ updates.index, updates.columns ] = updates
+    return pd.concat( [ result, new_alerts[ ~known ] ] )
+
+# Products whose alert flag in 'column' is False
+def products_failing( product_alerts, column ):
+    return product_alerts.index[ ~product_alerts[ column ] ].tolist()
+
+# ( product, location ) pairs of expired products
+def expired_product_locations( product_alerts ):
+    expired = product_alerts[ product_alerts[ 'Expired' ] ]
+    return list( zip( expired.index, expired[ 'ExpiryLocation' ] ) )
+
+# True if no product expires before current_date
+def all_products_in_date( product_alerts, current_date ):
+    return bool( ( product_alerts[ 'ExpiryDate' ] >= pd.Timestamp( current_date ) ).all() )
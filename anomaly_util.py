@@ -0,0 +1,121 @@
+
+# Import libraries
+import time                                                 # For scoring throughput benchmark
+import numpy as np                                          # For the batched statistics
+from   statistics import NormalDist                         # For the quantiles of the control limits
+from   pca_util   import iter_row_blocks, randomized_pca    # For scoring block by block, and the benchmark model
+
+# ----------------------------------------------------------------- #
+#                          CONTROL LIMITS                           #
+# ----------------------------------------------------------------- #
+
+# Confidence of the control limits, and spectra scored at once
+ANOMALY_CONFIDENCE = 0.99
+ANOMALY_BATCH_ROWS = 1024
+
+# Quantile of a chi-square distribution (Wilson-Hilferty approximation,
+# within a few per cent for one degree of freedom and better above)
+def chi2_quantile( probability, df ):
+    z = NormalDist().inv_cdf( probability )
+    a = 2 / ( 9 * df )
+    return df * max( 1 - a + z * np.sqrt( a ), 0 ) ** 3
+
+# Quantile of an F distribution (Paulson's approximation: the cube root of
+# F is about normal). Solves the quadratic in F ** ( 1 / 3 )
+def f_quantile( probability, df1, df2 ):
+    z    = NormalDist().inv_cdf( probability )
+    a, b = 2 / ( 9 * df1 ), 2 / ( 9 * df2 )
+    c2   = ( 1 - b ) ** 2 - z * z * b
+    c1   = -2 * ( 1 - a ) * ( 1 - b )
+    c0   = ( 1 - a ) ** 2 - z * z * a
+    if c2 <= 0 or c1 * c1 < 4 * c2 * c0: raise ValueError( 'F quantile out of range of the approximation: df2 = ' + str( df2 ) )
+    return ( ( -c1 + np.sqrt( c1 * c1 - 4 * c2 * c0 ) ) / ( 2 * c2 ) ) ** 3
+
+# ----------------------------------------------------------------- #
+#                         ANOMALY MONITOR                           #
+# ----------------------------------------------------------------- #
+
+# Score spectra against a PCA model (see pca_util.PCAModel):
+#   - Hotelling T2: distance of the scores from the model centre, every
+#     component weighted by its variance (unusual amounts of known variation)
+#   - Q (squared prediction error): squared distance of the scaled spectrum
+#     from the model plane (variation the model has never seen)
+# The T2 limit is the F-distribution limit for new observations. The Q
+# limit is g * chi2( h ), with g and h matched to the mean and variance of
+# the Q of the model's own rows (Nomikos and MacGregor), as the eigenvalues
+# of the discarded components are not known to a randomized PCA.
+# 'values' are the rows the model was fitted on, before the model's own
+# preprocessing (e.g. the raw memory-mapped spectra, when the model was
+# fitted with a PreprocessingPipeline as its 'preprocess' hook). New spectra
+# are raw spectra, also preprocessed by 'pipeline' (a fitted
+# PreprocessingPipeline over 'wavenumbers') if given.
+class AnomalyMonitor:
+    def __init__( self, model, values, pipeline = None, wavenumbers = None, confidence = ANOMALY_CONFIDENCE, batch_rows = ANOMALY_BATCH_ROWS ):
+        self.model       = model
+        self.pipeline    = pipeline
+        self.wavenumbers = wavenumbers
+        self.confidence  = confidence
+        self.batch_rows  = batch_rows
+        self.weights     = 1 / np.where( model.explained_variance > 0, model.explained_variance, np.inf )
+
+        n, k = len( model.scores ), len( model )
+        if n - k < 3: raise ValueError( 'Control limits need more spectra than components: ' + str( n ) + ' spectra, ' + str( k ) + ' components' )
+        self.t2_limit = k * ( n - 1 ) * ( n + 1 ) / ( n * ( n - k ) ) * f_quantile( confidence, k, n - k )
+
+        q      = np.concatenate( [ self.statistics( block )[ 1 ] for start, end, block in iter_row_blocks( values, model.preprocess, batch_rows ) ] )
+        mean   = float( q.mean() )
+        spread = float( q.var() )
+        self.q_limit = spread / ( 2 * mean ) * chi2_quantile( confidence, 2 * mean * mean / spread ) if spread > 0 else mean
+
+    # T2 and Q of a block of rows preprocessed like the fitted ones. The
+    # loadings are orthonormal, so Q is the squared norm of the scaled row
+    # minus that of its scores: one matrix product for both statistics
+    def statistics( self, block ):
+        scaled = ( block - self.model.mean ) / self.model.scale
+        scores = scaled @ self.model.loadings.T
+        t2     = ( scores * scores ) @ self.weights
+        q      = np.maximum( ( scaled * scaled ).sum( axis = 1 ) - ( scores * scores ).sum( axis = 1 ), 0 )
+        return t2, q
+
+    # Score new raw spectra, 'batch_rows' at a time. Returns their T2, Q and
+    # whether either is above its control limit
+    def score( self, values ):
+        values = np.atleast_2d( values )
+        t2, q  = np.zeros( len( values ) ), np.zeros( len( values ) )
+        for start, end, block in iter_row_blocks( values, None, self.batch_rows ):
+            if self.pipeline is not None: block = self.pipeline.transform( block, self.wavenumbers )[ 0 ]
+            if self.model.preprocess is not None: block = self.model.preprocess( block )
+            t2[ start : end ], q[ start : end ] = self.statistics( np.asarray( block, dtype = np.float64 ) )
+        return t2, q, ( t2 > self.t2_limit ) | ( q > self.q_limit )
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Scoring throughput in spectra per second, for batches of several sizes,
+# with and without a preprocessing pipeline (SNV and a Savitzky-Golay
+# derivative, applied block by block as the model's 'preprocess' hook).
+# Also checks the share of the model's own spectra flagged, which should
+# be close to 1 - confidence
+def benchmark_anomaly_scoring( rows = 20000, columns = 1000, batches = ( 1, 100, 10000 ) ):
+    from preprocess_util import PreprocessingPipeline
+    random      = np.random.default_rng( 0 )
+    wavenumbers = np.linspace( 4000, 400, columns )
+    matrix      = ( random.standard_normal( ( rows, 20 ) ) @ random.standard_normal( ( 20, columns ) )
+                  + 0.1 * random.standard_normal( ( rows, columns ) ) ).astype( np.float32 )
+
+    for pipeline in [ None, PreprocessingPipeline( [ 'snv', ( 'savgol', { 'derivative' : 1 } ) ] ) ]:
+        model   = randomized_pca( matrix, preprocess = None if pipeline is None else pipeline.fit( matrix, wavenumbers ).preprocess )
+        monitor = AnomalyMonitor( model, matrix )
+        flagged = monitor.score( matrix )[ 2 ].mean()
+        name    = 'raw' if pipeline is None else 'preprocessed'
+        print( name, 'spectra: T2 limit', round( monitor.t2_limit, 2 ), ', Q limit', round( monitor.q_limit, 2 ), ',',
+               round( float( flagged ) * 100, 2 ), '% of the model spectra flagged' )
+        for batch in batches:
+            count = min( rows, max( batch, 1000 ) )
+            start = time.perf_counter()
+            for first in range( 0, count, batch ): monitor.score( matrix[ first : first + batch ] )
+            print( '   batches of', batch, ':', int( count / ( time.perf_counter() - start ) ), 'spectra/s' )
+
+if __name__ == '__main__':
+    benchmark_anomaly_scoring()
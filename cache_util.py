@@ -0,0 +1,133 @@
+
+# Import libraries
+import os                                                   # For on-disk cache files
+import threading                                            # For locking the cache between callbacks
+from   collections import OrderedDict                       # For least-recently-used ordering
+import pandas as pd                                         # For hashing and pickling data frames
+
+# ----------------------------------------------------------------- #
+#                        IN-MEMORY LRU CACHE                        #
+# ----------------------------------------------------------------- #
+
+# Marker for a key which is not cached
+_MISSING = object()
+
+# Thread-safe least-recently-used cache holding up to 'max_entries' values.
+# 'hits' and 'misses' count the lookups, to check the cache under load.
+# 'on_evict', if given, is called with the key and value of every value
+# which leaves the cache (evicted or replaced), e.g. to delete its files.
+class LRUCache:
+    def __init__( self, max_entries = 16, on_evict = None ):
+        self.max_entries = max_entries
+        self.on_evict    = on_evict
+        self.entries     = OrderedDict()
+        self.lock        = threading.Lock()
+        self.hits        = 0
+        self.misses      = 0
+
+    # Return the cached value, or 'default' if the key is not cached
+    def get( self, key, default = None ):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end( key )
+            return self.entries[ key ]
+
+    # Return the cached value, or build it with create() and cache it.
+    # Two threads missing the same key at once may both build the value,
+    # which is harmless because values only depend on the key.
+    def get_or_create( self, key, create ):
+        value = self.get( key, _MISSING )
+        if value is _MISSING:
+            value = create()
+            self.put( key, value )
+        return value
+
+    # Add a value, evicting the least recently used ones if needed
+    def put( self, key, value ):
+        evicted = []
+        with self.lock:
+            if key in self.entries and self.entries[ key ] is not value: evicted.append( ( key, self.entries[ key ] ) )
+            self.entries[ key ] = value
+            self.entries.move_to_end( key )
+            while len( self.entries ) > self.max_entries: evicted.append( self.entries.popitem( last = False ) )
+        if self.on_evict is not None:
+            for evicted_key, evicted_value in evicted: self.on_evict( evicted_key, evicted_value )
+
+    def __contains__( self, key ):
+        with self.lock: return key in self.entries
+
+    def __len__( self ):
+        with self.lock: return len( self.entries )
+
+    # Hit/miss counters and size of the cache
+    def stats( self ):
+        with self.lock:
+            return { 'hits' : self.hits, 'misses' : self.misses, 'entries' : len( self.entries ), 'max_entries' : self.max_entries }
+
+# ----------------------------------------------------------------- #
+#                      SERVER-SIDE DATASET CACHE                    #
+# ----------------------------------------------------------------- #
+
+# Version key of a data frame: a hash of its content, so the same data
+# always gets the same key and any change gets a new one
+def dataset_version( df ):
+    row_hashes = pd.util.hash_pandas_object( df, index = True ).to_numpy()
+    content    = int( row_hashes.sum( dtype = 'uint64' ) )
+    return format( content, '016x' ) + '-' + str( len( df ) )
+
+# Version key of a data frame extended with new rows, computed from the
+# new rows only. The rows must be numbered after the existing ones; the
+# result is then the same as dataset_version of the whole data frame.
+def extend_dataset_version( key, df_new ):
+    content, length = key.split( '-' )
+    row_hashes      = pd.util.hash_pandas_object( df_new, index = True ).to_numpy()
+    content         = ( int( content, 16 ) + int( row_hashes.sum( dtype = 'uint64' ) ) ) % ( 1 << 64 )
+    return format( content, '016x' ) + '-' + str( int( length ) + len( df_new ) )
+
+# Processed data frames held on the server and fetched by version key.
+# The browser only keeps the key (in dcc.Store), never the rows.
+# Data frames put with 'pinned' (e.g. the current full dataset) are kept
+# outside the LRU, so any number of other versions cannot evict them.
+# If 'directory' is given, data frames are also pickled there, so that
+# other worker processes (and restarts) can load them.
+class DatasetCache:
+    def __init__( self, max_entries = 4, directory = None ):
+        self.memory    = LRUCache( max_entries )
+        self.pinned    = {}
+        self.directory = directory
+        if directory is not None: os.makedirs( directory, exist_ok = True )
+
+    def path( self, key ):
+        return os.path.join( self.directory, 'dataset-' + key + '.pkl' )
+
+    # Register a data frame and return its version key
+    def put( self, df, key = None, pinned = False ):
+        if key is None: key = dataset_version( df )
+        if pinned: self.pinned[ key ] = df
+        else:      self.memory.put( key, df )
+        if self.directory is not None and not os.path.exists( self.path( key ) ):
+            temporary_path = self.path( key ) + '.tmp'
+            df.to_pickle( temporary_path )
+            os.replace( temporary_path, self.path( key ) )
+        return key
+
+    # Fetch the data frame of the version key, or None if unknown.
+    # The key comes from the browser, so it must not point outside the directory
+    def get( self, key ):
+        if not isinstance( key, str ) or os.path.basename( key ) != key: return None
+        df = self.pinned.get( key )
+        if df is not None: return df
+        df = self.memory.get( key )
+        if df is None and self.directory is not None and os.path.exists( self.path( key ) ):
+            df = pd.read_pickle( self.path( key ) )
+            self.memory.put( key, df )
+        return df
+
+    # Move a pinned data frame to the LRU (e.g. an older version of the full
+    # dataset, still shown by some pages until it is evicted)
+    def unpin( self, key ):
+        df = self.pinned.pop( key, None )
+        if df is not None: self.memory.put( key, df )
@@ -6,21 +6,74 @@
 import pandas as pd 
 import numpy as np
 import os
+import sys
 import dash
 from   dash import Dash, dash_table, html, dcc
 import dash_bootstrap_components as dbc
 import plotly.express as px
 from   datetime import datetime as dt 
 from   geopy.geocoders import Nominatim
-from   dash.dependencies import Input, Output
+from   dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
 from   plotly.subplots import make_subplots
 import warnings
 import dash_cytoscape as cyto
 import json
+import copy
+import threading
+from   collections import deque
+from   dash import Patch
+
+# Import ledger utils
+from ledger_util import read_ledgers, list_ledger_files, SOURCE_COLUMN
+
+# Import live mode utils
+from live_util import LedgerTail, ChunkedFrame, LIVE_POLL_INTERVAL
+
+# Import geocoding utils
+from geocode_util import Gazetteer, GeocodeCache, geocode_locations
+
+# Import cache utils
+from cache_util import DatasetCache, LRUCache, dataset_version, extend_dataset_version
+
+# Import graph utils
+from graph_util import GraphIndex, GrowingArray, compute_layered_layout, layout_layer_ends, extend_layered_layout, set_node_positions, LAYOUT_Y_SPACING
+
+# Import filter utils
+from filter_util import build_node_table
+
+# Import treemap utils
+from treemap_util import build_treemap_cube, build_treemap_trace, merge_treemap_cubes
+
+# Import ledger integrity utils
+from integrity_util import check_ledger_integrity, summarise_integrity_report
+
+# Import alert utils
+from alert_util import compute_product_alerts, merge_product_alerts, products_failing, expired_product_locations, all_products_in_date
+
+# Import FTIR spectra utils
+from spectra_util import load_spectra, downsample_minmax, SpectraTail, SPECTRA_MAX_POINTS, SPECTRA_CACHE_DIRECTORY
+
+# Import PCA utils
+from pca_util import randomized_pca, PCA_COMPONENTS
+
+# Import spectra preprocessing utils
+from preprocess_util import PreprocessingPipeline, PreprocessedSpectraCache
+
+# Import similarity search utils
+from similarity_util import SimilarityIndex
+
+# Import spectra anomaly detection utils
+from anomaly_util import AnomalyMonitor, ANOMALY_CONFIDENCE
+
+# Import microbial model utils
+from model_util import read_sample_table, join_samples, log_counts, train_models, MICRO_TARGETS, MODEL_METHODS
+
+# Import linked experiment utils
+from experiment_util import ExperimentLinkIndex, ExperimentLoader
 
 # Import networkgraph utils
-from networkgraph_util import create_networkgraph_inputdata, get_nodes, set_node_colours, get_edges, set_networkgraph_default_stylesheet, set_networkgraph_tab_layout, setFilterCondition
+from networkgraph_util import create_networkgraph_inputdata, value_range, get_nodes, CategoryColourRegistry, set_node_colours, get_edges, set_networkgraph_default_stylesheet, set_networkgraph_stylesheet, set_networkgraph_tab_layout
 
 #Opening the file containing the access token for MapBox
 mapbox_access_token = open("token.txt").read()
@@ -29,302 +82,713 @@ mapbox_access_token = open("token.txt").read()
 def show_content(content):
     print(content) 
 
+# Ledger files, or directories of ledger files, to load. They can be given
+# on the command line: python dashboard_v3.1.py ./testdata/tx_monitor_beef.json.txt ./ledgers
+# With --live, the ledgers are polled for new events (see apply_live_update)
+LEDGER_PATHS = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or ['./testdata']
+LIVE_MODE = '--live' in sys.argv
+
+# FTIR spectra shown in the 'FTIR spectra' tab, and microbial counts of the same samples
+SPECTRA_PATH = './testdata/FTIR_Air.csv'
+MICRO_PATH = './testdata/micro_Air.csv'
+
+# New FTIR spectra appended by the spectrometer, scored against the PCA model
+SPECTRA_INCOMING_PATH = './testdata/FTIR_incoming.csv'
+
 # Opening data and save it in pandas dataframe
-with open('./testdata/tx_monitor_milk_V2.json.txt') as file:
-        data_json = json.load(file)
-        # Pick up 'txHistory' object
-        data_txhistory = data_json['txHistory']
-
-        # Convert it into data frame
-        df_txhistory = pd.json_normalize(data_txhistory,
-            meta = [
-                'ProductID',
-                'PreviousProductID',
-                'RootProductID',
-                'Owner',
-                'ProductName',
-                'ProductType',
-                'Location',
-                'Weight',
-                'Temperature',
-                'UseByDate',
-                'AssetStatus',
-                'TransferFrom',
-                'TransferTo',
-                'TransferWeight',
-                'EventTimestamp',
-                'EventBy',
-                'LinkedExperiments',
-                'Hash',
-                'PreviousHash'
-            ]
-        )
-        df_txhistory = df_txhistory.drop(
-            [
-                'LinkedExperiments',
-                'Hash',
-                'PreviousHash',
-                'TransferFrom',
-                'TransferTo',
-                'TransferWeight',
-                'EventTimestamp'
-            ],
-            axis=1
-        )
-        df_txhistory = df_txhistory.iloc[::-1]
-        df_txhistory.drop(df_txhistory[(df_txhistory['AssetStatus']=='Edited') | (df_txhistory['AssetStatus']=='Requested')].index, axis=0, inplace=True)
+# Each ledger is streamed record by record in a worker process: only the columns
+# used by the dashboard are parsed, and 'Edited'/'Requested' events are skipped on
+# the way. The ledgers are merged, with the ledger of every row in the 'source' column.
+# Worker processes which re-import this script (spawn and forkserver start methods)
+# read serially instead of starting a pool of their own (see in_worker_process)
+df_txhistory, data_networkgraph = read_ledgers(LEDGER_PATHS)
+ledger_sources = df_txhistory[SOURCE_COLUMN].cat.categories.tolist()
+print('Loaded ledgers:', ', '.join(ledger_sources))
 
-        # It should be dynamic!!! Will be changed later on!!! It should be dynamic!!! Will be changed later on !!! It should be dynamic!!!
-        df_txhistory['EventTimestamp'] = ['2024-02-05','2024-02-08','2024-02-10','2024-02-11','2024-02-12','2024-02-13','2024-02-14']
-        # It should be dynamic!!! Will be changed later on!!! It should be dynamic!!! Will be changed later on !!! It should be dynamic!!!
+# Event times come from the ledger (UTC); the treemap groups events by day
+df_txhistory['EventTimestamp'] = pd.to_datetime(df_txhistory['EventTimestamp'], utc=True, errors='coerce').dt.tz_localize(None)
+df_txhistory['EventDate'] = df_txhistory['EventTimestamp'].dt.strftime('%Y-%m-%d')
 
-        #print(df_txhistory['AssetStatus'])
-        # Convert location names to latitude and longitude coordinates
-        geolocator = Nominatim( user_agent = 'sorfML_dashboard' )
-        df_txhistory['location' ] = df_txhistory['Location'].apply(lambda x: geolocator.geocode( x )   )
-        df_txhistory['Latitude' ] = df_txhistory['location'].apply(lambda x: x.latitude  if x else None)
-        df_txhistory['Longitude'] = df_txhistory['location'].apply(lambda x: x.longitude if x else None)
+#print(df_txhistory['AssetStatus'])
+# Convert location names to latitude and longitude coordinates
+# Each distinct location is looked up once: the bundled gazetteer is tried first,
+# and only unknown names go to Nominatim, whose results are kept in an on-disk cache
+gazetteer = Gazetteer.from_csv()
+geolocator = Nominatim( user_agent = 'sorfML_dashboard' )
+geocode_cache = GeocodeCache()
+df_txhistory[['Latitude', 'Longitude']] = geocode_locations(df_txhistory['Location'], geolocator, geocode_cache, gazetteer)
 
-        # Drop unnecessary columns
-        df_txhistory = df_txhistory.drop(['location'], axis=1)
+# Modified by Shintaro Kinoshita:
+# Then, create another input data for network graph
+# ('branches' records were collected by read_ledger above)
+# Pre-process the data for network graph visualisation
+data_networkgraph = create_networkgraph_inputdata(data_networkgraph)
+networkgraph_weight_range = value_range(data_networkgraph['WeightInteger'])
+print('Fetched network graph data')
+#print(data_networkgraph)
 
-        df_txhistory['Temperature'] = pd.to_numeric( df_txhistory['Temperature'], errors='coerce')
+# Extract network grapgh nodes info
+data_nodes = get_nodes(data_networkgraph)
+print('Extracted network graph nodes')
+#print(data_nodes)
 
-        df_txhistory['Weight'] = pd.to_numeric(df_txhistory['Weight'], errors='coerce')
+# Get node colours
+node_colour_registry = CategoryColourRegistry()
+data_nodes = set_node_colours(data_nodes, node_colour_registry)
+print('Set node colours')
+#print(data_nodes)
 
-        # Modified by Shintaro Kinoshita:
-        # Then, create another input data for network graph
-        data_networkgraph = data_json['branches']
+# Get edges info
+data_edges = get_edges(data_networkgraph)
+print('Get edge info')
+#print(data_edges)
 
-        # Pre-process the data for network graph visualisation
-        data_networkgraph = create_networkgraph_inputdata(data_networkgraph)
-        print('Fetched network graph data')
-        #print(data_networkgraph)
+# Validate the hash chain before it is indexed and laid out
+integrity_report = check_ledger_integrity(data_networkgraph)
+print(summarise_integrity_report(integrity_report))
 
-        # Extract network grapgh nodes info
-        data_nodes = get_nodes(data_networkgraph)
-        print('Extracted network graph nodes')
-        #print(data_nodes)
+# Build the lineage index of the hash chain (block id = position in data_nodes)
+networkgraph_index = GraphIndex(
+    data_networkgraph['Hash'],
+    data_networkgraph['PreviousHash'],
+    root_product_ids     = data_networkgraph['RootProductID'],
+    product_ids          = data_networkgraph['ProductID'],
+    previous_product_ids = data_networkgraph['PreviousProductID'],
+    source_ids           = data_networkgraph[SOURCE_COLUMN]
+)
+print('Built network graph index')
 
-        # Get node colours
-        data_nodes = set_node_colours(data_nodes)
-        print('Set node colours')
-        #print(data_nodes)
+# Branch rows of the blocks, extended in live mode (see ChunkedFrame)
+networkgraph_branches = ChunkedFrame([data_networkgraph])
 
-        # Get edges info
-        data_edges = get_edges(data_networkgraph)
-        print('Get edge info')
-        #print(data_edges)
+# Samples linked to every block ('LinkedExperiments'), numbered like the index
+experiment_links = ExperimentLinkIndex(data_networkgraph['LinkedExperiments'])
+print('Indexed linked experiments of', experiment_links.linked_blocks(), 'blocks')
 
-        # Get network graph default style sheet
-        networkgraph_stylesheet = set_networkgraph_default_stylesheet()
-        print('Fetched default network graph style sheet')
-        #print(networkgraph_stylesheet)
+# Compute the layered layout once on the server and send it as preset positions
+networkgraph_x, networkgraph_y = compute_layered_layout(networkgraph_index)
+networkgraph_layer_ends = layout_layer_ends(networkgraph_x, networkgraph_y)
+data_nodes = set_node_positions(data_nodes, networkgraph_x, networkgraph_y)
+networkgraph_x, networkgraph_y = GrowingArray(networkgraph_x, float), GrowingArray(networkgraph_y, float)
+print('Computed network graph layout')
 
-        # Get netwok graph tab app page style
-        networkgraph_tab_layout = set_networkgraph_tab_layout()
-        print('Fetched network graph tab layout')
-        print(networkgraph_tab_layout)
+# Large graphs are not sent at once: the tab starts with an overview (the
+# neighbourhood of the root blocks) and subgraphs are loaded on demand
+NETWORKGRAPH_MAX_NODES = 500
+NETWORKGRAPH_DEFAULT_HOPS = 3
 
-def is_constant_temperature(product):
-    unique_temperatures = df_txhistory['Temperature'].unique()
-    if len(unique_temperatures) == 1:
-        return True
+def get_subgraph_elements(block_ids):
+    return networkgraph_index.edges(block_ids) + [data_nodes[block_id] for block_id in block_ids.tolist()]
+
+# Overview of some blocks: all of them if they are few enough, otherwise
+# the neighbourhood of their root blocks
+def get_overview_block_ids(block_ids):
+    if len(block_ids) <= NETWORKGRAPH_MAX_NODES: return block_ids
+    root_block_ids = block_ids[networkgraph_index.parents[block_ids] < 0]
+    return networkgraph_index.neighbourhood(root_block_ids, NETWORKGRAPH_DEFAULT_HOPS, NETWORKGRAPH_MAX_NODES)
+
+def get_overview_elements(block_ids):
+    return get_subgraph_elements(get_overview_block_ids(block_ids))
+
+networkgraph_overview_ids = get_overview_block_ids(np.arange(len(networkgraph_index)))
+networkgraph_overview_elements = get_subgraph_elements(networkgraph_overview_ids)
+
+# Add new blocks (live mode) to the overview of all the blocks, from the
+# new blocks only: while the overview holds every block, all of them, and
+# then those within NETWORKGRAPH_DEFAULT_HOPS layers of a root block (the
+# neighbourhood of the roots) while there is room. The overview is only
+# rebuilt when the ledger outgrows NETWORKGRAPH_MAX_NODES.
+def extend_overview(new_ids, new_y):
+    global networkgraph_overview_ids, networkgraph_overview_elements
+    if len(networkgraph_index) <= NETWORKGRAPH_MAX_NODES:
+        added = new_ids
+    elif len(networkgraph_index) - len(new_ids) <= NETWORKGRAPH_MAX_NODES:
+        networkgraph_overview_ids = get_overview_block_ids(np.arange(len(networkgraph_index)))
+        networkgraph_overview_elements = get_subgraph_elements(networkgraph_overview_ids)
+        return
     else:
-        return False
+        added = new_ids[new_y <= NETWORKGRAPH_DEFAULT_HOPS * LAYOUT_Y_SPACING][:max(NETWORKGRAPH_MAX_NODES - len(networkgraph_overview_ids), 0)]
+    if len(added) == 0: return
+    networkgraph_overview_ids = np.concatenate([networkgraph_overview_ids, added])
+    parents = networkgraph_index.parents[added]
+    linked = added[(parents >= 0) & np.isin(parents, networkgraph_overview_ids)]
+    edges = [{'data': {'source': source, 'target': target}} for source, target in zip(networkgraph_index.previous_hashes[linked].tolist(), networkgraph_index.hashes[linked].tolist())]
+    networkgraph_overview_elements = networkgraph_overview_elements + edges + [data_nodes[block_id] for block_id in added.tolist()]
+
+# Overview of the blocks of some ledgers (all of them if none is selected),
+# from the precomputed per-source block lists of the index
+def get_source_overview_elements(sources):
+    if not sources: return networkgraph_overview_elements
+    block_ids = np.sort(np.concatenate([networkgraph_index.group_blocks(SOURCE_COLUMN, source) for source in sources]))
+    return get_overview_elements(block_ids)
+
+root_product_dropdown = [{'label': str(value), 'value': value} for value in networkgraph_index.group_keys('RootProductID')]
+trace_product_dropdown = [{'label': str(value), 'value': value} for value in networkgraph_index.group_keys('ProductID')]
+
+# Lineage of a product: the blocks from its genesis block to everything
+# made from it, ordered by event time (the order of the path on the map)
+def get_product_trace(product_id):
+    block_ids = networkgraph_index.trace_product(product_id)
+    timestamps = networkgraph_branches.frame()['EventTimestamp'].to_numpy()[block_ids].astype(str)
+    return block_ids[np.argsort(timestamps, kind='stable')]
+
+# Trace option of the network graph stylesheet (see set_networkgraph_stylesheet)
+def get_trace_selection(block_ids):
+    return {
+        'nodes': networkgraph_index.hashes[block_ids].tolist(),
+        'edges': networkgraph_index.edge_pairs(block_ids)
+    }
+
+# Build node attribute table for the highlighting filters
+networkgraph_node_table = ChunkedFrame([build_node_table(data_nodes)])
+owner_dropdown    = node_colour_registry.dropdown_options('owner')
+product_dropdown  = node_colour_registry.dropdown_options('product_name')
+location_dropdown = node_colour_registry.dropdown_options('location')
+print('Built network graph node table')
+
+# Get network graph default style sheet
+# It is never modified: each session derives its own copy (see updateNetworkStylesheet)
+networkgraph_stylesheet = set_networkgraph_default_stylesheet()
+print('Fetched default network graph style sheet')
+#print(networkgraph_stylesheet)
+
+# Get netwok graph tab app page style
+networkgraph_tab_layout = set_networkgraph_tab_layout()
+print('Fetched network graph tab layout')
+print(networkgraph_tab_layout)
+
+# FTIR spectra are memory-mapped from their binary cache (built on the first run)
+spectra = load_spectra(SPECTRA_PATH) if os.path.exists(SPECTRA_PATH) else None
+if spectra is not None: print('Loaded FTIR spectra:', len(spectra), 'spectra of', len(spectra.wavenumbers), 'wavenumbers')
+
+# Microbial counts joined to the spectra by sample id (replicate spectra share their counts)
+micro_table = read_sample_table(MICRO_PATH) if spectra is not None and os.path.exists(MICRO_PATH) else None
+if micro_table is not None:
+    micro_key = 'micro-' + str(os.stat(MICRO_PATH).st_mtime_ns)
+    micro_spectrum_rows, micro_table_rows = join_samples(spectra.samples, micro_table)
+    print('Joined microbial counts to', len(micro_spectrum_rows), 'spectra')
+
+# Spectra and counts of the linked experiments, loaded when a node is inspected
+experiment_loader = ExperimentLoader(spectra, micro_table)
 
-products_with_inconstant_temperature = [product for product in df_txhistory['ProductID'].unique() if not is_constant_temperature(product)]
+# Compute expiry and temperature/weight variability of every product in one grouped pass
+# (as of startup; the alerts of the panels are recomputed per day, see get_dataset_alerts)
+product_alerts = compute_product_alerts(df_txhistory, dt.now().date())
+
+def is_constant_temperature(product):
+    return bool(product_alerts.loc[product, 'TemperatureConstant'])
+
+products_with_inconstant_temperature = products_failing(product_alerts, 'TemperatureConstant')
 
 def is_constant_weight(product):
-    unique_weights = df_txhistory['Weight'].unique()
-    if len(unique_weights) == 1:
-        return True
-    else:
-        return False
+    return bool(product_alerts.loc[product, 'WeightConstant'])
 
-products_with_inconstant_weight = [product for product in df_txhistory['ProductID'].unique() if not is_constant_weight(product)]
+products_with_inconstant_weight = products_failing(product_alerts, 'WeightConstant')
 
-current_date = dt.now().date()
-expired_products = [product for product in df_txhistory['ProductID'].unique() if pd.to_datetime(df_txhistory[df_txhistory['ProductID'] == product]['UseByDate'].iloc[0]).date() <= current_date]
+expired_products = product_alerts.index[product_alerts['Expired']].tolist()
 
-expired_products_locations = [
-        (product, df_txhistory[df_txhistory['ProductID'] == product]['Location'].iloc[0]) 
-        for product in df_txhistory['ProductID'].unique() 
-        if pd.to_datetime(df_txhistory[df_txhistory['ProductID'] == product]['UseByDate'].iloc[0]).date() <= current_date
-    ]
+expired_products_locations = expired_product_locations(product_alerts)
 
 # Convert each tuple to a string and join them together
 expired_products_locations_str = [f"('{prod}', '{loc}')" for prod, loc in expired_products_locations]
 
+# Hold the processed data frame on the server; the page only carries its version key.
+# Each ledger is also held as its own dataset (a precomputed slice), so narrowing
+# the panels to some ledgers only changes the key in the store. The full dataset
+# is pinned; slices live in the LRU and are rebuilt when they have been evicted
+dataset_cache = DatasetCache(max_entries = 2 * len(ledger_sources) + 4)
+dataset_rows = ChunkedFrame([df_txhistory])  # Extended in live mode
+dataset_key = dataset_cache.put(dataset_rows, key = dataset_version(df_txhistory), pinned = True)
+source_rows = {source: GrowingArray(rows, np.int64) for source, rows in df_txhistory.groupby(SOURCE_COLUMN, observed=True).indices.items()}
+source_dataset_keys = LRUCache(max_entries = 64)
+dataset_sources = LRUCache(max_entries = 256)  # Ledgers of every slice key, to rebuild evicted slices
+
+# Version key of the dataset narrowed to some ledgers
+def get_source_dataset_key(sources):
+    sources = tuple(source for source in ledger_sources if source in (sources or []))
+    if len(sources) == 0 or len(sources) == len(ledger_sources): return dataset_key
+    key = source_dataset_keys.get(sources)
+    if key is None or key not in dataset_cache.memory:
+        rows = np.sort(np.concatenate([source_rows[source].values() if source in source_rows else np.zeros(0, dtype=np.int64) for source in sources]))
+        key = dataset_cache.put(dataset_rows.frame().iloc[rows].reset_index(drop=True))
+        source_dataset_keys.put(sources, key)
+        dataset_sources.put(key, sources)
+    return key
+
+# Data frame of a version key (from the store), or None if the key is
+# unknown. A slice evicted from the cache is rebuilt from its ledgers, and
+# the chunks of the full dataset are concatenated when it is first read
+def get_dataset(data):
+    df_txhistory = dataset_cache.get(data)
+    sources = dataset_sources.get(data) if isinstance(data, str) else None
+    if df_txhistory is None and sources is not None: df_txhistory = dataset_cache.get(get_source_dataset_key(sources))
+    if isinstance(df_txhistory, ChunkedFrame): df_txhistory = df_txhistory.frame()
+    return df_txhistory
+
+for source in ledger_sources: get_source_dataset_key([source])
+
 #Initialise a dash app
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP], suppress_callback_exceptions=True)
 
-app.layout = dbc.Container(
-    [
-        dcc.Store(id = 'store', data = df_txhistory.to_dict('records')),  # Store DataFrame as a list of dictionaries
-        html.H1('Supply Chain Insight Dashboard',
-            id    = 'dashboard_title',
-            style = {
-                'color'       : 'white',
-                'font-family' : 'Arial, sans-serif',
-                'text-align'  : 'center',
-                'font-size'   : '250%',
-                'font-weight' : 'bold',
-                'text-shadow' : '-1px -1px 0 black, 1px -1px 0 black, -1px 1px 0 black, 1px 1px 0 black'
-            },
-        ),
-        html.Hr(),
-        #html.Div('Navigate Between Tabs To Explore Your Products Parameters', style={'color': 'white'}),
-        dbc.Alert(
-            f"Warning: Temperature values for the following products are not constant: {', '.join(products_with_inconstant_temperature)}",
-            id          = 'alert_temperature',
-            color       = 'danger',
-            dismissable = True,
-            is_open     = False,
-            duration=20000 
-        ),
-        dbc.Alert(
-            f"Warning: Weight values for the following products are not constant: {', '.join(products_with_inconstant_weight)}",
-            id          = 'alert_weight',
-            color       = 'danger',
-            dismissable = True,
-            is_open     = False,
-            duration=20000
-        ),
-        dbc.Alert(
-            f"Warning: The following products have expired:{', '.join(expired_products_locations_str)}",
-            id          = 'alert_expired',
-            color       = 'danger',
-            dismissable = True,
-            is_open     = False,
-            duration=20000
-        ),
-        dbc.Alert(
-            'No products have expired yet!',
-            id          = 'alert_not_expired',
-            color       = 'success',
-            dismissable = True,
-            is_open     = False,
-            duration=20000
+# The layout is built for every page load, so that a page opened in live
+# mode starts from the current dataset
+def serve_layout():
+    alert_messages = get_alert_messages(get_dataset_alerts(dataset_key))
+    return dbc.Container(
+        [
+            dcc.Store(id = 'store', data = dataset_key),  # Store the dataset version key (the DataFrame stays in dataset_cache)
+            dcc.Store(id = 'live-store', data = {'from': live_version, 'to': live_version}),  # Live updates already shown by this page
+            dcc.Store(id = 'preprocessing-store', data = []),  # Preprocessing stages of the spectra analyses (set in 'tab4')
+            dcc.Interval(id = 'live-interval', interval = LIVE_POLL_INTERVAL, disabled = not LIVE_MODE),
+            html.H1('Supply Chain Insight Dashboard',
+                id    = 'dashboard_title',
+                style = {
+                    'color'       : 'white',
+                    'font-family' : 'Arial, sans-serif',
+                    'text-align'  : 'center',
+                    'font-size'   : '250%',
+                    'font-weight' : 'bold',
+                    'text-shadow' : '-1px -1px 0 black, 1px -1px 0 black, -1px 1px 0 black, 1px 1px 0 black'
+                },
+            ),
+            html.Hr(),
+            #html.Div('Navigate Between Tabs To Explore Your Products Parameters', style={'color': 'white'}),
+            dbc.Alert(
+                alert_messages[0],
+                id          = 'alert_temperature',
+                color       = 'danger',
+                dismissable = True,
+                is_open     = False,
+                duration=20000 
+            ),
+            dbc.Alert(
+                alert_messages[1],
+                id          = 'alert_weight',
+                color       = 'danger',
+                dismissable = True,
+                is_open     = False,
+                duration=20000
+            ),
+            dbc.Alert(
+                alert_messages[2],
+                id          = 'alert_expired',
+                color       = 'danger',
+                dismissable = True,
+                is_open     = False,
+                duration=20000
+            ),
+            dbc.Alert(
+                summarise_integrity_report(integrity_report) + ' Full report: /integrity-report',
+                id          = 'alert_integrity',
+                color       = 'warning',
+                dismissable = True,
+                is_open     = False,
+                duration=20000
+            ),
+            dbc.Alert(
+                get_spectra_alert_message(),
+                id          = 'alert_spectra',
+                color       = 'danger',
+                dismissable = True,
+                is_open     = False,
+                duration=20000
+            ),
+            dbc.Alert(
+                'No products have expired yet!',
+                id          = 'alert_not_expired',
+                color       = 'success',
+                dismissable = True,
+                is_open     = False,
+                duration=20000
+            ),
+            #html.Div('Naviguate Between Tabs To Explore Your Products Parameters', style={'color': 'white'}),
+            dcc.Dropdown(
+                id          = 'source-dropdown',
+                options     = [{'label': source, 'value': source} for source in ledger_sources],
+                multi       = True,
+                placeholder = 'All ledgers',
+                style       = {'backgroundColor': '#adb5bd', 'color': '#374257', 'font-family': 'Calibri, sans-serif', 'margin-bottom': '10px'}
+            ),
+            dbc.Tabs(
+                [
+                    dbc.Tab(label = 'Main panels',   tab_id = 'tab1', label_style = {'color': 'black'}),
+                    dbc.Tab(label = 'Network graph', tab_id = 'tab2', label_style = {'color': 'black'}),
+                    dbc.Tab(label = 'FTIR spectra',  tab_id = 'tab3', label_style = {'color': 'black'}),
+                    dbc.Tab(label = 'Spectra PCA',   tab_id = 'tab4', label_style = {'color': 'black'}),
+                    dbc.Tab(label = 'Microbial models', tab_id = 'tab5', label_style = {'color': 'black'}),
+                ],
+                id         = 'main-tabs',
+                active_tab = 'tab1',
+                style      = {}
+            ),
+            html.Div(id = 'main-tab-content', className = 'p-4'),
+
+        ],
+        id    = 'main_container',
+        fluid = True,
+        style = {'backgroundColor': '#6c757d'}
+    )
+
+app.layout = serve_layout
+
+# Figures of the Main panels tab are built once per dataset version and
+# figure kind, then served from figure_cache (see render_main_content)
+figure_cache = LRUCache(max_entries = 64)
+
+# Product alerts of a dataset version, or None if the version is unknown.
+# The 'Expired' flags depend on the date, which is part of the cache key, so
+# a long-running server recomputes the table after midnight
+def get_dataset_alerts(data, current_date = None):
+    if current_date is None: current_date = dt.now().date()
+    df_txhistory = get_dataset(data)
+    if df_txhistory is None: return None
+    return figure_cache.get_or_create((data, 'alerts', (current_date,)), lambda: compute_product_alerts(df_txhistory, current_date))
+
+# Texts of the temperature, weight and expiry alerts (empty without alerts,
+# e.g. for an unknown dataset version)
+def get_alert_messages(alerts):
+    if alerts is None: return '', '', ''
+    locations = [f"('{prod}', '{loc}')" for prod, loc in expired_product_locations(alerts)]
+    return (
+        f"Warning: Temperature values for the following products are not constant: {', '.join(products_failing(alerts, 'TemperatureConstant'))}",
+        f"Warning: Weight values for the following products are not constant: {', '.join(products_failing(alerts, 'WeightConstant'))}",
+        f"Warning: The following products have expired:{', '.join(locations)}"
+    )
+
+# Columns shown when hovering the line charts (their 'customdata')
+LINE_HOVER_DATA = ['ProductID', 'Owner', 'ProductName', 'Location']
+
+# Colour the lines by ledger when several ledgers are shown
+def get_line_colour(df_txhistory):
+    return SOURCE_COLUMN if df_txhistory[SOURCE_COLUMN].nunique() > 1 else None
+
+# Hover text of the event locations on the map
+def get_map_hover_text(df_txhistory):
+    return (
+    "Owner Name: " + df_txhistory['Owner'] + "<br>" +
+    "Product Name: " + df_txhistory['ProductName'] + "<br>" +
+    "Location: " + df_txhistory['Location']
+    )
+
+# Build the map of event locations as a figure dict
+def build_map_figure(df_txhistory):
+    hover_text = get_map_hover_text(df_txhistory)
+    
+    # Create the map with the center at the mean latitude and longitude
+    fig = go.Figure(go.Scattermapbox(
+        lat=df_txhistory['Latitude'],
+        lon=df_txhistory['Longitude'],
+        mode='markers+lines',
+        marker=go.scattermapbox.Marker(
+            size=10, symbol="circle",
         ),
-        #html.Div('Naviguate Between Tabs To Explore Your Products Parameters', style={'color': 'white'}),
-        dbc.Tabs(
-            [
-                dbc.Tab(label = 'Main panels',   tab_id = 'tab1', label_style = {'color': 'black'}),
-                dbc.Tab(label = 'Network graph', tab_id = 'tab2', label_style = {'color': 'black'}),
-            ],
-            id         = 'main-tabs',
-            active_tab = 'tab1',
-            style      = {}
+        text=hover_text
+    ))
+    fig.update_layout(
+    autosize=True,
+    hovermode='closest',
+    margin=dict(l=20, r=20, t=20, b=20),
+    paper_bgcolor='#adb5bd',
+    mapbox=dict(
+        accesstoken=mapbox_access_token,
+        bearing=0,
+        center=dict(
+            lat=df_txhistory['Latitude'].iloc[0],
+            lon=df_txhistory['Longitude'].iloc[0]
         ),
-        html.Div(id = 'main-tab-content', className = 'p-4'),
+        pitch=0,
+        zoom=3, 
+        style='outdoors'
+    ),
+    )
+    return fig.to_dict()
 
-    ],
-    id    = 'main_container',
-    fluid = True,
-    style = {'backgroundColor': '#6c757d'}
-)
+# Build the temperature line chart as a figure dict
+def build_temperature_figure(df_txhistory):
+    #To display line graph for Temperature 
+    fig_line = px.line(
+        df_txhistory,
+        x          = 'EventTimestamp',
+        y          = 'Temperature',
+        color      = get_line_colour(df_txhistory),
+        hover_data = LINE_HOVER_DATA,
+        category_orders = {SOURCE_COLUMN: ledger_sources},
+        labels     = {'EventTimestamp':'Transfers Dates', 'Temperature':'Temperatures'}
+    )
+    # Note note note blah blah blah blah 
+    fig_line.update_layout(
+        title_x       = 0.5,
+        title_text    = 'Products Temperatures across the Supply Chain',
+        title_font    = dict(size=20),
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig_line.to_dict()
+
+# Build the weight line chart as a figure dict
+def build_weight_figure(df_txhistory):
+    # To display bar chart for Weight
+    fig_line2 = px.line(
+        df_txhistory,
+        x          = 'EventTimestamp',
+        y          = 'Weight',
+        color      = get_line_colour(df_txhistory),
+        hover_data = LINE_HOVER_DATA,
+        category_orders = {SOURCE_COLUMN: ledger_sources},
+        labels     = {'EventTimestamp':'Transfers Dates', 'Weight':'Weights'}
+    )
+    # Note note note blah blah blah
+    fig_line2.update_layout(
+        title_x       = 0.5,
+        title_text    = 'Products Weights across the Supply Chain',
+        title_font    = dict(size=20),
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig_line2.to_dict()
+
+# Build the treemap dropdown and graph container
+def build_treemap_tab_layout():
+    # To Display Treemap chart
+    treemap_tab_layout = html.Div([
+            dcc.Dropdown(
+                id     = 'treemap-dropdown',
+                options = [
+                    {'label':html.Span(['Temperature'], style={'color':'#374257','font-family':'Calibri, sans-serif'}), 'value': 'Temperature'},
+                    {'label':html.Span(['Weight'], style={'color':'#374257','font-family':'Calibri, sans-serif'}), 'value': 'Weight'}
+                ],
+                value     = 'Weight',
+                clearable = False,
+                style     = {'backgroundColor': '#adb5bd','color':'#374257', 'font-family':'Calibri, sans-serif'}
+            ),
+        dcc.Graph(id='treemap-chart')
+    ])
+    return treemap_tab_layout
+
+# Spectra drawn at once when no sample is selected
+SPECTRA_MAX_TRACES = 200
+
+# Wavenumber window of a zoom ( relayoutData of the spectra chart ): ( low, high ),
+# ( None, None ) for the whole axis, or None if the x axis did not change
+def get_spectra_window(relayout_data):
+    if not relayout_data or relayout_data.get('xaxis.autorange'): return None, None
+    if 'xaxis.range[0]' in relayout_data:
+        bounds = [relayout_data['xaxis.range[0]'], relayout_data['xaxis.range[1]']]
+    elif 'xaxis.range' in relayout_data:
+        bounds = relayout_data['xaxis.range']
+    else:
+        return None
+    return min(bounds), max(bounds)
+
+# Build the FTIR spectra chart of some samples over a wavenumber window.
+# Every spectrum is cut to the window and decimated (see downsample_minmax),
+# so the figure size does not depend on the resolution of the spectra
+def build_spectra_figure(samples, low, high):
+    if samples: rows = np.concatenate([spectra.rows(sample) for sample in samples])
+    else:       rows = np.arange(min(len(spectra), SPECTRA_MAX_TRACES))
+    columns = spectra.column_range(low, high)
+    x, y = downsample_minmax(spectra.wavenumbers[columns], spectra.matrix[rows, columns], SPECTRA_MAX_POINTS)
+
+    fig = go.Figure()
+    shown = set()
+    for row, row_x, row_y in zip(rows.tolist(), x, y):
+        sample = spectra.samples[row]
+        fig.add_trace(go.Scattergl(
+            x=row_x, y=row_y, mode='lines', name=str(sample), legendgroup=str(sample),
+            showlegend=sample not in shown, hovertemplate=str(sample) + ' (row ' + str(row) + ')<br>%{x:.1f} cm⁻¹: %{y:.4f}<extra></extra>'
+        ))
+        shown.add(sample)
+    fig.update_layout(
+        title_x       = 0.5,
+        title_text    = 'FTIR Spectra',
+        title_font    = dict(size=20),
+        xaxis         = dict(title='Wavenumber (cm⁻¹)', autorange='reversed' if low is None else False,
+                             range=None if low is None else [high, low]),
+        yaxis_title   = 'Absorbance',
+        uirevision    = 'spectra',
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig.to_dict()
+
+# PCA models and other analyses, built once per dataset version and option set
+analysis_cache = LRUCache(max_entries = 16)
+
+# Preprocessed spectra, kept per stage prefix in memory-mapped files next to
+# the spectra cache: a change of the last preprocessing option only runs the
+# last stage, and the analyses read the preprocessed matrix block by block
+preprocessed_spectra = PreprocessedSpectraCache(os.path.join(SPECTRA_CACHE_DIRECTORY, 'preprocessed'))
+
+# Preprocessed spectra and the fitted pipeline (for new spectra)
+def get_preprocessed(stages):
+    return preprocessed_spectra.get(spectra.key, spectra.matrix, spectra.wavenumbers, stages)
+
+def get_preprocessing(stages):
+    return get_preprocessed(stages)[1]
+
+# Preprocessed values of some rows of the spectra
+def get_preprocessed_rows(stages, rows):
+    return np.asarray(get_preprocessed(stages)[0][np.asarray(rows, dtype=np.int64)])
+
+# PCA of the preprocessed spectra, with the wavenumbers of its loadings
+def get_spectra_pca(stages, scaling):
+    def build_spectra_pca():
+        values, pipeline = get_preprocessed(stages)
+        return randomized_pca(values, PCA_COMPONENTS, scaling), pipeline.wavenumbers
+    return analysis_cache.get_or_create((spectra.key, 'pca', (PreprocessingPipeline(stages).key(), scaling)), build_spectra_pca)
+
+# Matches shown at most by the similarity search
+SIMILARITY_MAX_MATCHES = 20
+
+# Nearest-neighbour index over the preprocessed spectra, or over their PCA
+# scores (a search in PCA_COMPONENTS dimensions). The index over the
+# spectra reads the memory-mapped preprocessed matrix, without a copy
+def get_similarity_index(stages, scaling, metric, space):
+    def build_similarity_index():
+        if space == 'pca': return SimilarityIndex(get_spectra_pca(stages, scaling)[0].scores, metric)
+        return SimilarityIndex(get_preprocessed(stages)[0], metric)
+    options = (PreprocessingPipeline(stages).key(), metric, space, scaling if space == 'pca' else None)
+    return analysis_cache.get_or_create((spectra.key, 'similarity', options), build_similarity_index)
+
+# Build the chart of a query spectrum overlaid with its nearest spectra
+def build_similarity_figure(stages, query_row, rows, distances, metric):
+    shown = [query_row] + rows.tolist()
+    x, y = downsample_minmax(get_preprocessing(stages).wavenumbers, get_preprocessed_rows(stages, shown), SPECTRA_MAX_POINTS)
+    fig = go.Figure([
+        go.Scattergl(x=x[0], y=y[0], mode='lines', line=dict(color='black', width=4),
+                     name='Query: ' + str(spectra.samples[query_row]) + ' (row ' + str(query_row) + ')')
+    ] + [
+        go.Scattergl(x=row_x, y=row_y, mode='lines', line=dict(width=1.5),
+                     name=str(spectra.samples[row]) + ' (row ' + str(row) + '), ' + metric + ' distance ' + str(round(float(distance), 4)))
+        for row, distance, row_x, row_y in zip(rows.tolist(), distances.tolist(), x[1:], y[1:])
+    ])
+    fig.update_layout(
+        title_x       = 0.5,
+        title_text    = 'Most Similar Spectra',
+        title_font    = dict(size=20),
+        xaxis         = dict(title='Wavenumber (cm⁻¹)', autorange='reversed'),
+        yaxis_title   = 'Preprocessed absorbance',
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig.to_dict()
+
+# Models of the log microbial counts, one per target, cross-validated in the
+# process pool shared by all requests (see get_model_pool). Cached per
+# dataset, preprocessing and model option
+def get_microbial_models(stages, method, parameter):
+    def build_microbial_models():
+        return train_models(
+            get_preprocessed_rows(stages, micro_spectrum_rows),
+            log_counts(micro_table[MICRO_TARGETS].to_numpy()[micro_table_rows]),
+            spectra.samples[micro_spectrum_rows],
+            MICRO_TARGETS,
+            method,
+            parameter
+        )
+    options = (PreprocessingPipeline(stages).key(), micro_key, method, parameter)
+    return analysis_cache.get_or_create((spectra.key, 'models', options), build_microbial_models)
+
+# Build the chart of cross-validated against measured log counts of one target
+def build_model_prediction_figure(models, target):
+    measured = log_counts(micro_table[target].to_numpy()[micro_table_rows])
+    predicted = models[target]['predictions']
+    low, high = float(np.nanmin([measured.min(), np.nanmin(predicted)])), float(np.nanmax([measured.max(), np.nanmax(predicted)]))
+    fig = go.Figure([
+        go.Scattergl(x=measured, y=predicted, mode='markers', marker=dict(size=9), text=spectra.samples[micro_spectrum_rows],
+                     hovertemplate='%{text}<br>measured %{x:.2f}, predicted %{y:.2f}<extra></extra>', name='Spectra'),
+        go.Scattergl(x=[low, high], y=[low, high], mode='lines', line=dict(color='black', dash='dash'), name='Ideal')
+    ])
+    fig.update_layout(
+        title_x       = 0.5,
+        title_text    = 'Cross-validated predictions of ' + target,
+        title_font    = dict(size=20),
+        xaxis_title   = 'Measured log10 count',
+        yaxis_title   = 'Predicted log10 count',
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig.to_dict()
+
+# Axis title of a principal component, with its share of the variance
+def get_component_title(model, component):
+    return 'PC' + str(component + 1) + ' (' + str(round(float(model.explained_variance_ratio()[component]) * 100, 1)) + '%)'
+
+# Build the PCA score plot: one point per spectrum, coloured by sample
+def build_pca_scores_figure(model, pc_x, pc_y):
+    sample_codes = spectra.sample_keys.get_indexer(spectra.samples)
+    palette = np.asarray(px.colors.qualitative.Dark24, dtype=object)
+    fig = go.Figure(go.Scattergl(
+        x=model.scores[:, pc_x], y=model.scores[:, pc_y], mode='markers',
+        marker=dict(size=9, color=palette[sample_codes % len(palette)]),
+        text=spectra.samples, customdata=np.arange(len(spectra)),
+        hovertemplate='%{text} (row %{customdata})<extra></extra>'
+    ))
+    fig.update_layout(
+        title_x       = 0.5,
+        title_text    = 'PCA Scores',
+        title_font    = dict(size=20),
+        xaxis_title   = get_component_title(model, pc_x),
+        yaxis_title   = get_component_title(model, pc_y),
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig.to_dict()
+
+# Build the PCA loading plot of two components over the wavenumbers
+def build_pca_loadings_figure(model, wavenumbers, pc_x, pc_y):
+    components = [pc_x] if pc_x == pc_y else [pc_x, pc_y]
+    x, y = downsample_minmax(wavenumbers, model.loadings[components], SPECTRA_MAX_POINTS)
+    fig = go.Figure([
+        go.Scattergl(x=component_x, y=component_y, mode='lines', name=get_component_title(model, component))
+        for component, component_x, component_y in zip(components, x, y)
+    ])
+    fig.update_layout(
+        title_x       = 0.5,
+        title_text    = 'PCA Loadings',
+        title_font    = dict(size=20),
+        xaxis         = dict(title='Wavenumber (cm⁻¹)', autorange='reversed'),
+        yaxis_title   = 'Loading',
+        paper_bgcolor = '#adb5bd',
+        plot_bgcolor  = '#adb5bd'
+    )
+    return fig.to_dict()
 
 # Define callback to render the main content
 @app.callback(
     Output('main-tab-content', 'children'),
-    [Input('store', 'data'), Input('main-tabs', 'active_tab')]
+    [Input('store', 'data'), Input('main-tabs', 'active_tab')],
+    State('source-dropdown', 'value')
 )
-def render_main_content(data, active_tab):
+def render_main_content(data, active_tab, sources):
     if active_tab == 'tab1':
+        # Fetch the DataFrame of the stored version key from the server-side cache
+        df_txhistory = get_dataset(data)
+
         # Return a placeholder message or an empty div if no data is available
-        if data is None : return html.Div('No data available.')
-
-        # Convert the stored data (list of dictionaries) back to a DataFrame
-        df_txhistory = pd.DataFrame(data)
-        hover_text = (
-        "Owner Name: " + df_txhistory['Owner'] + "<br>" +
-        "Product Name: " + df_txhistory['ProductName'] + "<br>" +
-        "Location: " + df_txhistory['Location']
-        )
-        
-        # Create the map with the center at the mean latitude and longitude
-        fig = go.Figure(go.Scattermapbox(
-            lat=df_txhistory['Latitude'],
-            lon=df_txhistory['Longitude'],
-            mode='markers+lines',
-            marker=go.scattermapbox.Marker(
-                size=10, symbol="circle",
-            ),
-            text=hover_text
-        ))
-        fig.update_layout(
-        autosize=True,
-        hovermode='closest',
-        margin=dict(l=20, r=20, t=20, b=20),
-        paper_bgcolor='#adb5bd',
-        mapbox=dict(
-            accesstoken=mapbox_access_token,
-            bearing=0,
-            center=dict(
-                lat=df_txhistory['Latitude'].iloc[0],
-                lon=df_txhistory['Longitude'].iloc[0]
-            ),
-            pitch=0,
-            zoom=3, 
-            style='outdoors'
-        ),
-        )
-        #To display line graph for Temperature 
-        fig_line = px.line(
-            df_txhistory,
-            x          = 'EventTimestamp',
-            y          = 'Temperature',
-            hover_data = ['ProductID','Owner', 'ProductName','Location'],
-            labels     = {'EventTimestamp':'Transfers Dates', 'Temperature':'Temperatures'}
-        )
-        # Note note note blah blah blah blah 
-        fig_line.update_layout(
-            title_x       = 0.5,
-            title_text    = 'Products Temperatures across the Supply Chain',
-            title_font    = dict(size=20),
-            paper_bgcolor = '#adb5bd',
-            plot_bgcolor  = '#adb5bd'
-        )
-        # To display bar chart for Weight
-        fig_line2 = px.line(
-            df_txhistory,
-            x          = 'EventTimestamp',
-            y          = 'Weight',
-            hover_data = ['ProductID', 'Owner', 'ProductName', 'Location'], 
-            labels     = {'EventTimestamp':'Transfers Dates', 'Weight':'Weights'}
-        )
-        # Note note note blah blah blah
-        fig_line2.update_layout(
-            title_x       = 0.5,
-            title_text    = 'Products Weights across the Supply Chain',
-            title_font    = dict(size=20),
-            paper_bgcolor = '#adb5bd',
-            plot_bgcolor  = '#adb5bd'
+        if df_txhistory is None : return html.Div('No data available.')
+
+        # Prebuilt figures are reused across tab switches and users
+        fig = figure_cache.get_or_create((data, 'map', ()), lambda: build_map_figure(df_txhistory))
+        fig_line = figure_cache.get_or_create((data, 'line', ('Temperature',)), lambda: build_temperature_figure(df_txhistory))
+        fig_line2 = figure_cache.get_or_create((data, 'line', ('Weight',)), lambda: build_weight_figure(df_txhistory))
+        treemap_tab_layout = figure_cache.get_or_create((None, 'treemap-layout', ()), build_treemap_tab_layout)
+        trace_map_dropdown = dcc.Dropdown(
+            id          = 'trace-map-dropdown',
+            options     = trace_product_dropdown,
+            placeholder = 'Trace a product on the map',
+            clearable   = True,
+            style       = {'backgroundColor': '#adb5bd','color':'#374257', 'font-family':'Calibri, sans-serif'}
         )
-        # To Display Treemap chart
-        treemap_tab_layout = html.Div([
-                dcc.Dropdown(
-                    id     = 'treemap-dropdown',
-                    options = [
-                        {'label':html.Span(['Temperature'], style={'color':'#374257','font-family':'Calibri, sans-serif'}), 'value': 'Temperature'},
-                        {'label':html.Span(['Weight'], style={'color':'#374257','font-family':'Calibri, sans-serif'}), 'value': 'Weight'}
-                    ],
-                    value     = 'Weight',
-                    clearable = False,
-                    style     = {'backgroundColor': '#adb5bd','color':'#374257', 'font-family':'Calibri, sans-serif'}
-                ),
-            dcc.Graph(id='treemap-chart')
-        ])
 
         return html.Div([
             dbc.Row([
-                dbc.Col(dcc.Graph(figure=fig), width=6),
-                dbc.Col(dcc.Graph(figure=fig_line), width=6)
+                dbc.Col(html.Div([trace_map_dropdown, dcc.Graph(id='map-chart', figure=fig)]), width=6),
+                dbc.Col(dcc.Graph(id='temperature-chart', figure=fig_line), width=6)
             ],className='mb-3'), 
             dbc.Row([
                 dbc.Col(treemap_tab_layout, width=6),
-                dbc.Col(dcc.Graph(figure=fig_line2), width=6)
+                dbc.Col(dcc.Graph(id='weight-chart', figure=fig_line2), width=6)
             ])
         ])
 
@@ -335,8 +799,8 @@ def render_main_content(data, active_tab):
         html.Div(
             cyto.Cytoscape(
             id         = 'network-gragh',
-            layout     = { 'name' : 'breadthfirst', 'roots' : '[ previous_hash *= "GenesisBlock" ]' },
-            elements   = data_edges + data_nodes,
+            layout     = { 'name' : 'preset', 'fit' : True },  # Positions are computed on the server
+            elements   = figure_cache.get_or_create((None, 'network-overview', (live_version,) + tuple(sources or ())), lambda: get_source_overview_elements(sources)),
             stylesheet = networkgraph_stylesheet,
             style      = networkgraph_tab_layout[ 'networkgraph-plot' ]
             )
@@ -413,29 +877,93 @@ def render_main_content(data, active_tab):
                         style       = networkgraph_tab_layout[ 'number-input' ]
                     )
                 ),
+                # Root product dropdown: load the blocks of one root product
+                html.P( 'Root product', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Dropdown(
+                        id        = 'rootproduct-dropdown',
+                        options   = root_product_dropdown,
+                        clearable = True,
+                        style     = networkgraph_tab_layout[ 'dropdown' ]
+                    )
+                ),
+                # Trace a product: load and outline its whole lineage path
+                html.P( 'Trace product', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Dropdown(
+                        id        = 'traceproduct-dropdown',
+                        options   = trace_product_dropdown,
+                        clearable = True,
+                        style     = networkgraph_tab_layout[ 'dropdown' ]
+                    )
+                ),
+                # Number of steps loaded around a tapped node
+                html.P( 'Neighbourhood (hops)', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Input(
+                        id          = 'hops-input',
+                        type        = 'number',
+                        min         = 1,
+                        value       = NETWORKGRAPH_DEFAULT_HOPS,
+                        style       = networkgraph_tab_layout[ 'number-input' ]
+                    )
+                ),
                 # Owner organisation filter dropdown
-                #html.P( 'Owner filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
-                #html.Div(
-                #    dcc.Dropdown(
-                #        id        = 'ownerfilter-dropdown',
-                #        options   = owner_dropdown,
-                #        clearable = True,
-                #        style     = networkgraph_tab_layout[ 'dropdown' ]
-                #    )
-                #),
-                ## Product name filter dropdown
-                #html.P( 'Product filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
-                #html.Div(
-                #    dcc.Dropdown(
-                #        id        = 'productfilter-dropdown',
-                #        options   = product_dropdown,
-                #        clearable = True,
-                #        style     = networkgraph_tab_layout[ 'dropdown' ]
-                #    )
-                #),
+                html.P( 'Owner filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Dropdown(
+                        id        = 'ownerfilter-dropdown',
+                        options   = owner_dropdown,
+                        multi     = True,
+                        clearable = True,
+                        style     = networkgraph_tab_layout[ 'dropdown' ]
+                    )
+                ),
+                # Product name filter dropdown
+                html.P( 'Product filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Dropdown(
+                        id        = 'productfilter-dropdown',
+                        options   = product_dropdown,
+                        multi     = True,
+                        clearable = True,
+                        style     = networkgraph_tab_layout[ 'dropdown' ]
+                    )
+                ),
+                # Location filter dropdown
+                html.P( 'Location filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.Dropdown(
+                        id        = 'locationfilter-dropdown',
+                        options   = location_dropdown,
+                        multi     = True,
+                        clearable = True,
+                        style     = networkgraph_tab_layout[ 'dropdown' ]
+                    )
+                ),
+                # Event date range filter
+                html.P( 'Date filter', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                html.Div(
+                    dcc.DatePickerRange(
+                        id            = 'datefilter-range',
+                        clearable     = True,
+                        display_format = 'YYYY-MM-DD'
+                    )
+                ),
+                # How to combine the filters above
+                html.P( 'Highlight nodes matching', style = networkgraph_tab_layout[ 'dropdown-title' ] ),
+                dcc.RadioItems(
+                    id      = 'filtercombine-radio',
+                    options = [
+                        { 'label' : ' all filters', 'value' : 'and' },
+                        { 'label' : ' any filter',  'value' : 'or'  }
+                    ],
+                    value   = 'and',
+                    inline  = True
+                ),
                 # Network graph reset button
                 html.P(
-                    'If the filter does not seem to work, push Reset Filter below and try again.',
+                    'Push Reset Filter below to clear all the filters.',
                     style = networkgraph_tab_layout[ 'reset-note' ]
                 ),
                 html.Button(
@@ -455,6 +983,135 @@ def render_main_content(data, active_tab):
         )
     ])
 
+    # If tab3, show the FTIR spectra viewer
+    elif active_tab == 'tab3':
+        if spectra is None: return html.Div('No FTIR spectra available.')
+        return html.Div([
+            dcc.Dropdown(
+                id          = 'spectra-dropdown',
+                options     = [{'label': str(sample), 'value': sample} for sample in spectra.sample_ids()],
+                multi       = True,
+                placeholder = 'All samples',
+                style       = {'backgroundColor': '#adb5bd', 'color': '#374257', 'font-family': 'Calibri, sans-serif', 'margin-bottom': '10px'}
+            ),
+            dcc.Graph(id='spectra-chart', style={'height': '75vh'})
+        ])
+
+    # If tab4, show the PCA of the FTIR spectra
+    elif active_tab == 'tab4':
+        if spectra is None: return html.Div('No FTIR spectra available.')
+        component_options = [{'label': 'PC' + str(component + 1), 'value': component} for component in range(PCA_COMPONENTS)]
+        control_style = {'backgroundColor': '#adb5bd', 'color': '#374257', 'font-family': 'Calibri, sans-serif'}
+        wavenumber_range = [float(np.floor(spectra.wavenumbers.min())), float(np.ceil(spectra.wavenumbers.max()))]
+        return html.Div([
+            dbc.Row([
+                dbc.Col(dcc.RadioItems(
+                    id      = 'scatter-correction-radio',
+                    options = [{'label': ' No scatter correction', 'value': 'none'}, {'label': ' SNV', 'value': 'snv'}, {'label': ' MSC', 'value': 'msc'}],
+                    value   = 'none',
+                    inline  = True,
+                    style   = {'color': 'white'}
+                ), width=4),
+                dbc.Col(dcc.Dropdown(
+                    id        = 'savgol-derivative-dropdown',
+                    options   = [
+                        {'label': 'No smoothing',                    'value': -1},
+                        {'label': 'Savitzky-Golay smoothing',        'value': 0},
+                        {'label': 'Savitzky-Golay 1st derivative',   'value': 1},
+                        {'label': 'Savitzky-Golay 2nd derivative',   'value': 2}
+                    ],
+                    value     = -1,
+                    clearable = False,
+                    style     = control_style
+                ), width=3),
+                dbc.Col(dcc.Dropdown(
+                    id        = 'savgol-window-dropdown',
+                    options   = [{'label': str(window) + ' points', 'value': window} for window in range(5, 33, 2)],
+                    value     = 11,
+                    clearable = False,
+                    style     = control_style
+                ), width=2),
+                dbc.Col(dcc.RangeSlider(
+                    id      = 'trim-range-slider',
+                    min     = wavenumber_range[0],
+                    max     = wavenumber_range[1],
+                    value   = wavenumber_range,
+                    tooltip = {'placement': 'bottom'}
+                ), width=3)
+            ], className='mb-3'),
+            dbc.Row([
+                dbc.Col(dcc.RadioItems(
+                    id      = 'pca-scaling-radio',
+                    options = [{'label': ' Mean-centred', 'value': 'centre'}, {'label': ' Autoscaled', 'value': 'autoscale'}],
+                    value   = 'centre',
+                    inline  = True,
+                    style   = {'color': 'white'}
+                ), width=4),
+                dbc.Col(dcc.Dropdown(id='pca-x-dropdown', options=component_options, value=0, clearable=False, style=control_style), width=4),
+                dbc.Col(dcc.Dropdown(id='pca-y-dropdown', options=component_options, value=1, clearable=False, style=control_style), width=4)
+            ], className='mb-3'),
+            dbc.Row([
+                dbc.Col(dcc.Graph(id='pca-scores-chart'), width=6),
+                dbc.Col(dcc.Graph(id='pca-loadings-chart'), width=6)
+            ], className='mb-3'),
+            # Nearest spectra of a query spectrum (clicking a score point selects it)
+            dbc.Row([
+                dbc.Col(dcc.Input(
+                    id          = 'similarity-row-input',
+                    type        = 'number',
+                    min         = 0,
+                    max         = len(spectra) - 1,
+                    step        = 1,
+                    value       = 0,
+                    placeholder = 'Query spectrum (row)'
+                ), width=3),
+                dbc.Col(dcc.RadioItems(
+                    id      = 'similarity-metric-radio',
+                    options = [{'label': ' Cosine', 'value': 'cosine'}, {'label': ' Euclidean', 'value': 'euclidean'}],
+                    value   = 'cosine',
+                    inline  = True,
+                    style   = {'color': 'white'}
+                ), width=3),
+                dbc.Col(dcc.RadioItems(
+                    id      = 'similarity-space-radio',
+                    options = [{'label': ' Spectra', 'value': 'spectra'}, {'label': ' PCA scores', 'value': 'pca'}],
+                    value   = 'spectra',
+                    inline  = True,
+                    style   = {'color': 'white'}
+                ), width=3),
+                dbc.Col(dcc.Input(id='similarity-k-input', type='number', min=1, max=SIMILARITY_MAX_MATCHES, step=1, value=5), width=3)
+            ], className='mb-3'),
+            dcc.Graph(id='similarity-chart')
+        ])
+
+    # If tab5, show the models predicting the microbial counts from the spectra
+    elif active_tab == 'tab5':
+        if micro_table is None: return html.Div('No microbial counts available.')
+        control_style = {'backgroundColor': '#adb5bd', 'color': '#374257', 'font-family': 'Calibri, sans-serif'}
+        return html.Div([
+            dbc.Row([
+                dbc.Col(dcc.RadioItems(
+                    id      = 'model-method-radio',
+                    options = [{'label': ' PLS regression', 'value': 'pls'}, {'label': ' Ridge regression', 'value': 'ridge'}],
+                    value   = 'pls',
+                    inline  = True,
+                    style   = {'color': 'white'}
+                ), width=4),
+                dbc.Col(dcc.Input(id='model-parameter-input', type='number', min=0, value=MODEL_METHODS['pls'], placeholder='Latent variables / penalty'), width=4),
+                dbc.Col(dcc.Dropdown(id='model-target-dropdown', options=MICRO_TARGETS, value=MICRO_TARGETS[0], clearable=False, style=control_style), width=4)
+            ], className='mb-3'),
+            html.P('Log10 counts predicted from the spectra (preprocessing of the Spectra PCA tab), with sample-grouped cross-validation.', style={'color': 'white'}),
+            dbc.Row([
+                dbc.Col(dash_table.DataTable(
+                    id           = 'model-metrics-table',
+                    columns      = [{'name': name, 'id': name} for name in ['Target', 'RMSECV', 'R2CV', 'RMSEC', 'R2C']],
+                    style_cell   = {'backgroundColor': '#adb5bd', 'color': '#374257', 'font-family': 'Calibri, sans-serif'},
+                    style_header = {'fontWeight': 'bold'}
+                ), width=5),
+                dbc.Col(dcc.Graph(id='model-prediction-chart'), width=7)
+            ])
+        ])
+
 # Callback to change title style if 'tab2' is pushed
 @app.callback(
     Output('dashboard_title', 'style'),
@@ -497,51 +1154,120 @@ def hide_tabs(active_tab):
             'background-color' : '#6c757d',
         }
 
-# Callback to to hide temperature alert if 'tab2' is pushed
+# Callback to to hide temperature alert if another tab than 'tab1' is pushed
 @app.callback(
     Output('alert_temperature', 'is_open'),
     Input('main-tabs', 'active_tab')
 )
 def hide_alart_temp(active_tab):
-    if   active_tab == 'tab2': return False
+    if   active_tab in ['tab2', 'tab3', 'tab4', 'tab5']: return False
     elif active_tab == 'tab1': return True
 
-# Callback to to hide weight alert if 'tab2' is pushed
+# Callback to to hide weight alert if another tab than 'tab1' is pushed
 @app.callback(
     Output('alert_weight', 'is_open'),
     Input('main-tabs', 'active_tab')
 )
 def hide_alart_weight(active_tab):
-    if   active_tab == 'tab2': return False
+    if   active_tab in ['tab2', 'tab3', 'tab4', 'tab5']: return False
     elif active_tab == 'tab1': return True
 
-# Callback to to hide expired alert if 'tab2' is pushed
+# Callback to to hide expired alert if another tab than 'tab1' is pushed
 @app.callback(
     Output('alert_expired', 'is_open'),
     Input('main-tabs', 'active_tab')
 )
 def hide_alart_expired(active_tab):
-    if   active_tab == 'tab2': return False
+    if   active_tab in ['tab2', 'tab3', 'tab4', 'tab5']: return False
     elif active_tab == 'tab1': return True
 
-# Callback to display data on the top-right window
+# Callback to narrow all the panels to the selected ledgers: the store gets
+# the version key of the precomputed slice of those ledgers
+@app.callback(
+    Output('store', 'data'),
+    Input('source-dropdown', 'value'),
+    prevent_initial_call = True
+)
+def select_sources(sources):
+    return get_source_dataset_key(sources)
+
+# Callback to hide the ledger selector outside of 'tab1'
+@app.callback(
+    Output('source-dropdown', 'style'),
+    Input('main-tabs', 'active_tab'),
+    State('source-dropdown', 'style')
+)
+def hide_source_dropdown(active_tab, style):
+    return dict(style, display = 'none' if active_tab != 'tab1' else 'block')
+
+# Alert messages of the products of the selected ledgers
+@app.callback(
+    [
+        Output('alert_temperature', 'children'),
+        Output('alert_weight', 'children'),
+        Output('alert_expired', 'children')
+    ],
+    Input('store', 'data'),
+    prevent_initial_call = True
+)
+def update_alert_messages(data):
+    alerts = get_dataset_alerts(data)
+    if alerts is None: return dash.no_update, dash.no_update, dash.no_update
+    return get_alert_messages(alerts)
+
+# Callback to show the integrity alert if the ledger has problems, and hide it if another tab than 'tab1' is pushed
+@app.callback(
+    Output('alert_integrity', 'is_open'),
+    Input('main-tabs', 'active_tab')
+)
+def hide_alart_integrity(active_tab):
+    if   active_tab in ['tab2', 'tab3', 'tab4', 'tab5']: return False
+    elif active_tab == 'tab1': return not integrity_report['ok']
+
+# Linked experiments shown at most in the block content window, and points
+# per spectrum of their (small) charts
+EXPERIMENT_MAX_SHOWN = 3
+EXPERIMENT_MAX_POINTS = 400
+
+# Spectra and microbial counts of a linked sample, built from the lazily
+# loaded experiment (see experiment_loader) and cached in figure_cache
+def get_experiment_content( sample_id ):
+    def build_experiment_content():
+        experiment = experiment_loader.load( sample_id )
+        counts     = experiment[ 'counts' ]
+        text       = '\n' + 'Sample ' + sample_id + ': ' + ( 'no microbial counts' if counts is None else ', '.join( str( name ) + ' ' + str( value ) for name, value in counts.items() ) )
+        if len( experiment[ 'spectra' ] ) == 0: return [ text + '\n' + 'No FTIR spectrum' ]
+        x, y = downsample_minmax( experiment[ 'wavenumbers' ], experiment[ 'spectra' ], EXPERIMENT_MAX_POINTS )
+        fig  = go.Figure( [ go.Scattergl( x = x[ row ], y = y[ row ], mode = 'lines', line = dict( width = 1 ), hoverinfo = 'skip' ) for row in range( len( y ) ) ] )
+        fig.update_layout( height = 160, margin = dict( l = 30, r = 10, t = 10, b = 30 ), showlegend = False, xaxis = dict( autorange = 'reversed' ),
+                           paper_bgcolor = 'rgba(0,0,0,0)', plot_bgcolor = 'rgba(0,0,0,0)' )
+        return [ text, dcc.Graph( figure = fig.to_dict(), config = { 'displayModeBar' : False } ) ]
+    return figure_cache.get_or_create( ( spectra.key if spectra is not None else None, 'experiment', ( sample_id, ) ), build_experiment_content )
+
+# Callback to display data on the top-right window, with the spectra and
+# microbial counts of the experiments linked to the block. Nothing is
+# loaded for blocks which are never hovered
 @app.callback( Output( 'block-content', 'children' ), Input( 'network-gragh', 'mouseoverNodeData' ) )
 def displayTapNodeData( data ):
-    return 'Product Name: '    + data[ 'product_name' ] + '\n' + \
+    text = 'Product Name: '    + data[ 'product_name' ] + '\n' + \
            'Product ID: '      + data[ 'product_id'   ] + '\n' + \
            'Owner: '           + data[ 'owner'        ] + '\n' + \
            'Weight (Kg): '     + data[ 'weight'       ] + '\n' + \
            'Temperature (℃): ' + data[ 'temperature'  ] + '\n' + \
            'Location: '        + data[ 'location'     ] + '\n' + \
            'Timestamp: '       + data[ 'timestamp'    ]
+    sample_ids = experiment_links.links( networkgraph_index.block_id( data[ 'id' ] ) )
+    if len( sample_ids ) == 0: return text
+    content = [ text + '\n' + 'Linked experiments: ' + ', '.join( sample_ids ) ]
+    for sample_id in sample_ids[ : EXPERIMENT_MAX_SHOWN ]: content += get_experiment_content( sample_id )
+    return content
 
 @app.callback(
     Output("alert", "is_open"),
     [Input("store", "data")]
 )
 def update_alert(data):
-    inconsistent_products = [product for product in df_txhistory['ProductID'].unique() if not is_constant_temperature(product)]
-    return len(inconsistent_products) > 0
+    return len(products_with_inconstant_temperature) > 0
 
 #@app.callback(
 #    Output("alert_weight", "is_open"),
@@ -566,115 +1292,568 @@ def update_alert(data):
     [Input("store", "data")]
 )
 def product_not_expired(data):
-    expiry_dates = pd.to_datetime(df_txhistory['UseByDate'].unique()).date
     current_date = dt.now().date()
-    not_expired_products = [
-        product for product in df_txhistory['ProductID'].unique() 
-        if pd.to_datetime(df_txhistory[df_txhistory['ProductID'] == product]['UseByDate'].iloc[0]).date() >= current_date
-    ]
-    return len(not_expired_products) == len(df_txhistory['ProductID'].unique())
+    alerts = get_dataset_alerts(data, current_date)
+    if alerts is None: return False
+    return all_products_in_date(alerts, current_date)
 
+# Treemap hierarchies are aggregated once per dataset version; a click on a
+# node re-queries the figure with that node as root, sending only the visible levels
 @app.callback(
     Output('treemap-chart', 'figure'),
-    [Input('treemap-dropdown', 'value')]
+    [Input('treemap-dropdown', 'value'), Input('treemap-chart', 'clickData')],
+    State('store', 'data')
 )
-def update_treemap_chart(selected_value):
-    if selected_value == 'Temperature':
-        fig = px.treemap(df_txhistory, path=[px.Constant("Products"), "ProductType","EventTimestamp", "Location", "Owner"], values="Temperature",
-                         color="Temperature", color_continuous_scale='Blues')
-        fig.update_layout(title="Treemap Chart for Temperature", title_font=dict(size=30),
-                          plot_bgcolor="#adb5bd", paper_bgcolor='#adb5bd')
-        fig.update_traces(marker=dict(cornerradius=5))
-        return fig
-    elif selected_value == 'Weight':
-        fig = px.treemap(df_txhistory, path=[px.Constant("Products"),"ProductType", "EventTimestamp", "Location", "Owner"], values="Weight",
-                         color="Weight", color_continuous_scale='Blues')
-        fig.update_layout(title="Treemap Chart for Weight", title_font=dict(size=30),
+def update_treemap_chart(selected_value, click_data, data):
+    root_id = None
+    if dash.callback_context.triggered_id == 'treemap-chart' and click_data:
+        root_id = click_data['points'][0].get('id')
+    return get_treemap_figure(data, selected_value, root_id)
+
+# Treemap figure of a dataset version, rooted at 'root_id'
+def get_treemap_figure(data, selected_value, root_id):
+    if selected_value not in ['Temperature', 'Weight']: return dash.no_update
+
+    df_txhistory = get_dataset(data)
+    if df_txhistory is None: return dash.no_update
+
+    def build_treemap_figure():
+        cube = figure_cache.get_or_create((data, 'treemap-cube', (selected_value,)), lambda: build_treemap_cube(df_txhistory, selected_value))
+        fig = go.Figure(build_treemap_trace(cube, root_id))
+        fig.update_layout(title=f"Treemap Chart for {selected_value}", title_font=dict(size=30),
                           plot_bgcolor="#adb5bd", paper_bgcolor='#adb5bd')
-        fig.update_traces(marker=dict(cornerradius=5))
+        return fig.to_dict()
+
+    return figure_cache.get_or_create((data, 'treemap', (selected_value, root_id)), build_treemap_figure)
+
+# Draw the lineage path of the selected product over the map of event
+# locations. The path comes from the lineage index, not from a scan
+@app.callback(
+    Output('map-chart', 'figure'),
+    Input('trace-map-dropdown', 'value'),
+    State('store', 'data'),
+    prevent_initial_call = True
+)
+def update_map_trace(product_id, data):
+    df_txhistory = get_dataset(data)
+    if df_txhistory is None: return dash.no_update
+
+    def build_trace_map_figure():
+        fig = copy.deepcopy(figure_cache.get_or_create((data, 'map', ()), lambda: build_map_figure(df_txhistory)))
+        if product_id is None: return fig
+
+        block_ids = get_product_trace(product_id)
+        coordinates = df_txhistory.drop_duplicates('Location').set_index('Location')[['Latitude', 'Longitude']]
+        branches = networkgraph_branches.frame()
+        path = coordinates.reindex(branches['Location'].to_numpy()[block_ids])
+        hover_text = branches['Owner'].to_numpy()[block_ids] + '<br>' + path.index.to_numpy(dtype=object)
+        fig['data'].append(go.Scattermapbox(
+            lat=path['Latitude'],
+            lon=path['Longitude'],
+            mode='markers+lines',
+            marker=go.scattermapbox.Marker(size=14, color='#F2A900'),
+            line=dict(width=4, color='#F2A900'),
+            text=hover_text,
+            name='Trace of ' + str(product_id)
+        ).to_plotly_json())
         return fig
 
-# Callback to change node size from pull down
+    return figure_cache.get_or_create((data, 'map-trace', (product_id,)), build_trace_map_figure)
+
+# Redraw the spectra of the selected samples. On zoom, the visible window
+# is queried again, so the detail grows as the window narrows
 @app.callback(
-    Output( 'network-gragh', 'stylesheet', allow_duplicate = True ),
-    Input( 'nodesize-dropdown', 'value' ),
-    prevent_initial_call = True # This is needy to allow duplication of callback output
+    Output('spectra-chart', 'figure'),
+    [Input('spectra-dropdown', 'value'), Input('spectra-chart', 'relayoutData')]
 )
-def changeNodeSizePullDown( selected_value ):
-    network_stylesheet_updated = networkgraph_stylesheet
-    network_stylesheet_updated[ 0 ][ 'style' ][ 'width'  ] = selected_value
-    network_stylesheet_updated[ 0 ][ 'style' ][ 'height' ] = selected_value
-    return network_stylesheet_updated
+def update_spectra_chart(samples, relayout_data):
+    window = get_spectra_window(relayout_data)
+    if window is None:
+        if dash.callback_context.triggered_id == 'spectra-chart': return dash.no_update
+        window = (None, None)
+    low, high = window
+    return figure_cache.get_or_create((spectra.key, 'spectra', (tuple(samples or ()), low, high)), lambda: build_spectra_figure(samples, low, high))
 
-# Callback to change node colour from pull down
+# Collect the preprocessing options into pipeline stages (see PreprocessingPipeline)
 @app.callback(
-    Output( 'network-gragh', 'stylesheet', allow_duplicate = True ),
-    Input( 'nodecolour-dropdown', 'value' ),
-    prevent_initial_call = True # This is needy to allow duplication of callback output
+    Output('preprocessing-store', 'data'),
+    [
+        Input('scatter-correction-radio', 'value'),
+        Input('savgol-derivative-dropdown', 'value'),
+        Input('savgol-window-dropdown', 'value'),
+        Input('trim-range-slider', 'value')
+    ]
 )
-def changeNodeColourPullDown( selected_value ):
-    network_stylesheet_updated = networkgraph_stylesheet
-    network_stylesheet_updated[ 0 ][ 'style' ][ 'background-color'  ] = selected_value
+def update_preprocessing(scatter_correction, derivative, window, trim_range):
+    stages = []
+    if trim_range and list(trim_range) != [float(np.floor(spectra.wavenumbers.min())), float(np.ceil(spectra.wavenumbers.max()))]:
+        stages.append(['trim', {'low': trim_range[0], 'high': trim_range[1]}])
+    if scatter_correction in ['snv', 'msc']:
+        stages.append([scatter_correction, {}])
+    if derivative is not None and derivative >= 0:
+        stages.append(['savgol', {'window': window, 'order': max(2, derivative), 'derivative': derivative}])
+    return stages
 
-    # Change labels as well
-    if   selected_value == 'data(colour_owner)':
-        network_stylesheet_updated[ 0 ][ 'style' ][ 'label' ] = 'data(owner)'
-    elif selected_value == 'data(colour_product)':
-        network_stylesheet_updated[ 0 ][ 'style' ][ 'label' ] = 'data(product_name)'
-    elif selected_value == 'data(colour_location)':
-        network_stylesheet_updated[ 0 ][ 'style' ][ 'label' ] = 'data(location)'
+# Draw the PCA scores and loadings of the selected components. The model
+# is only recomputed when the dataset, the preprocessing or the scaling changes
+@app.callback(
+    [Output('pca-scores-chart', 'figure'), Output('pca-loadings-chart', 'figure')],
+    [Input('preprocessing-store', 'data'), Input('pca-scaling-radio', 'value'), Input('pca-x-dropdown', 'value'), Input('pca-y-dropdown', 'value')]
+)
+def update_pca_charts(stages, scaling, pc_x, pc_y):
+    model, wavenumbers = get_spectra_pca(stages, scaling)
+    options = (PreprocessingPipeline(stages).key(), scaling, pc_x, pc_y)
+    return (
+        figure_cache.get_or_create((spectra.key, 'pca-scores', options), lambda: build_pca_scores_figure(model, pc_x, pc_y)),
+        figure_cache.get_or_create((spectra.key, 'pca-loadings', options), lambda: build_pca_loadings_figure(model, wavenumbers, pc_x, pc_y))
+    )
 
-    return network_stylesheet_updated
+# Query the spectrum of the clicked score point
+@app.callback(
+    Output('similarity-row-input', 'value'),
+    Input('pca-scores-chart', 'clickData'),
+    prevent_initial_call = True
+)
+def select_similarity_query(click_data):
+    if not click_data: return dash.no_update
+    return click_data['points'][0]['customdata']
 
-# Callback to update temperature highlighting filter
+# Show the nearest spectra of the query spectrum (its own row is left out)
 @app.callback(
-    Output( 'network-gragh', 'stylesheet', allow_duplicate = True ),
-    Input( 'filtertemperature-input', 'value' ),
-    prevent_initial_call = True # This is needy to allow duplication of callback output
+    Output('similarity-chart', 'figure'),
+    [
+        Input('preprocessing-store', 'data'),
+        Input('pca-scaling-radio', 'value'),
+        Input('similarity-row-input', 'value'),
+        Input('similarity-metric-radio', 'value'),
+        Input('similarity-space-radio', 'value'),
+        Input('similarity-k-input', 'value')
+    ]
 )
-def setFilterTemperatureInput( input_value ):
-    network_stylesheet_updated = networkgraph_stylesheet
+def update_similarity_chart(stages, scaling, query_row, metric, space, k):
+    if query_row is None or not 0 <= int(query_row) < len(spectra) or not k: return dash.no_update
+    query_row, k = int(query_row), min(int(k), SIMILARITY_MAX_MATCHES)
+    query = get_spectra_pca(stages, scaling)[0].scores[query_row] if space == 'pca' else get_preprocessed_rows(stages, [query_row])[0]
+    rows, distances = get_similarity_index(stages, scaling, metric, space).query(query, k, exclude=[query_row])
+    return build_similarity_figure(stages, query_row, rows[0], distances[0], metric)
 
-    # Update temperature condition
-    network_stylesheet_updated[ 3 ][ 'selector' ] = setFilterCondition(
-        str( input_value ),
-        'temperature_integer',
-        network_stylesheet_updated[ 3 ][ 'selector' ]
-    )
+# Default parameter of the selected model method
+@app.callback(
+    Output('model-parameter-input', 'value'),
+    Input('model-method-radio', 'value'),
+    prevent_initial_call = True
+)
+def reset_model_parameter(method):
+    return MODEL_METHODS[method]
 
-    return network_stylesheet_updated
+# Show the cross-validation metrics of the microbial count models and the
+# predictions of the selected target
+@app.callback(
+    [Output('model-metrics-table', 'data'), Output('model-prediction-chart', 'figure')],
+    [
+        Input('preprocessing-store', 'data'),
+        Input('model-method-radio', 'value'),
+        Input('model-parameter-input', 'value'),
+        Input('model-target-dropdown', 'value')
+    ]
+)
+def update_microbial_models(stages, method, parameter, target):
+    if parameter is None or parameter < 0 or (method == 'pls' and int(parameter) < 1): return dash.no_update, dash.no_update
+    parameter = int(parameter) if method == 'pls' else float(parameter)
+    models = get_microbial_models(stages, method, parameter)
+    metrics = [{
+        'Target': name,
+        'RMSECV': round(result['cv']['rmse'], 3),
+        'R2CV':   round(result['cv']['r2'], 3),
+        'RMSEC':  round(result['calibration']['rmse'], 3),
+        'R2C':    round(result['calibration']['r2'], 3)
+    } for name, result in models.items()]
+    options = (PreprocessingPipeline(stages).key(), micro_key, method, parameter, target)
+    return metrics, figure_cache.get_or_create((spectra.key, 'model-predictions', options), lambda: build_model_prediction_figure(models, target))
 
-# Callback to set weight hilighting filter
+# Callback to load a subgraph on demand: the blocks of the selected root
+# product, or the neighbourhood of a tapped node. Clearing the root product
+# goes back to the overview. The answer comes from the adjacency index, so
+# its cost and size are bounded by the visible neighbourhood
 @app.callback(
-    Output( 'network-gragh', 'stylesheet', allow_duplicate = True ),
-    Input( 'filterweight-input', 'value' ),
-    prevent_initial_call = True # This is needy to allow duplication of callback output
+    Output( 'network-gragh', 'elements' ),
+    [
+        Input( 'rootproduct-dropdown',  'value'       ),
+        Input( 'network-gragh',         'tapNodeData' ),
+        Input( 'hops-input',            'value'       ),
+        Input( 'traceproduct-dropdown', 'value'       )
+    ],
+    State( 'source-dropdown', 'value' ),
+    prevent_initial_call = True
 )
-def setFilterWeightInput( input_value ):
-    network_stylesheet_updated = networkgraph_stylesheet
+def loadNetworkSubgraph( root_product_id, tap_node_data, hops, trace_product_id, sources ):
+    if hops is None: hops = NETWORKGRAPH_DEFAULT_HOPS
+    if dash.callback_context.triggered_id == 'traceproduct-dropdown' and trace_product_id is not None:
+        return get_subgraph_elements( np.sort( get_product_trace( trace_product_id )[ : NETWORKGRAPH_MAX_NODES ] ) )
+    if dash.callback_context.triggered_id == 'network-gragh' or ( dash.callback_context.triggered_id == 'hops-input' and tap_node_data ):
+        block_id = networkgraph_index.block_id( tap_node_data[ 'id' ] )
+        if block_id < 0: return dash.no_update
+        return get_subgraph_elements( networkgraph_index.neighbourhood( [ block_id ], int( hops ), NETWORKGRAPH_MAX_NODES ) )
+    if root_product_id is None: return figure_cache.get_or_create( ( None, 'network-overview', ( live_version, ) + tuple( sources or () ) ), lambda: get_source_overview_elements( sources ) )
+    block_ids = networkgraph_index.root_product_blocks( root_product_id )[ : NETWORKGRAPH_MAX_NODES ]
+    return get_subgraph_elements( block_ids )
 
-    # Update temperature condition
-    network_stylesheet_updated[ 3 ][ 'selector' ] = setFilterCondition(
-        str( input_value ),
-        'weight_integer',
-        network_stylesheet_updated[ 3 ][ 'selector' ]
-    )
+# Block ids of the nodes among Cytoscape elements (e.g. the loaded subgraph)
+def get_element_block_ids(elements):
+    block_ids = networkgraph_index.block_ids([element['data']['id'] for element in elements or [] if 'source' not in element['data']])
+    return np.unique(block_ids[block_ids >= 0])
 
-    return network_stylesheet_updated
+# Callback to rebuild the network graph stylesheet from the sidebar options.
+# The stylesheet is derived from the immutable default one plus this user's
+# options record, so nothing is shared or mutated between sessions.
+# Highlighting filters are evaluated on the server over the rows of the node
+# table which are loaded in the graph, so the selectors are bounded by the
+# loaded subgraph (NETWORKGRAPH_MAX_NODES) rather than by the ledger, and
+# they are rebuilt when another subgraph is loaded
+@app.callback(
+    Output( 'network-gragh', 'stylesheet' ),
+    [
+        Input( 'nodesize-dropdown',       'value'      ),
+        Input( 'nodecolour-dropdown',     'value'      ),
+        Input( 'filtertemperature-input', 'value'      ),
+        Input( 'filterweight-input',      'value'      ),
+        Input( 'ownerfilter-dropdown',    'value'      ),
+        Input( 'productfilter-dropdown',  'value'      ),
+        Input( 'locationfilter-dropdown', 'value'      ),
+        Input( 'datefilter-range',        'start_date' ),
+        Input( 'datefilter-range',        'end_date'   ),
+        Input( 'filtercombine-radio',     'value'      ),
+        Input( 'traceproduct-dropdown',   'value'      ),
+        Input( 'network-gragh',           'elements'   )
+    ],
+    prevent_initial_call = True
+)
+def updateNetworkStylesheet( node_size, node_colour, temperature, weight, owner, product, location, date_from, date_to, combine, trace_product_id, elements ):
+    loaded = get_element_block_ids( elements )
+    options = {
+        'node_size'   : node_size,
+        'node_colour' : node_colour,
+        'temperature' : temperature,
+        'weight'      : weight,
+        'owner'       : owner,
+        'product'     : product,
+        'location'    : location,
+        'date_from'   : date_from,
+        'date_to'     : date_to,
+        'combine'     : combine,
+        'trace'       : get_trace_selection( np.intersect1d( get_product_trace( trace_product_id ), loaded ) ) if trace_product_id is not None else None
+    }
+    return set_networkgraph_stylesheet( options, networkgraph_node_table.frame().iloc[ loaded ], networkgraph_stylesheet )
 
-# Callback to reset network graph style into default
+# Callback to reset network graph filters. Clearing the inputs rebuilds
+# the stylesheet without the highlighting filter
 @app.callback(
-    Output( 'network-gragh', 'stylesheet', allow_duplicate = True ),
+    [
+        Output( 'filtertemperature-input', 'value'      ),
+        Output( 'filterweight-input',      'value'      ),
+        Output( 'ownerfilter-dropdown',    'value'      ),
+        Output( 'productfilter-dropdown',  'value'      ),
+        Output( 'locationfilter-dropdown', 'value'      ),
+        Output( 'datefilter-range',        'start_date' ),
+        Output( 'datefilter-range',        'end_date'   )
+    ],
     Input( 'reset-button', 'n_clicks' ),
-    prevent_initial_call = True # This is needy to allow duplication of callback output
+    prevent_initial_call = True
 )
 def resetNetworkStyleButton( button_n_clicks ):
-    if button_n_clicks > 0 :
-        network_stylesheet_updated = networkgraph_stylesheet
-        condition = '[temperature_integer>999999]'
-        network_stylesheet_updated[ 3 ][ 'selector' ] = condition
-        return network_stylesheet_updated
+    return None, None, None, None, None, None, None
+
+# ----------------------------------------------------------------- #
+# Live mode: new events are read from the ledger event logs (see LedgerTail)
+# and merged into the server-side state incrementally: only the new rows are
+# parsed and geocoded, and the dataset key, product alerts, treemap cubes,
+# lineage index and layout are extended rather than recomputed. Every batch
+# is kept in live_updates, so that open pages only receive the new points
+# and elements (dash.Patch) instead of whole figures
+# ----------------------------------------------------------------- #
+LIVE_HISTORY = 64
+
+live_tail = LedgerTail(LEDGER_PATHS, loaded_files = list_ledger_files(LEDGER_PATHS))
+live_lock = threading.Lock()
+live_version = 0
+live_updates = deque(maxlen = LIVE_HISTORY)
+
+# Network graph elements of new blocks: their nodes, the nodes of their
+# parents (which may not be shown yet) and the edges between them
+def get_live_elements(new_ids):
+    parents = networkgraph_index.parents[new_ids]
+    has_parent = parents >= 0
+    shown_parents = np.setdiff1d(parents[has_parent], new_ids)
+    edges = [{'data': {'source': source, 'target': target}} for source, target in zip(
+        networkgraph_index.previous_hashes[new_ids[has_parent]].tolist(),
+        networkgraph_index.hashes[new_ids[has_parent]].tolist()
+    )]
+    return [data_nodes[block_id] for block_id in shown_parents.tolist() + new_ids.tolist()] + edges
+
+# Poll the ledgers and apply the new events. Returns the live version
+def apply_live_update():
+    global dataset_rows, networkgraph_branches, dataset_key, source_dataset_keys, dataset_sources, live_version
+    global networkgraph_node_table
+
+    with live_lock:
+        df_new, df_new_branches = live_tail.poll()
+        if df_new_branches is None: return live_version
+        update = {'version': live_version + 1, 'rows': df_new.iloc[:0], 'elements': {}}
+
+        if len(df_new) > 0:
+            # Parse and geocode the new events only
+            df_new['EventTimestamp'] = pd.to_datetime(df_new['EventTimestamp'], utc=True, errors='coerce').dt.tz_localize(None)
+            df_new['EventDate'] = df_new['EventTimestamp'].dt.strftime('%Y-%m-%d')
+            df_new[['Latitude', 'Longitude']] = geocode_locations(df_new['Location'], geolocator, geocode_cache, gazetteer)
+            dataset_rows, df_new = dataset_rows.append_rows(df_new)
+            ledger_sources[:] = dataset_rows.categories[SOURCE_COLUMN]
+
+            # The key, alerts and treemap cubes of the new dataset are derived
+            # from the old ones (if they were computed; otherwise on demand)
+            old_key = dataset_key
+            dataset_key = dataset_cache.put(dataset_rows, key = extend_dataset_version(old_key, df_new), pinned = True)
+            dataset_cache.unpin(old_key)
+            current_date = dt.now().date()
+            alerts = figure_cache.get((old_key, 'alerts', (current_date,)))
+            if alerts is not None:
+                figure_cache.put((dataset_key, 'alerts', (current_date,)), merge_product_alerts(alerts, df_new, current_date))
+            for selected_value in ['Temperature', 'Weight']:
+                cube = figure_cache.get((old_key, 'treemap-cube', (selected_value,)))
+                if cube is None: continue
+                figure_cache.put((dataset_key, 'treemap-cube', (selected_value,)), merge_treemap_cubes(cube, build_treemap_cube(df_new, selected_value)))
+
+            # Per-ledger slices are rebuilt on demand from the extended row lists
+            for source, rows in df_new.groupby(SOURCE_COLUMN, observed=True).indices.items():
+                source_rows.setdefault(source, GrowingArray([], np.int64)).append(df_new.index.to_numpy()[rows])
+            source_dataset_keys = LRUCache(max_entries = 64)
+            dataset_sources = LRUCache(max_entries = 256)
+            update['rows'] = df_new
+
+        # New blocks: index, place and colour them like the others
+        df_new_branches = create_networkgraph_inputdata(df_new_branches, networkgraph_weight_range)
+        networkgraph_branches, df_new_branches = networkgraph_branches.append_rows(df_new_branches)
+        new_root_products = pd.unique(df_new_branches['RootProductID'][networkgraph_index.group_codes('RootProductID', df_new_branches['RootProductID']) < 0])
+        new_products = pd.unique(df_new_branches['ProductID'][networkgraph_index.group_codes('ProductID', df_new_branches['ProductID']) < 0])
+        new_ids = networkgraph_index.extend(
+            df_new_branches['Hash'],
+            df_new_branches['PreviousHash'],
+            root_product_ids     = df_new_branches['RootProductID'],
+            product_ids          = df_new_branches['ProductID'],
+            previous_product_ids = df_new_branches['PreviousProductID'],
+            source_ids           = df_new_branches[SOURCE_COLUMN]
+        )
+        experiment_links.extend(df_new_branches['LinkedExperiments'])
+        new_x, new_y = extend_layered_layout(networkgraph_index, networkgraph_x, networkgraph_y, new_ids, networkgraph_layer_ends)
+        new_nodes = set_node_colours(get_nodes(df_new_branches), node_colour_registry)
+        new_nodes = set_node_positions(new_nodes, new_x, new_y)
+        data_nodes.extend(new_nodes)
+        networkgraph_node_table = networkgraph_node_table.append_rows(build_node_table(new_nodes))[0]
+        extend_overview(new_ids, new_y)
+        for source, positions in df_new_branches.groupby(SOURCE_COLUMN, observed=True).indices.items():
+            update['elements'][source] = get_live_elements(new_ids[positions])
+
+        # Dropdown options are shared by the layouts, so they are extended in place
+        root_product_dropdown.extend({'label': str(value), 'value': value} for value in new_root_products)
+        trace_product_dropdown.extend({'label': str(value), 'value': value} for value in new_products)
+        owner_dropdown[:] = node_colour_registry.dropdown_options('owner')
+        product_dropdown[:] = node_colour_registry.dropdown_options('product_name')
+        location_dropdown[:] = node_colour_registry.dropdown_options('location')
+
+        live_updates.append(update)
+        live_version = update['version']
+        print('Live update', live_version, ':', len(df_new), 'events,', len(new_ids), 'blocks')
+        return live_version
+
+# Updates after version 'after' up to version 'until', or None if some of
+# them are no longer kept (the page then gets whole figures)
+def get_live_updates(after, until):
+    updates = [update for update in list(live_updates) if after < update['version'] <= until]
+    if len(updates) < until - after: return None
+    return updates
+
+# New events of some updates, for the selected ledgers
+def get_live_rows(updates, sources):
+    rows = pd.concat([update['rows'] for update in updates])
+    if sources: rows = rows[rows[SOURCE_COLUMN].isin(sources)]
+    return rows
+
+# Read the event logs present at startup
+if LIVE_MODE: apply_live_update()
+
+# Callback to poll the ledgers: the page learns the versions to apply and
+# the key of the extended dataset
+@app.callback(
+    [Output('live-store', 'data'), Output('store', 'data', allow_duplicate=True)],
+    Input('live-interval', 'n_intervals'),
+    [State('live-store', 'data'), State('source-dropdown', 'value')],
+    prevent_initial_call = True
+)
+def poll_live_updates(n_intervals, live_state, sources):
+    version = apply_live_update()
+    if version == live_state['to']: return dash.no_update, dash.no_update
+    return {'from': live_state['to'], 'to': version}, get_source_dataset_key(sources)
+
+# Callback to add the new events to the map
+@app.callback(
+    Output('map-chart', 'figure', allow_duplicate=True),
+    Input('live-store', 'data'),
+    [State('store', 'data'), State('source-dropdown', 'value'), State('trace-map-dropdown', 'value')],
+    prevent_initial_call = True
+)
+def extend_map_chart(live_state, data, sources, product_id):
+    updates = get_live_updates(live_state['from'], live_state['to'])
+    if updates is None: return update_map_trace(product_id, data)
+    rows = get_live_rows(updates, sources)
+    if len(rows) == 0: return dash.no_update
+    patch = Patch()
+    patch['data'][0]['lat'].extend(rows['Latitude'].tolist())
+    patch['data'][0]['lon'].extend(rows['Longitude'].tolist())
+    patch['data'][0]['text'].extend(get_map_hover_text(rows).tolist())
+    return patch
+
+# Add new events to a line chart: one line per ledger, in the order of
+# ledger_sources, or a single line if only one ledger is shown. The whole
+# figure is sent when the lines change (e.g. a new ledger shows up)
+def extend_line_chart(live_state, data, sources, value_column, build_figure):
+    df_txhistory = get_dataset(data)
+    if df_txhistory is None: return dash.no_update
+    updates = get_live_updates(live_state['from'], live_state['to'])
+    if updates is None: return figure_cache.get_or_create((data, 'line', (value_column,)), lambda: build_figure(df_txhistory))
+    rows = get_live_rows(updates, sources)
+    if len(rows) == 0: return dash.no_update
+
+    counts = df_txhistory[SOURCE_COLUMN].value_counts()
+    shown_before = [source for source in ledger_sources if counts.get(source, 0) > (rows[SOURCE_COLUMN] == source).sum()]
+    shown_after = [source for source in ledger_sources if counts.get(source, 0) > 0]
+    if shown_before != shown_after or len(shown_before) == 0:
+        return figure_cache.get_or_create((data, 'line', (value_column,)), lambda: build_figure(df_txhistory))
+
+    patch = Patch()
+    for source, part in rows.groupby(SOURCE_COLUMN, observed=True):
+        line = shown_after.index(source) if len(shown_after) > 1 else 0
+        patch['data'][line]['x'].extend(part['EventTimestamp'].dt.strftime('%Y-%m-%d %H:%M:%S.%f').tolist())
+        patch['data'][line]['y'].extend(part[value_column].tolist())
+        patch['data'][line]['customdata'].extend(part[LINE_HOVER_DATA].values.tolist())
+    return patch
+
+@app.callback(
+    Output('temperature-chart', 'figure'),
+    Input('live-store', 'data'),
+    [State('store', 'data'), State('source-dropdown', 'value')],
+    prevent_initial_call = True
+)
+def extend_temperature_chart(live_state, data, sources):
+    return extend_line_chart(live_state, data, sources, 'Temperature', build_temperature_figure)
+
+@app.callback(
+    Output('weight-chart', 'figure'),
+    Input('live-store', 'data'),
+    [State('store', 'data'), State('source-dropdown', 'value')],
+    prevent_initial_call = True
+)
+def extend_weight_chart(live_state, data, sources):
+    return extend_line_chart(live_state, data, sources, 'Weight', build_weight_figure)
+
+# Callback to refresh the treemap from the merged cube, keeping the clicked root
+@app.callback(
+    Output('treemap-chart', 'figure', allow_duplicate=True),
+    Input('live-store', 'data'),
+    [State('treemap-dropdown', 'value'), State('treemap-chart', 'clickData'), State('store', 'data')],
+    prevent_initial_call = True
+)
+def refresh_treemap_chart(live_state, selected_value, click_data, data):
+    root_id = click_data['points'][0].get('id') if click_data else None
+    return get_treemap_figure(data, selected_value, root_id)
+
+# Callback to add the new blocks of the selected ledgers to the network graph
+@app.callback(
+    Output( 'network-gragh', 'elements', allow_duplicate=True ),
+    Input( 'live-store', 'data' ),
+    State( 'source-dropdown', 'value' ),
+    prevent_initial_call = True
+)
+def extendNetworkGraph( live_state, sources ):
+    updates = get_live_updates( live_state[ 'from' ], live_state[ 'to' ] )
+    if updates is None: return figure_cache.get_or_create( ( None, 'network-overview', ( live_version, ) + tuple( sources or () ) ), lambda: get_source_overview_elements( sources ) )
+    elements = [ element for update in updates for source, source_elements in update[ 'elements' ].items() if not sources or source in sources for element in source_elements ]
+    if len( elements ) == 0: return dash.no_update
+    patch = Patch()
+    patch.extend( elements )
+    return patch
+
+# ----------------------------------------------------------------- #
+# Anomaly detection: incoming FTIR spectra are scored in batches against
+# the PCA model of the default options of the 'Spectra PCA' tab (Hotelling
+# T2 and Q residuals, see AnomalyMonitor). The incoming file is read at
+# startup and polled with the ledgers in live mode; the spectra outside the
+# control limits are listed in 'alert_spectra'
+# ----------------------------------------------------------------- #
+ANOMALY_STAGES = []
+ANOMALY_SCALING = 'centre'
+ANOMALY_MAX_LISTED = 20
+
+spectra_tail = SpectraTail(SPECTRA_INCOMING_PATH)
+spectra_lock = threading.Lock()
+spectra_scored = 0
+spectra_anomalies = []  # (sample id, T2, Q) of the out-of-control spectra, in order of arrival
+
+# Monitor of the model, cached with it in analysis_cache
+def get_anomaly_monitor():
+    def build_anomaly_monitor():
+        model, wavenumbers = get_spectra_pca(ANOMALY_STAGES, ANOMALY_SCALING)
+        values, pipeline = get_preprocessed(ANOMALY_STAGES)
+        return AnomalyMonitor(model, values, pipeline, spectra.wavenumbers)
+    return analysis_cache.get_or_create((spectra.key, 'anomaly-monitor', (PreprocessingPipeline(ANOMALY_STAGES).key(), ANOMALY_SCALING)), build_anomaly_monitor)
+
+# Score the spectra appended since the previous poll. Returns the number
+# of new out-of-control spectra
+def apply_spectra_update():
+    global spectra_scored
+    if spectra is None: return 0
+    with spectra_lock:
+        new_spectra = spectra_tail.poll()
+        if new_spectra is None: return 0
+        samples, values, wavenumbers = new_spectra
+        if not np.array_equal(wavenumbers, spectra.wavenumbers):
+            print('Incoming spectra skipped: their wavenumbers differ from', SPECTRA_PATH)
+            return 0
+        t2, q, out_of_control = get_anomaly_monitor().score(values)
+        spectra_anomalies.extend(zip(samples[out_of_control].tolist(), t2[out_of_control].tolist(), q[out_of_control].tolist()))
+        spectra_scored += len(samples)
+        print('Scored', len(samples), 'incoming spectra:', int(out_of_control.sum()), 'out of control')
+        return int(out_of_control.sum())
+
+# Text of the spectra alert (the latest out-of-control spectra)
+def get_spectra_alert_message():
+    listed = [f"('{sample}', T2 {t2:.1f}, Q {q:.3g})" for sample, t2, q in spectra_anomalies[-ANOMALY_MAX_LISTED:]]
+    return (f"Warning: {len(spectra_anomalies)} of {spectra_scored} incoming spectra are outside the {ANOMALY_CONFIDENCE:.0%} control limits of the spectra PCA model"
+            f"{' (latest shown)' if len(spectra_anomalies) > ANOMALY_MAX_LISTED else ''}: {', '.join(listed)}")
+
+# Score the incoming spectra present at startup
+if os.path.exists(SPECTRA_INCOMING_PATH): apply_spectra_update()
+
+# Callback to score new spectra in live mode, and to show the spectra alert
+# if some are out of control (hidden in 'tab2')
+@app.callback(
+    [Output('alert_spectra', 'children'), Output('alert_spectra', 'is_open')],
+    [Input('live-interval', 'n_intervals'), Input('main-tabs', 'active_tab')]
+)
+def update_spectra_alert(n_intervals, active_tab):
+    if dash.callback_context.triggered_id == 'live-interval' and apply_spectra_update() == 0: return dash.no_update, dash.no_update
+    return get_spectra_alert_message(), len(spectra_anomalies) > 0 and active_tab != 'tab2'
+
+# Hit/miss counters of the server-side caches, to check them under load
+@app.server.route('/cache-stats')
+def cache_stats():
+    return {
+        'dataset' : dataset_cache.memory.stats(),
+        'figure'  : figure_cache.stats()
+    }
 
+# Machine-readable report of the ledger integrity check
+@app.server.route('/integrity-report')
+def integrity_report_route():
+    return integrity_report
 
 # Run the app
 if __name__ == '__main__':
@@ -0,0 +1,91 @@
+
+# Import libraries
+import numpy as np                                          # For the CSR link index
+import pandas as pd                                         # For the sample id lookup
+from   cache_util import LRUCache                           # For the bounded cache of loaded experiments
+from   graph_util import GrowingArray                       # For appending the links of new blocks
+
+# ----------------------------------------------------------------- #
+#                      LINKED EXPERIMENT INDEX                      #
+# ----------------------------------------------------------------- #
+
+# A 'LinkedExperiments' entry names the sample of an experiment: either a
+# sample id (e.g. '1A1', as in the FTIR and microbial files) or a record
+# holding it under one of these keys
+EXPERIMENT_SAMPLE_KEYS = [ 'Sample', 'SampleID', 'ExperimentID' ]
+
+# Sample ids of a 'LinkedExperiments' value (a list, or None if missing)
+def experiment_sample_ids( links ):
+    if links is None or not isinstance( links, ( list, tuple, np.ndarray ) ): return []
+    sample_ids = []
+    for link in links:
+        if isinstance( link, dict ):
+            link = next( ( link[ key ] for key in EXPERIMENT_SAMPLE_KEYS if link.get( key ) is not None ), None )
+        if link is not None and str( link ) != '': sample_ids.append( str( link ) )
+    return sample_ids
+
+# Linked sample ids of every block, in CSR form: the samples of block i are
+# sample_ids[ offsets[ i ] : offsets[ i + 1 ] ]. Blocks are numbered like
+# GraphIndex (the rows of 'branches'), and new blocks are appended in
+# live mode (the arrays grow in place, so this costs O( new blocks )).
+# Only ids are indexed; the data are loaded by ExperimentLoader.
+class ExperimentLinkIndex:
+    def __init__( self, links = () ):
+        self.offsets    = GrowingArray( [ 0 ], np.int64 )
+        self.sample_ids = GrowingArray( [],    object   )
+        self.extend( links )
+
+    def __len__( self ):
+        return len( self.offsets ) - 1
+
+    # Index the links of new blocks
+    def extend( self, links ):
+        sample_ids = [ experiment_sample_ids( value ) for value in links ]
+        counts     = np.fromiter( ( len( ids ) for ids in sample_ids ), dtype = np.int64, count = len( sample_ids ) )
+        self.offsets   .append( self.offsets.values()[ -1 ] + np.cumsum( counts ) )
+        self.sample_ids.append( [ sample_id for ids in sample_ids for sample_id in ids ] )
+
+    # Sample ids linked to a block (empty if none, or if the block is unknown)
+    def links( self, block_id ):
+        if block_id < 0 or block_id >= len( self ): return []
+        offsets = self.offsets.values()
+        return self.sample_ids.values()[ offsets[ block_id ] : offsets[ block_id + 1 ] ].tolist()
+
+    # Number of blocks with at least one link
+    def linked_blocks( self ):
+        return int( np.count_nonzero( np.diff( self.offsets.values() ) ) )
+
+# ----------------------------------------------------------------- #
+#                       LAZY EXPERIMENT LOADING                     #
+# ----------------------------------------------------------------- #
+
+# Experiments kept in memory once loaded
+EXPERIMENT_CACHE_ENTRIES = 256
+
+# Load the data of linked samples on demand: their FTIR spectra (copied out
+# of the memory-mapped SpectraDataset, so only the pages of inspected
+# samples are read) and their microbial counts (a row of a sample table,
+# see model_util.read_sample_table). Either source may be None. Loaded
+# samples are kept in a bounded LRU cache, so repeated lookups are free and
+# memory does not grow with the number of samples inspected.
+class ExperimentLoader:
+    def __init__( self, spectra = None, sample_table = None, max_entries = EXPERIMENT_CACHE_ENTRIES ):
+        self.spectra      = spectra
+        self.sample_table = sample_table
+        self.cache        = LRUCache( max_entries )
+
+    # Data of a sample id:
+    #   'spectra'     : ( replicates x wavenumbers ) array, empty if none
+    #   'wavenumbers' : wavenumbers of the spectra
+    #   'counts'      : { column : value } of the sample table, or None
+    def load( self, sample_id ):
+        return self.cache.get_or_create( sample_id, lambda: self.read( sample_id ) )
+
+    def read( self, sample_id ):
+        spectra, wavenumbers, counts = np.zeros( ( 0, 0 ), dtype = np.float32 ), np.zeros( 0 ), None
+        if self.spectra is not None:
+            spectra, wavenumbers = np.array( self.spectra.sample_spectra( sample_id ) ), self.spectra.wavenumbers
+        if self.sample_table is not None and sample_id in self.sample_table.index:
+            row    = self.sample_table.loc[ sample_id ]
+            counts = { column : ( None if pd.isna( value ) else value ) for column, value in row.items() }
+        return { 'spectra' : spectra, 'wavenumbers' : wavenumbers, 'counts' : counts }
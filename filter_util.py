@@ -0,0 +1,114 @@
+
+# Import libraries
+import numpy as np                                          # For boolean masks over node attributes
+import pandas as pd                                         # For the node attribute table
+
+# ----------------------------------------------------------------- #
+#                         NODE ATTRIBUTE TABLE                      #
+# ----------------------------------------------------------------- #
+
+# Node attributes which can be filtered, and how they are typed
+NODE_NUMERIC_FIELDS     = [ 'temperature_integer', 'weight_integer' ]
+NODE_CATEGORICAL_FIELDS = [ 'owner', 'product_name', 'product_id', 'location' ]
+NODE_DATE_FIELDS        = [ 'timestamp' ]
+
+# Build a column table of node attributes from Cytoscape node elements.
+# Filters are evaluated over these columns instead of over the elements.
+# Column-backed node records are read column by column.
+def build_node_table( nodes ):
+    columns = [ 'id' ] + NODE_NUMERIC_FIELDS + NODE_CATEGORICAL_FIELDS + NODE_DATE_FIELDS
+    if hasattr( nodes, 'column' ):
+        table = pd.DataFrame( { column : nodes.column( column ) for column in columns }, columns = columns )
+    else:
+        table = pd.DataFrame( [ node[ 'data' ] for node in nodes ], columns = columns )
+    for field in NODE_NUMERIC_FIELDS:
+        table[ field ] = pd.to_numeric( table[ field ], errors = 'coerce' )
+    for field in NODE_DATE_FIELDS:
+        table[ field ] = pd.to_datetime( table[ field ], errors = 'coerce', utc = True ).dt.tz_localize( None )
+    return table
+
+# ----------------------------------------------------------------- #
+#                           FILTER MODEL                            #
+# ----------------------------------------------------------------- #
+
+# Comparison operators of a filter condition
+FILTER_OPERATORS = {
+    '>'  : np.greater,
+    '>=' : np.greater_equal,
+    '<'  : np.less,
+    '<=' : np.less_equal,
+    '='  : np.equal,
+    '!=' : np.not_equal
+}
+
+# One condition on a node attribute, e.g. ( 'temperature_integer', '>', 5 ).
+# Besides the comparison operators, 'between' takes ( low, high ) and keeps
+# low <= value <= high, and 'in' takes a list of accepted values.
+class FilterCondition:
+    def __init__( self, field, operator, value ):
+        if operator not in FILTER_OPERATORS and operator not in [ 'between', 'in' ]:
+            raise ValueError( 'Unknown filter operator: ' + str( operator ) )
+        self.field    = field
+        self.operator = operator
+        self.value    = value
+
+    # Convert the filter value to the type of the column
+    def convert( self, column, value ):
+        if pd.api.types.is_datetime64_any_dtype( column ): return pd.Timestamp( value )
+        if pd.api.types.is_numeric_dtype( column ):        return float( value )
+        return value
+
+    # Boolean mask of the nodes matching the condition
+    def evaluate( self, table ):
+        column = table[ self.field ]
+        if self.operator == 'in':
+            return column.isin( [ self.convert( column, value ) for value in self.value ] ).to_numpy()
+        if self.operator == 'between':
+            low, high = self.convert( column, self.value[ 0 ] ), self.convert( column, self.value[ 1 ] )
+            return ( ( column >= low ) & ( column <= high ) ).to_numpy()
+        return FILTER_OPERATORS[ self.operator ]( column, self.convert( column, self.value ) ).to_numpy( dtype = bool )
+
+    def __repr__( self ):
+        return 'FilterCondition(' + repr( self.field ) + ', ' + repr( self.operator ) + ', ' + repr( self.value ) + ')'
+
+# Conditions (or nested expressions) combined with 'and' or 'or'
+class FilterExpression:
+    def __init__( self, conditions, combine = 'and' ):
+        if combine not in [ 'and', 'or' ]: raise ValueError( 'Unknown filter combination: ' + str( combine ) )
+        self.conditions = list( conditions )
+        self.combine    = combine
+
+    def is_empty( self ):
+        return len( self.conditions ) == 0
+
+    # Boolean mask of the nodes matching the expression.
+    # An empty expression matches no node (nothing is highlighted).
+    def evaluate( self, table ):
+        if self.is_empty(): return np.zeros( len( table ), dtype = bool )
+        masks = [ condition.evaluate( table ) for condition in self.conditions ]
+        if self.combine == 'and': return np.logical_and.reduce( masks )
+        return np.logical_or.reduce( masks )
+
+    def __repr__( self ):
+        return 'FilterExpression(' + repr( self.conditions ) + ', ' + repr( self.combine ) + ')'
+
+# ----------------------------------------------------------------- #
+#                          FILTER RENDERING                         #
+# ----------------------------------------------------------------- #
+
+# Selector which matches no node
+NO_MATCH_SELECTOR = '[id = "__no_match__"]'
+
+# Ids of the nodes matching the expression
+def highlighted_node_ids( expression, table ):
+    return table[ 'id' ].to_numpy()[ expression.evaluate( table ) ].tolist()
+
+# Render node ids as a Cytoscape selector
+def node_ids_to_selector( node_ids ):
+    if len( node_ids ) == 0: return NO_MATCH_SELECTOR
+    return ', '.join( '[id = "' + str( node_id ) + '"]' for node_id in node_ids )
+
+# Render ( source, target ) pairs as a Cytoscape edge selector
+def edge_pairs_to_selector( pairs ):
+    if len( pairs ) == 0: return NO_MATCH_SELECTOR
+    return ', '.join( 'edge[source = "' + str( source ) + '"][target = "' + str( target ) + '"]' for source, target in pairs )
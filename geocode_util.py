@@ -0,0 +1,193 @@
+
+# Import libraries
+import json                                                 # For reading and writing the cache file
+import os                                                   # For checking and replacing the cache file
+import time                                                 # For cache entry time stamps
+import numpy as np                                          # For building coordinate columns
+import pandas as pd                                         # For factorising location names
+
+# ----------------------------------------------------------------- #
+#                          GEOCODE CACHE                            #
+# ----------------------------------------------------------------- #
+
+# Default cache file, entry life time (30 days) and cache size
+GEOCODE_CACHE_PATH        = './geocode_cache.json'
+GEOCODE_CACHE_TTL         = 30 * 24 * 60 * 60
+GEOCODE_CACHE_MAX_ENTRIES = 10000
+
+# On-disk cache of geocoding results.
+# Each entry maps a location name to [ latitude, longitude, time stamp ].
+# Names which could not be geocoded are kept as [ None, None, time stamp ]
+# so that they are not looked up again until the entry expires.
+class GeocodeCache:
+    def __init__( self, path = GEOCODE_CACHE_PATH, ttl = GEOCODE_CACHE_TTL, max_entries = GEOCODE_CACHE_MAX_ENTRIES ):
+        self.path        = path
+        self.ttl         = ttl
+        self.max_entries = max_entries
+        self.entries     = {}
+        if path is not None and os.path.exists( path ):
+            try:
+                with open( path ) as file: self.entries = json.load( file )
+            except ( OSError, ValueError ):
+                print( 'Geocode cache is broken, start with an empty one:', path )
+                self.entries = {}
+
+    # Return ( latitude, longitude ) of the location, or None if the
+    # location is not cached or the entry has expired
+    def get( self, name, now = None ):
+        entry = self.entries.get( name )
+        if entry is None: return None
+        if now is None: now = time.time()
+        if now - entry[ 2 ] > self.ttl:
+            del self.entries[ name ]
+            return None
+        return entry[ 0 ], entry[ 1 ]
+
+    # Add resolved locations. 'results' maps name to ( latitude, longitude )
+    def update( self, results, now = None ):
+        if now is None: now = time.time()
+        for name, ( latitude, longitude ) in results.items():
+            self.entries[ name ] = [ latitude, longitude, now ]
+
+        # Evict the oldest entries if the cache is too large
+        if len( self.entries ) > self.max_entries:
+            names = sorted( self.entries, key = lambda name: self.entries[ name ][ 2 ] )
+            for name in names[ : len( self.entries ) - self.max_entries ]: del self.entries[ name ]
+
+    # Write the cache file. The file is replaced atomically so that a
+    # crash while writing never leaves a broken cache behind
+    def save( self ):
+        if self.path is None: return
+        temporary_path = self.path + '.tmp'
+        with open( temporary_path, 'w' ) as file: json.dump( self.entries, file )
+        os.replace( temporary_path, self.path )
+
+# ----------------------------------------------------------------- #
+#                         LOCAL GEOCODERS                           #
+# ----------------------------------------------------------------- #
+
+# Result object with the same attributes as geopy.location.Location
+class StaticLocation:
+    def __init__( self, latitude, longitude ):
+        self.latitude  = latitude
+        self.longitude = longitude
+
+# Stand-in geocoder answering from a dictionary of name to
+# ( latitude, longitude ). It has the same geocode() interface as
+# geopy's Nominatim, so the dashboard can run without network.
+class StaticGeocoder:
+    def __init__( self, coordinates ):
+        self.coordinates = coordinates
+        self.calls       = 0
+
+    def geocode( self, name ):
+        self.calls += 1
+        coordinate  = self.coordinates.get( name )
+        if coordinate is None: return None
+        return StaticLocation( coordinate[ 0 ], coordinate[ 1 ] )
+
+# ----------------------------------------------------------------- #
+#                         OFFLINE GAZETTEER                         #
+# ----------------------------------------------------------------- #
+
+# Default gazetteer file bundled with the dashboard
+GAZETTEER_PATH = './gazetteer.csv'
+
+# Normalise place names so that 'Listowel, Co. Kerry, Ireland' and
+# 'listowel co kerry ireland' are the same key
+def normalise_place_names( names ):
+    result = pd.Series( names, dtype = object ).fillna( '' ).astype( str )
+    result = result.str.lower().str.replace( r'[^\w]+', ' ', regex = True ).str.strip()
+    return result
+
+# Table of place name to coordinates, indexed by normalised name
+class Gazetteer:
+    def __init__( self, names, latitudes, longitudes ):
+        keys             = normalise_place_names( names )
+        # Keep the first entry if a normalised name appears twice
+        first            = ~keys.duplicated().to_numpy()
+        self.index       = pd.Index( keys[ first ] )
+        self.coordinates = np.column_stack( [
+            np.asarray( latitudes,  dtype = float )[ first ],
+            np.asarray( longitudes, dtype = float )[ first ]
+        ] )
+
+    # Load a CSV file with 'Location', 'Latitude' and 'Longitude' columns
+    @classmethod
+    def from_csv( cls, path = GAZETTEER_PATH ):
+        table = pd.read_csv( path )
+        return cls( table[ 'Location' ], table[ 'Latitude' ], table[ 'Longitude' ] )
+
+    def __len__( self ):
+        return len( self.index )
+
+    # Look up many names at once. Returns latitude and longitude arrays,
+    # NaN where the name is not in the gazetteer
+    def lookup( self, names ):
+        positions = self.index.get_indexer( normalise_place_names( names ) )
+        # The extra last row is NaN, so position -1 (not found) points at it
+        table     = np.vstack( [ self.coordinates, [ np.nan, np.nan ] ] )
+        return table[ positions, 0 ], table[ positions, 1 ]
+
+# ----------------------------------------------------------------- #
+#                           GEOCODING                               #
+# ----------------------------------------------------------------- #
+
+# Resolve location names to coordinates with the geocoder.
+# Errors (e.g. no network) are reported and the name is left unresolved.
+def resolve_locations( names, geocoder ):
+    result = {}
+    for name in names:
+        try:
+            location = geocoder.geocode( name )
+        except Exception as error:
+            print( 'Failed to geocode', name, ':', error )
+            continue
+        if location: result[ name ] = ( location.latitude, location.longitude )
+        else:        result[ name ] = ( None, None )
+    return result
+
+# Convert a column of location names into 'Latitude' and 'Longitude'
+# columns. Every distinct name is looked up once: names in the gazetteer
+# are resolved offline, cached names are served from the cache, and only
+# the remaining misses go to the geocoder (skipped if geocoder is None).
+def geocode_locations( locations, geocoder, cache = None, gazetteer = None ):
+    codes, unique_names = pd.factorize( locations )
+    coordinates = {}
+
+    # Look up the gazetteer at the first place
+    if gazetteer is not None:
+        latitudes, longitudes = gazetteer.lookup( unique_names )
+        for name, latitude, longitude in zip( unique_names, latitudes, longitudes ):
+            if not np.isnan( latitude ): coordinates[ name ] = ( latitude, longitude )
+
+    # Then, look up the cache
+    missing = []
+    for name in unique_names:
+        if name in coordinates: continue
+        coordinate = cache.get( name ) if cache is not None else None
+        if coordinate is None: missing.append( name )
+        else:                  coordinates[ name ] = coordinate
+
+    # Finally, resolve misses in one batch and store them
+    if len( missing ) > 0 and geocoder is not None:
+        resolved = resolve_locations( missing, geocoder )
+        coordinates.update( resolved )
+        if cache is not None:
+            cache.update( resolved )
+            cache.save()
+
+    # Build coordinate arrays per distinct name, then expand them by codes
+    # The extra last row stays NaN, so code -1 (missing name) points at it
+    unique_coordinates = np.full( ( len( unique_names ) + 1, 2 ), np.nan )
+    for i, name in enumerate( unique_names ):
+        latitude, longitude = coordinates.get( name, ( None, None ) )
+        if latitude is not None: unique_coordinates[ i ] = ( latitude, longitude )
+
+    return pd.DataFrame(
+        {
+            'Latitude'  : unique_coordinates[ codes, 0 ],
+            'Longitude' : unique_coordinates[ codes, 1 ]
+        },
+        index = locations.index
+    )
@@ -0,0 +1,546 @@
+
+# Import libraries
+import sys                                                  # For command line arguments
+import time                                                 # For layout benchmark
+import numpy as np                                          # For array-based graph traversal
+import pandas as pd                                         # For hash to integer id mapping
+
+# ----------------------------------------------------------------- #
+#                         HASH CHAIN INDEX                          #
+# ----------------------------------------------------------------- #
+
+# Index of distinct keys which new keys can be appended to (live mode).
+# New keys go to a dictionary, which is merged into the pandas index once it
+# holds a tenth of it, so appending k keys costs O(k) amortised instead of
+# re-hashing all the keys every time.
+class GrowingIndex:
+    def __init__( self, keys ):
+        self.index    = pd.Index( keys, dtype = object )
+        self.appended = {}
+
+    def __len__( self ):
+        return len( self.index ) + len( self.appended )
+
+    # Code of every value, or -1 if unknown
+    def get_indexer( self, values ):
+        values = np.asarray( values, dtype = object )
+        found  = self.index.get_indexer( values )
+        if len( self.appended ) > 0:
+            missing          = np.flatnonzero( found < 0 )
+            found[ missing ] = [ self.appended.get( value, -1 ) for value in values[ missing ].tolist() ]
+        return found
+
+    # Append new distinct keys, coded len( self ), len( self ) + 1, ...
+    def append( self, keys ):
+        for key in keys: self.appended[ key ] = len( self )
+        if len( self.appended ) > max( 1024, len( self.index ) // 10 ):
+            self.index    = self.keys()
+            self.appended = {}
+
+    # All the keys, in code order
+    def keys( self ):
+        if len( self.appended ) == 0: return self.index
+        return self.index.append( pd.Index( list( self.appended.keys() ), dtype = object ) )
+
+# Array which new values can be appended to (live mode). The values are
+# kept in a buffer whose capacity doubles when it is full, so appending k
+# values costs O( k ) amortised instead of copying the whole array.
+class GrowingArray:
+    def __init__( self, values, dtype ):
+        self.buffer = np.array( values, dtype = dtype )
+        self.size   = len( self.buffer )
+
+    def __len__( self ):
+        return self.size
+
+    # Append values at the end
+    def append( self, values ):
+        values = np.asarray( values, dtype = self.buffer.dtype )
+        end    = self.size + len( values )
+        if end > len( self.buffer ):
+            buffer = np.empty( max( end, 2 * len( self.buffer ), 16 ), dtype = self.buffer.dtype )
+            buffer[ : self.size ] = self.buffer[ : self.size ]
+            self.buffer = buffer
+        self.buffer[ self.size : end ] = values
+        self.size = end
+
+    # The values (a view of the buffer, valid until the next append)
+    def values( self ):
+        return self.buffer[ : self.size ]
+
+# Map block hashes to integer ids 0..n-1 (their positions) and return the
+# parent id of every block (-1 for the genesis block or an unknown previous
+# hash). If a hash appears twice, its first block is used as the parent.
+# Also returns the distinct hashes and the position of their first block,
+# to look up more hashes later.
+def build_parent_index( hashes, previous_hashes ):
+    codes, unique_hashes = pd.factorize( np.asarray( hashes, dtype = object ) )
+    first_positions      = np.unique( codes, return_index = True )[ 1 ]
+    found                = pd.Index( unique_hashes ).get_indexer( np.asarray( previous_hashes, dtype = object ) )
+    parents              = np.where( found >= 0, first_positions[ found ], -1 )
+    return pd.Index( unique_hashes ), first_positions.astype( np.int64 ), parents.astype( np.int64 )
+
+# Compressed (CSR) child lists: children of block i are
+# child_ids[ child_offsets[ i ] : child_offsets[ i + 1 ] ]
+def build_child_index( parents ):
+    n             = len( parents )
+    has_parent    = parents >= 0
+    child_ids     = np.flatnonzero( has_parent )
+    child_ids     = child_ids[ np.argsort( parents[ child_ids ], kind = 'stable' ) ]
+    counts        = np.bincount( parents[ has_parent ], minlength = n )
+    child_offsets = np.zeros( n + 1, dtype = np.int64 )
+    np.cumsum( counts, out = child_offsets[ 1 : ] )
+    return child_offsets, child_ids
+
+# Children of all the blocks in 'frontier', in the order of the frontier
+def gather_children( frontier, child_offsets, child_ids ):
+    starts  = child_offsets[ frontier     ]
+    lengths = child_offsets[ frontier + 1 ] - starts
+    if lengths.sum() == 0: return np.zeros( 0, dtype = np.int64 )
+    # Positions start, start+1, ... for every frontier block, without a Python loop
+    offsets = np.repeat( starts - np.cumsum( lengths ) + lengths, lengths )
+    return child_ids[ offsets + np.arange( lengths.sum() ) ]
+
+# Add items to CSR lists: 'items' (sorted by 'groups') are appended to the
+# end of the lists of their groups, and the lists are extended to
+# 'group_count' groups. Returns the new offsets and values.
+def insert_grouped( offsets, values, groups, items, group_count ):
+    offsets = np.concatenate( [ offsets, np.full( group_count + 1 - len( offsets ), offsets[ -1 ] ) ] )
+    values  = np.insert( values, offsets[ groups + 1 ], items )
+    added   = np.zeros( group_count + 1, dtype = np.int64 )
+    np.cumsum( np.bincount( groups, minlength = group_count ), out = added[ 1 : ] )
+    return offsets + added, values
+
+# Blocks grouped by a key (e.g. their product id), in CSR form: blocks of
+# the i-th key are block_ids[ offsets[ i ] : offsets[ i + 1 ] ], in block
+# id order. Blocks without a key are left out.
+def build_group_index( values ):
+    codes, keys = pd.factorize( np.asarray( values, dtype = object ) )
+    block_ids   = np.argsort( codes, kind = 'stable' )
+    # Blocks without key (code -1) come first after sorting
+    block_ids   = block_ids[ np.count_nonzero( codes < 0 ) : ]
+    offsets     = np.zeros( len( keys ) + 1, dtype = np.int64 )
+    np.cumsum( np.bincount( codes[ codes >= 0 ], minlength = len( keys ) ), out = offsets[ 1 : ] )
+    return pd.Index( keys ), block_ids, offsets
+
+# Levels of a descendant search smaller than this are expanded with scalars
+TRACE_SCALAR_FRONTIER = 32
+
+# Lineage index of the hash chain, built once per dataset version.
+# Block ids are the positions of the blocks in 'hashes' (the order of the
+# node elements), so id i is also the index of its Cytoscape node.
+# Besides the parent pointers and child lists, blocks are indexed by the
+# product columns which are given ('ProductID', 'PreviousProductID',
+# 'RootProductID') and by ledger ('source'), so that products can be
+# looked up without a scan.
+class GraphIndex:
+    def __init__( self, hashes, previous_hashes, root_product_ids = None, product_ids = None, previous_product_ids = None, source_ids = None ):
+        hashes          = np.asarray( hashes,          dtype = object )
+        previous_hashes = np.asarray( previous_hashes, dtype = object )
+        unique_hashes, hash_positions, parents = build_parent_index( hashes, previous_hashes )
+        self.arrays = {
+            'hashes'          : GrowingArray( hashes,          object   ),
+            'previous_hashes' : GrowingArray( previous_hashes, object   ),
+            'parents'         : GrowingArray( parents,         np.int64 ),
+            'hash_positions'  : GrowingArray( hash_positions,  np.int64 )
+        }
+        self.hash_lookup = GrowingIndex( unique_hashes )
+        self.children    = build_child_index( parents )
+        self.groups      = {}
+        for column, values in [ ( 'RootProductID', root_product_ids ), ( 'ProductID', product_ids ), ( 'PreviousProductID', previous_product_ids ), ( 'source', source_ids ) ]:
+            if values is not None:
+                keys, block_ids, offsets = build_group_index( values )
+                self.groups[ column ]    = ( GrowingIndex( keys ), block_ids, offsets )
+
+        # Blocks appended in live mode, as ( group codes, block ids ) parts
+        # which are merged into the child lists and groups when they are
+        # next read (see merge_pending)
+        self.pending_children = []
+        self.pending_groups   = { column : [] for column in self.groups }
+
+    def __len__( self ):
+        return len( self.arrays[ 'parents' ] )
+
+    @property
+    def hashes( self ):
+        return self.arrays[ 'hashes' ].values()
+
+    @property
+    def previous_hashes( self ):
+        return self.arrays[ 'previous_hashes' ].values()
+
+    @property
+    def parents( self ):
+        return self.arrays[ 'parents' ].values()
+
+    @property
+    def hash_positions( self ):
+        return self.arrays[ 'hash_positions' ].values()
+
+    # Compressed child lists (see build_child_index)
+    @property
+    def child_offsets( self ):
+        return self.child_index()[ 0 ]
+
+    @property
+    def child_ids( self ):
+        return self.child_index()[ 1 ]
+
+    # Merge ( group codes, block ids ) parts into CSR lists of 'group_count'
+    # groups. New items go to the end of their group's list, which keeps
+    # every list in block id order.
+    @staticmethod
+    def merge_pending( offsets, values, parts, group_count ):
+        groups = np.concatenate( [ groups for groups, items in parts ] )
+        items  = np.concatenate( [ items  for groups, items in parts ] )
+        order  = np.argsort( groups, kind = 'stable' )
+        return insert_grouped( offsets, values, groups[ order ], items[ order ], group_count )
+
+    def child_index( self ):
+        offsets, child_ids = self.children
+        if len( self.pending_children ) > 0 or len( offsets ) != len( self ) + 1:
+            parts = self.pending_children or [ ( np.zeros( 0, dtype = np.int64 ), np.zeros( 0, dtype = np.int64 ) ) ]
+            self.children         = self.merge_pending( offsets, child_ids, parts, len( self ) )
+            self.pending_children = []
+        return self.children
+
+    # ( keys, block ids, offsets ) of an indexed column
+    def group_index( self, column ):
+        keys, block_ids, offsets = self.groups[ column ]
+        if len( self.pending_groups[ column ] ) > 0:
+            offsets, block_ids            = self.merge_pending( offsets, block_ids, self.pending_groups[ column ], len( keys ) )
+            self.groups[ column ]         = ( keys, block_ids, offsets )
+            self.pending_groups[ column ] = []
+        return self.groups[ column ]
+
+    # Block ids of hashes (the first block of a duplicate hash), -1 if unknown
+    def block_ids( self, block_hashes ):
+        found = self.hash_lookup.get_indexer( block_hashes )
+        return np.where( found >= 0, self.hash_positions[ found ], -1 )
+
+    # Block id of a hash, or -1 if unknown
+    def block_id( self, block_hash ):
+        return int( self.block_ids( [ block_hash ] )[ 0 ] )
+
+    # Distinct values of an indexed column ( 'ProductID', ... )
+    def group_keys( self, column ):
+        if column not in self.groups: return pd.Index( [] )
+        return self.groups[ column ][ 0 ].keys()
+
+    # Codes of values of an indexed column, -1 for values not indexed yet
+    def group_codes( self, column, values ):
+        if column not in self.groups: return np.full( len( values ), -1 )
+        return self.groups[ column ][ 0 ].get_indexer( values )
+
+    # Block ids whose 'column' is 'value'
+    def group_blocks( self, column, value ):
+        if column not in self.groups: return np.zeros( 0, dtype = np.int64 )
+        keys, block_ids, offsets = self.group_index( column )
+        code = keys.get_indexer( [ value ] )[ 0 ]
+        if code < 0: return np.zeros( 0, dtype = np.int64 )
+        return block_ids[ offsets[ code ] : offsets[ code + 1 ] ]
+
+    # Append new blocks (live mode), with the same product columns as the
+    # index was built with. Only the new blocks are hashed and looked up:
+    # the arrays grow in place (see GrowingArray), and the new children and
+    # group members are kept aside until the child lists or groups are
+    # read, so a poll costs O( new blocks ) whatever the size of the chain.
+    # Returns the ids of the new blocks.
+    def extend( self, hashes, previous_hashes, root_product_ids = None, product_ids = None, previous_product_ids = None, source_ids = None ):
+        hashes          = np.asarray( hashes,          dtype = object )
+        previous_hashes = np.asarray( previous_hashes, dtype = object )
+        n, k            = len( self ), len( hashes )
+        new_ids         = np.arange( n, n + k, dtype = np.int64 )
+
+        # Register the new distinct hashes, then look up the parents (which
+        # may be new blocks as well)
+        codes, unique_hashes = pd.factorize( hashes )
+        first_positions      = np.unique( codes, return_index = True )[ 1 ]
+        unknown              = self.hash_lookup.get_indexer( unique_hashes ) < 0
+        self.hash_lookup.append( unique_hashes[ unknown ].tolist() )
+        self.arrays[ 'hash_positions'  ].append( n + first_positions[ unknown ] )
+        self.arrays[ 'hashes'          ].append( hashes )
+        self.arrays[ 'previous_hashes' ].append( previous_hashes )
+        new_parents = self.block_ids( previous_hashes )
+        self.arrays[ 'parents'         ].append( new_parents )
+
+        has_parent = new_parents >= 0
+        self.pending_children.append( ( new_parents[ has_parent ], new_ids[ has_parent ] ) )
+
+        for column, values in [ ( 'RootProductID', root_product_ids ), ( 'ProductID', product_ids ), ( 'PreviousProductID', previous_product_ids ), ( 'source', source_ids ) ]:
+            if column not in self.groups or values is None: continue
+            keys        = self.groups[ column ][ 0 ]
+            values      = np.asarray( values, dtype = object )
+            value_codes = pd.factorize( values )[ 0 ]
+            # Blocks without a key (code -1) are not grouped
+            values      = values[ value_codes >= 0 ]
+            new_keys    = pd.unique( values )
+            new_keys    = new_keys[ keys.get_indexer( new_keys ) < 0 ]
+            keys.append( new_keys.tolist() )
+            self.pending_groups[ column ].append( ( keys.get_indexer( values ), new_ids[ value_codes >= 0 ] ) )
+
+        return new_ids
+
+    # Block ids of a root product
+    def root_product_blocks( self, root_product_id ):
+        return self.group_blocks( 'RootProductID', root_product_id )
+
+    # Block ids of a product
+    def product_blocks( self, product_id ):
+        return self.group_blocks( 'ProductID', product_id )
+
+    # Block ids of the products made from a product
+    def derived_product_blocks( self, product_id ):
+        return self.group_blocks( 'PreviousProductID', product_id )
+
+    # Ancestors of the given blocks, from their parents up to the genesis
+    # block. Only the paths are visited: a walk stops at a block which has
+    # already been reached (a shared part of the path, or a cycle).
+    def ancestors( self, block_ids ):
+        block_ids = np.atleast_1d( np.asarray( block_ids, dtype = np.int64 ) ).tolist()
+        result    = []
+        visited   = set( block_ids )
+        for block_id in block_ids:
+            parent = int( self.parents[ block_id ] )
+            while parent >= 0 and parent not in visited:
+                result.append( parent )
+                visited.add( parent )
+                parent = int( self.parents[ parent ] )
+        return np.array( result, dtype = np.int64 )
+
+    # All descendants of the given blocks, level by level through the child
+    # lists. Visited blocks are flagged in a mask, so a level costs O( its
+    # size ). Small levels (e.g. along linear chains, the usual shape of a
+    # product's events) are expanded with scalars rather than a numpy round,
+    # whose fixed cost would otherwise be paid once per block of depth.
+    # The cost is O( number of descendants ).
+    def descendants( self, block_ids ):
+        block_ids = np.unique( np.asarray( block_ids, dtype = np.int64 ) )
+        child_offsets, child_ids = self.child_index()
+        result    = []
+        visited   = np.zeros( len( self ), dtype = bool )
+        visited[ block_ids ] = True
+        frontier  = block_ids.tolist()
+        while len( frontier ) > 0:
+            if len( frontier ) < TRACE_SCALAR_FRONTIER:
+                found = []
+                for block in frontier:
+                    for child in child_ids[ child_offsets[ block ] : child_offsets[ block + 1 ] ].tolist():
+                        if visited[ child ]: continue
+                        visited[ child ] = True
+                        found.append( child )
+            else:
+                # Children of distinct blocks are distinct (a block has one parent)
+                found = gather_children( np.asarray( frontier, dtype = np.int64 ), child_offsets, child_ids )
+                found = found[ ~visited[ found ] ]
+                visited[ found ] = True
+                found = found.tolist()
+            result += found
+            frontier = found
+        return np.sort( np.asarray( result, dtype = np.int64 ) )
+
+    # Full lineage of the given blocks: their ancestors, themselves and
+    # their descendants, in block id order
+    def trace( self, block_ids ):
+        block_ids = np.unique( np.asarray( block_ids, dtype = np.int64 ) )
+        return np.unique( np.concatenate( [ block_ids, self.ancestors( block_ids ), self.descendants( block_ids ) ] ) )
+
+    # Full lineage of a product ("where did this cheese come from, and
+    # where did it go"), or no block if the product is unknown
+    def trace_product( self, product_id ):
+        return self.trace( self.product_blocks( product_id ) )
+
+    # Blocks within 'hops' steps (towards ancestors and descendants) of the
+    # seed blocks, at most 'max_nodes' of them. The cost only depends on the
+    # size of the neighbourhood, not on the size of the ledger.
+    def neighbourhood( self, seeds, hops, max_nodes ):
+        seeds    = np.unique( np.asarray( seeds, dtype = np.int64 ) )[ : max_nodes ]
+        child_offsets, child_ids = self.child_index()
+        result   = [ seeds ]
+        visited  = seeds
+        frontier = seeds
+        for hop in range( hops ):
+            parents  = self.parents[ frontier ]
+            found    = np.concatenate( [ parents[ parents >= 0 ], gather_children( frontier, child_offsets, child_ids ) ] )
+            found    = np.unique( found )
+            found    = found[ ~np.isin( found, visited ) ]
+            found    = found[ : max_nodes - len( visited ) ]
+            if len( found ) == 0: break
+            result.append( found )
+            visited  = np.concatenate( [ visited, found ] )
+            frontier = found
+        return np.sort( np.concatenate( result ) )
+
+    # ( previous hash, hash ) of the edges between the given blocks
+    def edge_pairs( self, block_ids ):
+        block_ids = np.asarray( block_ids, dtype = np.int64 )
+        parents   = self.parents[ block_ids ]
+        keep      = ( parents >= 0 ) & np.isin( parents, block_ids )
+        return list( zip( self.previous_hashes[ block_ids[ keep ] ].tolist(), self.hashes[ block_ids[ keep ] ].tolist() ) )
+
+    # Cytoscape edge elements between the given blocks
+    def edges( self, block_ids ):
+        return [ { 'data' : { 'source' : source, 'target' : target } } for source, target in self.edge_pairs( block_ids ) ]
+
+# ----------------------------------------------------------------- #
+#                          LAYERED LAYOUT                           #
+# ----------------------------------------------------------------- #
+
+# Distance between nodes in the network graph layout (px)
+LAYOUT_X_SPACING = 120
+LAYOUT_Y_SPACING = 160
+
+# Depth of every block (its distance from its root) and its rank in
+# breadth-first order, where a layer is ordered by the position of the
+# parents and siblings by block id. This is the lexicographic order of the
+# paths from the roots, computed by pointer doubling: every round doubles
+# the part of the path which is covered, so a chain of depth d takes
+# log2( d ) vectorised rounds instead of one round per layer. Blocks which
+# do not reach a root (e.g. in a cycle) are flagged as unreachable.
+# Returns depths, ranks (only comparable between blocks of the same depth)
+# and the reachable mask, in block id order.
+def layered_order( parents ):
+    n         = len( parents )
+    ancestors = np.asarray( parents, dtype = np.int64 ).copy()    # 2^k-th ancestor, or -1 past the root
+    depth     = ( ancestors >= 0 ).astype( np.int64 )             # Steps from a block to that ancestor
+    rank      = np.arange( n, dtype = np.int64 )                  # Rank of the covered part of the path
+    active    = np.flatnonzero( ancestors >= 0 )
+    # Paths longer than n blocks go round a cycle
+    for iteration in range( int( np.log2( max( n, 2 ) ) ) + 2 ):
+        if len( active ) == 0: break
+        above  = ancestors[ active ]
+        # Path to a block = path to its ancestor, then the covered part: the
+        # ancestor's rank is the major key. Keys are distinct, so the new
+        # ranks are their positions in sorted order
+        order  = np.argsort( rank[ above ] * ( n + 1 ) + rank[ active ], kind = 'stable' )
+        ranks  = np.empty( len( active ), dtype = np.int64 )
+        ranks[ order ]      = np.arange( len( active ) )
+        depth[ active ]     = depth[ active ] + depth[ above ]
+        ancestors[ active ] = ancestors[ above ]
+        rank[ active ]      = ranks
+        active = active[ ancestors[ active ] >= 0 ]
+    return depth, rank, ancestors < 0
+
+# Compute a layered (breadth-first) layout of the hash chain.
+# Roots (genesis blocks and blocks whose previous hash is unknown) are on
+# the top layer and each block is one layer below its previous block.
+# Within a layer, blocks are ordered by the position of their parent so
+# that branches stay together. Blocks which cannot be reached from a root
+# (e.g. in a cycle) are put on an extra bottom layer.
+# Depths and orders come from layered_order, and the blocks are placed by
+# one sort over ( layer, rank ), so deep linear chains cost O( n log n ).
+# Returns x and y arrays in block id order.
+def compute_layered_layout( graph_index, x_spacing = LAYOUT_X_SPACING, y_spacing = LAYOUT_Y_SPACING ):
+    n = len( graph_index.parents )
+    if n == 0: return np.zeros( 0 ), np.zeros( 0 )
+    depth, rank, reachable = layered_order( graph_index.parents )
+
+    # Unreachable blocks, in block id order
+    depth[ ~reachable ] = depth[ reachable ].max() + 1 if reachable.any() else 0
+    rank [ ~reachable ] = np.flatnonzero( ~reachable )
+
+    order    = np.argsort( depth * ( n + 1 ) + rank, kind = 'stable' )
+    layers   = depth[ order ]
+    starts   = np.flatnonzero( np.concatenate( [ [ True ], layers[ 1 : ] != layers[ : -1 ] ] ) )
+    counts   = np.diff( np.append( starts, n ) )
+    position = np.arange( n ) - np.repeat( starts, counts )
+
+    x = np.zeros( n )
+    x[ order ] = ( position - ( np.repeat( counts, counts ) - 1 ) / 2 ) * x_spacing
+    return x, depth * float( y_spacing )
+
+# Right end (largest x) of every layer of a layout, keyed by the layer's y
+def layout_layer_ends( x, y ):
+    return pd.Series( x ).groupby( y ).max().to_dict()
+
+# Place new blocks in a layered layout (live mode) without moving the other
+# nodes: each new block goes one layer below its parent (or on the top layer
+# if it has none), at the right end of its layer. 'new_ids' are the ids
+# appended by GraphIndex.extend. The positions 'x' and 'y' (GrowingArray)
+# and 'layer_ends' (see layout_layer_ends) are extended in place, so the
+# cost only depends on the new blocks. Returns the x and y of the new blocks.
+def extend_layered_layout( graph_index, x, y, new_ids, layer_ends, x_spacing = LAYOUT_X_SPACING, y_spacing = LAYOUT_Y_SPACING ):
+    first   = len( x )
+    x.append( np.zeros( len( new_ids ) ) )
+    y.append( np.zeros( len( new_ids ) ) )
+    x, y    = x.values(), y.values()
+    placed  = np.zeros( len( new_ids ), dtype = bool )
+    pending = np.asarray( new_ids, dtype = np.int64 )
+
+    # A block is placed once its parent is (parents may be new blocks too)
+    while len( pending ) > 0:
+        parents = graph_index.parents[ pending ]
+        ready   = ( parents < first ) | placed[ np.maximum( parents - first, 0 ) ]
+        if not ready.any(): ready[ : ] = True   # Cycle between new blocks
+        for block_id, parent in zip( pending[ ready ].tolist(), parents[ ready ].tolist() ):
+            has_parent             = parent >= 0 and ( parent < first or placed[ parent - first ] )
+            layer_y                = y[ parent ] + y_spacing if has_parent else 0.0
+            x[ block_id ]          = layer_ends.get( layer_y, -x_spacing ) + x_spacing
+            y[ block_id ]          = layer_y
+            layer_ends[ layer_y ]  = x[ block_id ]
+            placed[ block_id - first ] = True
+        pending = pending[ ~ready ]
+
+    return x[ new_ids ], y[ new_ids ]
+
+# Add preset positions to Cytoscape node elements (in place)
+def set_node_positions( nodes, x, y ):
+    if hasattr( nodes, 'set_positions' ):  # Column-backed node records
+        nodes.set_positions( x, y )
+        return nodes
+    for node, node_x, node_y in zip( nodes, x.tolist(), y.tolist() ):
+        node[ 'position' ] = { 'x' : node_x, 'y' : node_y }
+    return nodes
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Random hash chain of n blocks: each block extends a random earlier one.
+# The chain is shallow (about log n layers)
+def generate_random_chain( n, seed = 0 ):
+    random          = np.random.default_rng( seed )
+    hashes          = np.array( [ format( i, '064x' ) for i in range( n ) ], dtype = object )
+    parents         = ( random.random( n ) * np.arange( n ) ).astype( np.int64 )
+    previous_hashes = hashes[ parents ]
+    previous_hashes[ 0 ] = 'GenesisBlock'
+    return hashes, previous_hashes
+
+# Hash chain of n blocks cut into 'chains' linear chains, the shape of real
+# ledgers: every event of a product extends the previous one, so a chain is
+# as deep as it is long
+def generate_linear_chains( n, chains = 1 ):
+    hashes          = np.array( [ format( i, '064x' ) for i in range( n ) ], dtype = object )
+    previous_hashes = np.empty( n, dtype = object )
+    previous_hashes[ 1 : ] = hashes[ : -1 ]
+    previous_hashes[ np.arange( 0, n, -( -n // max( chains, 1 ) ) ) ] = 'GenesisBlock'
+    return hashes, previous_hashes
+
+# Time compute_layered_layout against the number of blocks, for shallow
+# random chains and for deep linear ones
+def benchmark_layout( node_counts = ( 1000, 10000, 100000, 1000000 ) ):
+    for name, generate in [ ( 'random', generate_random_chain ), ( 'linear', generate_linear_chains ) ]:
+        for n in node_counts:
+            graph_index = GraphIndex( *generate( n ) )
+            start = time.perf_counter()
+            compute_layered_layout( graph_index )
+            print( 'layout of', n, 'blocks (' + name + ' chain):', round( time.perf_counter() - start, 3 ), 's' )
+
+# Time the lineage queries on a single linear chain, the deepest shape:
+# the descendants of the genesis block and the ancestors of the last block
+# (both the whole chain)
+def benchmark_trace( node_counts = ( 10000, 50000, 200000, 1000000 ) ):
+    for n in node_counts:
+        graph_index = GraphIndex( *generate_linear_chains( n ) )
+        start = time.perf_counter()
+        assert len( graph_index.descendants( [ 0 ] ) ) == n - 1
+        middle = time.perf_counter()
+        assert len( graph_index.ancestors( [ n - 1 ] ) ) == n - 1
+        print( 'trace of a', n, 'block chain: descendants', round( middle - start, 3 ), 's, ancestors', round( time.perf_counter() - middle, 3 ), 's' )
+
+# Usage:
+#   python graph_util.py          layout benchmark
+#   python graph_util.py trace    lineage query benchmark
+if __name__ == '__main__':
+    if len( sys.argv ) > 1 and sys.argv[ 1 ] == 'trace': benchmark_trace()
+    else:                                                  benchmark_layout()
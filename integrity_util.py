@@ -0,0 +1,220 @@
+
+# Import libraries
+import sys                                                  # For command line arguments
+import json                                                 # For the machine-readable report
+import time                                                 # For integrity check benchmark
+import numpy as np                                          # For array-based chain checks
+import pandas as pd                                         # For hash to integer code mapping
+from   concurrent.futures import ProcessPoolExecutor        # For checking shards in parallel
+from   graph_util import TRACE_SCALAR_FRONTIER              # For peeling narrow frontiers block by block
+from   ledger_util import in_worker_process                 # For checking serially inside a worker process
+
+# ----------------------------------------------------------------- #
+#                          CHAIN CHECKS                             #
+# ----------------------------------------------------------------- #
+
+# 'PreviousHash' of the first block of a chain
+GENESIS_PREVIOUS_HASH = 'GenesisBlock'
+
+# Codes of previous hashes which are not block hashes
+GENESIS_CODE = -2
+UNKNOWN_CODE = -1
+
+# Ledgers with fewer blocks are checked in the calling process, because
+# starting worker processes costs more than the check itself
+PARALLEL_MIN_BLOCKS = 200000
+
+# Kinds of problems found by the checker
+INTEGRITY_CHECKS = [
+    'duplicate_hash',          # Two blocks have the same hash
+    'dangling_previous_hash',  # 'PreviousHash' is neither a block hash nor the genesis marker
+    'root_mismatch',           # 'PreviousHash' is a block of another root product
+    'multiple_genesis',        # A root product has more than one genesis block
+    'cycle'                    # The block is on a cycle of 'PreviousHash' links
+]
+
+# Blocks on a cycle of parent links, given parent positions (-1 for none).
+# Blocks which are not on a cycle are peeled off leaf by leaf (Kahn's
+# algorithm): the child counts are computed once, and a block becomes a
+# leaf when the count of its last child drops to zero. Narrow frontiers
+# (deep chains) are peeled one block at a time, wide ones as arrays, so
+# each block is handled once whatever the shape of the chain.
+def find_cycle_blocks( parents ):
+    n           = len( parents )
+    parent_list = parents.tolist()
+    children    = np.bincount( parents[ parents >= 0 ], minlength = n )
+    peeled      = np.zeros( n, dtype = bool )
+    frontier    = np.flatnonzero( children == 0 ).tolist()
+    while len( frontier ) > 0:
+        if len( frontier ) < TRACE_SCALAR_FRONTIER:
+            found = []
+            for block in frontier:
+                peeled[ block ] = True
+                parent          = parent_list[ block ]
+                if parent < 0: continue
+                children[ parent ] -= 1
+                if children[ parent ] == 0: found.append( parent )
+        else:
+            frontier             = np.asarray( frontier, dtype = np.int64 )
+            peeled[ frontier ]   = True
+            found                = parents[ frontier ]
+            found, counts        = np.unique( found[ found >= 0 ], return_counts = True )
+            children[ found ]   -= counts
+            found                = found[ children[ found ] == 0 ].tolist()
+        frontier = found
+    return np.flatnonzero( ~peeled )
+
+# Check the blocks of one root product. Hashes come as integer codes (see
+# check_ledger_integrity) so that shards are cheap to send to a worker.
+# Returns the positions (within the shard) of the blocks failing each check.
+def check_chain_shard( shard ):
+    hash_codes, previous_codes = shard
+
+    # Parent position within the shard; the first block wins for duplicates
+    order     = np.argsort( hash_codes, kind = 'stable' )
+    found     = np.searchsorted( hash_codes[ order ], previous_codes )
+    found     = np.minimum( found, len( order ) - 1 )
+    in_shard  = ( previous_codes >= 0 ) & ( hash_codes[ order ][ found ] == previous_codes )
+    parents   = np.where( in_shard, order[ found ], -1 )
+
+    genesis   = np.flatnonzero( previous_codes == GENESIS_CODE )
+    return {
+        'root_mismatch'    : np.flatnonzero( ( previous_codes >= 0 ) & ~in_shard ),
+        'multiple_genesis' : genesis if len( genesis ) > 1 else np.zeros( 0, dtype = np.int64 ),
+        'cycle'            : np.sort( find_cycle_blocks( parents ) )
+    }
+
+# Validate the structure of the hash chain of a 'branches' data frame in
+# linear time. Duplicate and dangling hashes are found with one pass over
+# the whole ledger; the other checks are run per root product, in a pool
+# of 'processes' worker processes for large ledgers (serially inside a
+# worker process, which cannot start a pool; see ledger_util.read_ledgers).
+# Returns a report (a JSON-serialisable dictionary):
+#   'blocks' : number of checked blocks
+#   'ok'     : True if no problem was found
+#   'counts' : number of problems of each kind (see INTEGRITY_CHECKS)
+#   'issues' : one record per problem, with the block's hashes and products
+def check_ledger_integrity( branches, processes = None, parallel_min_blocks = PARALLEL_MIN_BLOCKS ):
+    hashes          = branches[ 'Hash'         ].to_numpy( dtype = object )
+    previous_hashes = branches[ 'PreviousHash' ].to_numpy( dtype = object )
+    n               = len( hashes )
+
+    # Integer codes of the hashes; the previous hash gets the code of the
+    # block it points to, GENESIS_CODE or UNKNOWN_CODE
+    hash_codes, unique_hashes = pd.factorize( hashes )
+    previous_codes            = pd.Index( unique_hashes ).get_indexer( previous_hashes )
+    previous_codes[ previous_hashes == GENESIS_PREVIOUS_HASH ] = GENESIS_CODE
+
+    flagged = {
+        'duplicate_hash'         : np.flatnonzero( pd.Index( hashes ).duplicated( keep = False ) ),
+        'dangling_previous_hash' : np.flatnonzero( previous_codes == UNKNOWN_CODE )
+    }
+
+    # Shards of blocks per root product (blocks without root product form one shard)
+    if 'RootProductID' in branches:
+        root_codes = pd.factorize( branches[ 'RootProductID' ].to_numpy( dtype = object ), use_na_sentinel = False )[ 0 ]
+    else:
+        root_codes = np.zeros( n, dtype = np.int64 )
+    block_ids = np.argsort( root_codes, kind = 'stable' )
+    offsets   = np.zeros( root_codes.max() + 2 if n > 0 else 1, dtype = np.int64 )
+    np.cumsum( np.bincount( root_codes, minlength = len( offsets ) - 1 ), out = offsets[ 1 : ] )
+    shards    = [ block_ids[ start : end ] for start, end in zip( offsets[ : -1 ], offsets[ 1 : ] ) ]
+    tasks     = [ ( hash_codes[ shard ], previous_codes[ shard ] ) for shard in shards ]
+
+    if n >= parallel_min_blocks and processes != 1 and len( tasks ) > 1 and not in_worker_process():
+        with ProcessPoolExecutor( processes ) as pool:
+            results = list( pool.map( check_chain_shard, tasks, chunksize = max( 1, len( tasks ) // 64 ) ) )
+    else:
+        results = [ check_chain_shard( task ) for task in tasks ]
+
+    for check in [ 'root_mismatch', 'multiple_genesis', 'cycle' ]:
+        positions        = [ shard[ result[ check ] ] for shard, result in zip( shards, results ) ]
+        flagged[ check ] = np.sort( np.concatenate( positions ) ) if positions else np.zeros( 0, dtype = np.int64 )
+
+    # Problem records
+    columns = [ column for column in [ 'Hash', 'PreviousHash', 'ProductID', 'RootProductID' ] if column in branches ]
+    issues  = []
+    for check in INTEGRITY_CHECKS:
+        records = branches.iloc[ flagged[ check ] ][ columns ].astype( object )
+        records = records.where( records.notna(), None ).to_dict( 'records' )
+        issues += [ dict( check = check, **record ) for record in records ]
+
+    counts = { check : int( len( flagged[ check ] ) ) for check in INTEGRITY_CHECKS }
+    return {
+        'blocks' : int( n ),
+        'ok'     : sum( counts.values() ) == 0,
+        'counts' : counts,
+        'issues' : issues
+    }
+
+# One-line description of the problems of a report, for the dashboard alert
+def summarise_integrity_report( report ):
+    if report[ 'ok' ]: return 'Ledger integrity check passed (' + str( report[ 'blocks' ] ) + ' blocks).'
+    problems = [ str( count ) + ' ' + check.replace( '_', ' ' ) for check, count in report[ 'counts' ].items() if count > 0 ]
+    return 'Ledger integrity problems in ' + str( report[ 'blocks' ] ) + ' blocks: ' + ', '.join( problems ) + '.'
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Random ledger of n blocks in 'roots' root products: each block extends
+# a random earlier block of its root product
+def generate_random_ledger( n, roots = 1000, seed = 0 ):
+    random          = np.random.default_rng( seed )
+    positions       = np.arange( n )
+    steps           = 1 + ( random.random( n ) * ( positions // roots ) ).astype( np.int64 )
+    parents         = np.where( positions < roots, -1, positions - steps * roots )
+    hashes          = np.array( [ format( i, '064x' ) for i in range( n ) ], dtype = object )
+    previous_hashes = np.where( parents < 0, GENESIS_PREVIOUS_HASH, hashes[ np.maximum( parents, 0 ) ] )
+    return pd.DataFrame( {
+        'Hash'          : hashes,
+        'PreviousHash'  : previous_hashes,
+        'ProductID'     : positions.astype( str ),
+        'RootProductID' : ( positions % roots ).astype( str )
+    } )
+
+# Ledger of n blocks in 'roots' linear chains, the shape of real ledgers:
+# every event of a root product extends the previous one. With 'cycle', the
+# first two blocks of the first chain point to each other, so the rest of
+# that chain is a deep tail below a cycle.
+def generate_linear_ledger( n, roots = 1000, cycle = False ):
+    positions       = np.arange( n )
+    length          = -( -n // max( roots, 1 ) )
+    hashes          = np.array( [ format( i, '064x' ) for i in range( n ) ], dtype = object )
+    previous_hashes = np.where( positions % length == 0, GENESIS_PREVIOUS_HASH, hashes[ np.maximum( positions - 1, 0 ) ] )
+    if cycle and length > 1: previous_hashes[ 0 ] = hashes[ 1 ]
+    return pd.DataFrame( {
+        'Hash'          : hashes,
+        'PreviousHash'  : previous_hashes,
+        'ProductID'     : positions.astype( str ),
+        'RootProductID' : ( positions // length ).astype( str )
+    } )
+
+# Time check_ledger_integrity in the calling process and in a process pool,
+# for shallow random chains and for deep linear ones (one chain per root
+# product, and a single chain with a cycle below its whole length)
+def benchmark_integrity( node_counts = ( 10000, 100000, 1000000 ) ):
+    shapes = [
+        ( 'random',              lambda n: generate_random_ledger( n ) ),
+        ( 'linear',              lambda n: generate_linear_ledger( n ) ),
+        ( 'linear, deep cycle',  lambda n: generate_linear_ledger( n, roots = 1, cycle = True ) )
+    ]
+    for name, generate in shapes:
+        for n in node_counts:
+            branches = generate( n )
+            for processes in [ 1, None ]:
+                start  = time.perf_counter()
+                report = check_ledger_integrity( branches, processes = processes, parallel_min_blocks = 0 )
+                print( 'integrity check of', n, 'blocks (' + name + '),', 'serial:  ' if processes == 1 else 'parallel:',
+                       round( time.perf_counter() - start, 3 ), 's', '(ok)' if report[ 'ok' ] else '(' + summarise_integrity_report( report ) + ')' )
+
+# Usage:
+#   python integrity_util.py ledger.json.txt ...   print the report of each ledger as JSON
+#   python integrity_util.py                       run the benchmark
+if __name__ == '__main__':
+    if len( sys.argv ) > 1:
+        from ledger_util import read_ledger
+        reports = { path : check_ledger_integrity( read_ledger( path )[ 1 ] ) for path in sys.argv[ 1 : ] }
+        print( json.dumps( reports, indent = 2 ) )
+    else:
+        benchmark_integrity()
@@ -0,0 +1,307 @@
+
+# Import libraries
+import os                                                   # For ledger file names
+import glob                                                 # For finding ledger files in a directory
+import json                                                 # For decoding JSON records one at a time
+import multiprocessing                                      # For detecting worker processes
+import pandas as pd                                         # For building typed data frames
+from   concurrent.futures import ProcessPoolExecutor        # For reading ledger files in parallel
+
+# ----------------------------------------------------------------- #
+#                          LEDGER COLUMNS                           #
+# ----------------------------------------------------------------- #
+
+# Columns of 'txHistory' which are used by the dashboard.
+# Everything else ('Hash', 'TransferFrom', ...) is dropped while the
+# record is parsed. 'LinkedExperiments' is kept in 'branches' only, where
+# the network graph resolves it (see experiment_util).
+TXHISTORY_COLUMNS = [
+    'ProductID',
+    'PreviousProductID',
+    'RootProductID',
+    'Owner',
+    'ProductName',
+    'ProductType',
+    'Location',
+    'Weight',
+    'Temperature',
+    'UseByDate',
+    'AssetStatus',
+    'EventBy',
+    'EventTimestamp'
+]
+
+# Columns of 'branches' which are used by the network graph
+BRANCHES_COLUMNS = [
+    'ProductID',
+    'PreviousProductID',
+    'RootProductID',
+    'Owner',
+    'ProductName',
+    'Location',
+    'Weight',
+    'Temperature',
+    'EventTimestamp',
+    'Hash',
+    'PreviousHash',
+    'LinkedExperiments'
+]
+
+# Columns converted into numbers when the data frame is built
+NUMERIC_COLUMNS = [ 'Weight', 'Temperature' ]
+
+# Asset status which are not shown in the dashboard
+SKIPPED_ASSET_STATUS = [ 'Edited', 'Requested' ]
+
+# Size of text read from the ledger file at once
+CHUNK_SIZE = 1 << 16
+
+# Ledger files picked up from a directory, and the parts of their
+# names which are not part of the source name ('tx_monitor_beef.json.txt'
+# is the 'beef' source)
+LEDGER_FILE_PATTERN = 'tx_monitor_*.json.txt'
+LEDGER_FILE_PREFIX  = 'tx_monitor_'
+LEDGER_FILE_SUFFIX  = '.json.txt'
+
+# Event logs: one ledger event (a 'txHistory' record, which is also a block
+# of 'branches') per line, appended as events happen (see read_event_log)
+EVENT_LOG_PATTERN = 'tx_monitor_*.jsonl'
+EVENT_LOG_SUFFIX  = '.jsonl'
+
+# Column holding the source (ledger) of every row of a merged dataset
+SOURCE_COLUMN = 'source'
+
+# ----------------------------------------------------------------- #
+#                       STREAMING JSON READER                       #
+# ----------------------------------------------------------------- #
+
+# Minimal incremental reader over a JSON document.
+# Only a window of the file is kept in 'buffer', and values are
+# decoded one at a time with json.JSONDecoder.raw_decode, so a
+# record is never held in memory together with the whole document.
+class _JsonStream:
+    def __init__( self, file, chunk_size = CHUNK_SIZE ):
+        self.file       = file
+        self.chunk_size = chunk_size
+        self.decoder    = json.JSONDecoder()
+        self.buffer     = ''
+        self.pos        = 0
+
+    # Read the next chunk of the file. Returns False at the end of file
+    def fill( self ):
+        chunk = self.file.read( self.chunk_size )
+        if not chunk: return False
+        # Drop the text which has already been consumed
+        self.buffer = self.buffer[ self.pos : ] + chunk
+        self.pos    = 0
+        return True
+
+    # Return the next non-white-space character without consuming it
+    def peek( self ):
+        while True:
+            while self.pos < len( self.buffer ) and self.buffer[ self.pos ] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len( self.buffer ): return self.buffer[ self.pos ]
+            if not self.fill(): return ''
+
+    # Consume the expected character
+    def expect( self, char ):
+        if self.peek() != char:
+            raise ValueError( 'Invalid ledger file: expected ' + repr( char ) + ' at ' + repr( self.peek() ) )
+        self.pos += 1
+
+    # Decode the next JSON value, reading more of the file if the
+    # value is cut in the middle by the end of the buffer
+    def value( self ):
+        self.peek()
+        while True:
+            try:
+                result, end = self.decoder.raw_decode( self.buffer, self.pos )
+                # A number at the end of the buffer may continue in the next chunk
+                if end < len( self.buffer ) or not isinstance( result, ( int, float ) ) or not self.fill():
+                    self.pos = end
+                    return result
+                continue
+            except json.JSONDecodeError:
+                if not self.fill(): raise
+
+    # Iterate elements of an array one by one
+    def array( self ):
+        self.expect( '[' )
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            char = self.peek()
+            self.pos += 1
+            if   char == ']': return
+            elif char != ',': raise ValueError( 'Invalid ledger file: expected "," or "]"' )
+
+# Iterate records of the ledger file section by section.
+# 'sections' maps the name of a top-level array ('txHistory', 'branches')
+# to the list of keys kept from each record. Yields ( section, record ).
+def iter_ledger_records( path, sections, chunk_size = CHUNK_SIZE ):
+    with open( path ) as file:
+        stream = _JsonStream( file, chunk_size )
+        stream.expect( '{' )
+        if stream.peek() == '}': return
+        while True:
+            key = stream.value()
+            stream.expect( ':' )
+            columns = sections.get( key )
+            if stream.peek() == '[':
+                for record in stream.array():
+                    # Project the record at parse time
+                    if columns is not None:
+                        yield key, { column : record.get( column ) for column in columns }
+            else:
+                stream.value()
+            char = stream.peek()
+            stream.pos += 1
+            if   char == '}': return
+            elif char != ',': raise ValueError( 'Invalid ledger file: expected "," or "}"' )
+
+# ----------------------------------------------------------------- #
+#                        DATA FRAME BUILDING                        #
+# ----------------------------------------------------------------- #
+
+# Build a typed data frame from column lists
+def build_ledger_frame( column_lists ):
+    result = pd.DataFrame( column_lists )
+    for column in NUMERIC_COLUMNS:
+        if column in result: result[ column ] = pd.to_numeric( result[ column ], errors = 'coerce' )
+    return result
+
+# Read a tx_monitor ledger file in one streaming pass.
+# Returns the 'txHistory' data frame (oldest event first, with
+# 'skip_status' events removed) and the 'branches' data frame.
+# 'branches' values are kept as they are in the ledger (e.g. 'Weight'
+# stays a string); create_networkgraph_inputdata parses them.
+def read_ledger(
+    path,
+    txhistory_columns = TXHISTORY_COLUMNS,
+    branches_columns  = BRANCHES_COLUMNS,
+    skip_status       = SKIPPED_ASSET_STATUS,
+    chunk_size        = CHUNK_SIZE
+):
+    txhistory_lists = { column : [] for column in txhistory_columns }
+    branches_lists  = { column : [] for column in branches_columns }
+    sections        = { 'txHistory' : txhistory_columns, 'branches' : branches_columns }
+    skip_status     = set( skip_status )
+
+    for section, record in iter_ledger_records( path, sections, chunk_size ):
+        if section == 'txHistory':
+            if record.get( 'AssetStatus' ) in skip_status: continue
+            for column in txhistory_columns: txhistory_lists[ column ].append( record[ column ] )
+        else:
+            for column in branches_columns: branches_lists[ column ].append( record[ column ] )
+
+    # 'txHistory' is stored newest first
+    for column in txhistory_columns: txhistory_lists[ column ].reverse()
+    df_txhistory = build_ledger_frame( txhistory_lists )
+
+    df_branches  = pd.DataFrame( branches_lists, columns = branches_columns )
+
+    return df_txhistory, df_branches
+
+# ----------------------------------------------------------------- #
+#                       MULTI-LEDGER LOADING                        #
+# ----------------------------------------------------------------- #
+
+# Expand ledger files and directories into a sorted list of ledger files
+def list_ledger_files( paths, pattern = LEDGER_FILE_PATTERN ):
+    if isinstance( paths, str ): paths = [ paths ]
+    files = []
+    for path in paths:
+        if os.path.isdir( path ): files += sorted( glob.glob( os.path.join( path, pattern ) ) )
+        else:                     files.append( path )
+    if len( files ) == 0: raise ValueError( 'No ledger file found in ' + ', '.join( paths ) )
+    return files
+
+# Source name of a ledger file, e.g. 'beef' for 'tx_monitor_beef.json.txt'
+# (or for the event log 'tx_monitor_beef.jsonl')
+def ledger_source_name( path ):
+    name = os.path.basename( path )
+    if name.startswith( LEDGER_FILE_PREFIX ): name = name[ len( LEDGER_FILE_PREFIX ) : ]
+    for suffix in [ LEDGER_FILE_SUFFIX, EVENT_LOG_SUFFIX ]:
+        if name.endswith( suffix ): name = name[ : -len( suffix ) ]
+    return name
+
+# True in a worker process, including while a spawned worker re-imports
+# the main script (when parent_process() is not set yet). Starting a pool
+# there fails, so pooled functions run serially instead.
+def in_worker_process():
+    return multiprocessing.parent_process() is not None or getattr( multiprocessing.current_process(), '_inheriting', False )
+
+# Read several ledgers (files, or directories of LEDGER_FILE_PATTERN files)
+# and merge them into one dataset. Files are parsed in parallel in a pool
+# of 'processes' worker processes, so the time depends on the number of
+# cores rather than the number of files. Every row gets the source name
+# of its ledger in SOURCE_COLUMN (a categorical column).
+# Files are read serially inside a worker process: a script calling this
+# at import time (like the dashboard) is re-imported by every worker under
+# the spawn and forkserver start methods, and a worker cannot start a pool.
+# Returns the merged 'txHistory' and 'branches' data frames, like read_ledger.
+def read_ledgers( paths, processes = None, **read_options ):
+    files   = list_ledger_files( paths )
+    sources = [ ledger_source_name( path ) for path in files ]
+    if len( set( sources ) ) < len( sources ): sources = files   # Keep names unique
+
+    if len( files ) == 1 or processes == 1 or in_worker_process():
+        results = [ read_ledger( path, **read_options ) for path in files ]
+    else:
+        with ProcessPoolExecutor( processes ) as pool:
+            results = list( pool.map( _read_ledger_with_options, files, [ read_options ] * len( files ) ) )
+
+    source_type = pd.CategoricalDtype( sources )
+    frames      = []
+    for position in [ 0, 1 ]:
+        parts = []
+        for source, result in zip( sources, results ):
+            part = result[ position ]
+            part[ SOURCE_COLUMN ] = pd.Series( source, index = part.index, dtype = source_type )
+            parts.append( part )
+        frames.append( pd.concat( parts, ignore_index = True ) )
+
+    return frames[ 0 ], frames[ 1 ]
+
+# read_ledger with keyword options, for the worker pool
+def _read_ledger_with_options( path, read_options ):
+    return read_ledger( path, **read_options )
+
+# ----------------------------------------------------------------- #
+#                         EVENT LOG READING                         #
+# ----------------------------------------------------------------- #
+
+# Read the events appended to an event log since byte 'offset'.
+# Only complete lines are read, so a line which is still being written is
+# picked up by the next call. Every event gives a 'branches' record, and a
+# 'txHistory' record unless its status is in 'skip_status'.
+# Returns the new 'txHistory' and 'branches' data frames (oldest first)
+# and the offset to read from next time.
+def read_event_log(
+    path,
+    offset            = 0,
+    txhistory_columns = TXHISTORY_COLUMNS,
+    branches_columns  = BRANCHES_COLUMNS,
+    skip_status       = SKIPPED_ASSET_STATUS
+):
+    with open( path, 'rb' ) as file:
+        file.seek( offset )
+        text = file.read()
+    end = text.rfind( b'\n' ) + 1
+
+    txhistory_lists = { column : [] for column in txhistory_columns }
+    branches_lists  = { column : [] for column in branches_columns  }
+    skip_status     = set( skip_status )
+    for line in text[ : end ].splitlines():
+        if not line.strip(): continue
+        record = json.loads( line )
+        for column in branches_columns: branches_lists[ column ].append( record.get( column ) )
+        if record.get( 'AssetStatus' ) in skip_status: continue
+        for column in txhistory_columns: txhistory_lists[ column ].append( record.get( column ) )
+
+    df_txhistory = build_ledger_frame( txhistory_lists )
+    df_branches  = pd.DataFrame( branches_lists, columns = branches_columns )
+    return df_txhistory, df_branches, offset + end
@@ -0,0 +1,123 @@
+
+# Import libraries
+import os                                                   # For file sizes and directory listing
+import glob                                                 # For finding new export files
+import threading                                            # For polling from concurrent callbacks
+import pandas as pd                                         # For merging new events
+from   ledger_util import read_ledger, read_event_log, ledger_source_name, LEDGER_FILE_PATTERN, LEDGER_FILE_SUFFIX, EVENT_LOG_PATTERN, SOURCE_COLUMN # For parsing new events
+
+# ----------------------------------------------------------------- #
+#                          LEDGER TAIL                              #
+# ----------------------------------------------------------------- #
+
+# Interval between two polls of the ledger sources in live mode (ms)
+LIVE_POLL_INTERVAL = 5000
+
+# Watch ledger sources for new events:
+#   - event logs (EVENT_LOG_PATTERN, or any file given by name which is not
+#     a ledger document) are read from where the previous poll stopped
+#   - ledger documents (LEDGER_FILE_PATTERN) which appear in a watched
+#     directory are new exports, read once as a whole
+# Files which were loaded at startup are passed as 'loaded_files'.
+class LedgerTail:
+    def __init__( self, paths, loaded_files = () ):
+        self.paths      = [ paths ] if isinstance( paths, str ) else list( paths )
+        self.read_files = set( os.path.abspath( path ) for path in loaded_files )
+        self.offsets    = {}
+        self.lock       = threading.Lock()
+
+    # Event logs and ledger documents of the watched paths
+    def list_files( self ):
+        event_logs, documents = [], []
+        for path in self.paths:
+            if os.path.isdir( path ):
+                event_logs += sorted( glob.glob( os.path.join( path, EVENT_LOG_PATTERN   ) ) )
+                documents  += sorted( glob.glob( os.path.join( path, LEDGER_FILE_PATTERN ) ) )
+            elif path.endswith( LEDGER_FILE_SUFFIX ):
+                documents.append( path )
+            else:
+                event_logs.append( path )
+        return event_logs, documents
+
+    # Read the events added since the previous poll. Returns the new
+    # 'txHistory' and 'branches' rows (with their SOURCE_COLUMN), or
+    # ( None, None ) if nothing changed. The cost depends on the size of
+    # the new data, not on the size of the sources.
+    def poll( self ):
+        with self.lock:
+            event_logs, documents = self.list_files()
+            txhistory_parts, branches_parts = [], []
+
+            for path in event_logs:
+                key = os.path.abspath( path )
+                if not os.path.exists( path ) or os.path.getsize( path ) == self.offsets.get( key, 0 ): continue
+                if os.path.getsize( path ) < self.offsets.get( key, 0 ): self.offsets[ key ] = 0   # Log was truncated
+                df_txhistory, df_branches, self.offsets[ key ] = read_event_log( path, self.offsets.get( key, 0 ) )
+                txhistory_parts.append( ( ledger_source_name( path ), df_txhistory ) )
+                branches_parts .append( ( ledger_source_name( path ), df_branches  ) )
+
+            for path in documents:
+                key = os.path.abspath( path )
+                if key in self.read_files: continue
+                self.read_files.add( key )
+                df_txhistory, df_branches = read_ledger( path )
+                txhistory_parts.append( ( ledger_source_name( path ), df_txhistory ) )
+                branches_parts .append( ( ledger_source_name( path ), df_branches  ) )
+
+        if sum( len( part ) for source, part in branches_parts ) == 0: return None, None
+        return merge_source_parts( txhistory_parts ), merge_source_parts( branches_parts )
+
+# Concatenate ( source, data frame ) parts, naming the source of every row
+def merge_source_parts( parts ):
+    frames = [ part.assign( **{ SOURCE_COLUMN : source } ) for source, part in parts if len( part ) > 0 ]
+    if len( frames ) == 0: return parts[ 0 ][ 1 ].assign( **{ SOURCE_COLUMN : pd.Series( dtype = object ) } )
+    return pd.concat( frames, ignore_index = True )
+
+# ----------------------------------------------------------------- #
+#                          CHUNKED FRAMES                           #
+# ----------------------------------------------------------------- #
+
+# Data frame which grows by appending new rows (live mode). The rows are
+# kept as a list of chunks, which are only concatenated when the whole
+# frame is read (and then replaced by the result), so appending k rows
+# costs O( k ) whatever the size of the frame. Categorical columns (e.g.
+# SOURCE_COLUMN) stay categorical, their categories growing with the new
+# values. Appending returns a new ChunkedFrame and leaves this one as it
+# is, so an older version of a dataset can still be read.
+class ChunkedFrame:
+    def __init__( self, chunks, categories = None ):
+        self.chunks     = list( chunks )
+        self.columns    = self.chunks[ 0 ].columns
+        self.length     = sum( len( chunk ) for chunk in self.chunks )
+        self.categories = categories if categories is not None else {
+            column : self.chunks[ 0 ][ column ].cat.categories.tolist()
+            for column in self.columns if isinstance( self.chunks[ 0 ][ column ].dtype, pd.CategoricalDtype )
+        }
+
+    def __len__( self ):
+        return self.length
+
+    # The whole data frame, with consecutive row numbers
+    def frame( self ):
+        if len( self.chunks ) > 1:
+            chunks = []
+            for chunk in self.chunks:
+                for column, categories in self.categories.items():
+                    if len( chunk[ column ].cat.categories ) < len( categories ):
+                        chunk = chunk.assign( **{ column : chunk[ column ].cat.set_categories( categories ) } )
+                chunks.append( chunk )
+            self.chunks = [ pd.concat( chunks ) ]
+        return self.chunks[ 0 ]
+
+    # Append new rows, adding any new values of the categorical columns to
+    # their categories. The new rows are numbered after the existing ones.
+    # Returns the extended ChunkedFrame and the new rows.
+    def append_rows( self, df_new ):
+        df_new       = df_new[ self.columns ].reset_index( drop = True )
+        df_new.index = df_new.index + len( self )
+        categories   = {}
+        for column, known in self.categories.items():
+            new_values           = pd.Index( pd.unique( df_new[ column ].dropna() ) )
+            categories[ column ] = known + new_values[ ~new_values.isin( known ) ].tolist()
+            df_new[ column ]     = df_new[ column ].astype( pd.CategoricalDtype( categories[ column ] ) )
+        return ChunkedFrame( self.chunks + [ df_new ], categories ), df_new
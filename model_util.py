@@ -0,0 +1,225 @@
+
+# Import libraries
+import sys                                                  # For command line arguments
+import json                                                 # For the printed metrics
+import threading                                            # For starting the shared pool once
+import numpy as np                                          # For the regression models
+import pandas as pd                                         # For the sample table and the join
+from   concurrent.futures import ProcessPoolExecutor        # For running folds and targets in parallel
+from   concurrent.futures.process import BrokenProcessPool  # For falling back when a worker dies
+from   ledger_util import in_worker_process                 # For running serially inside a worker process
+
+# ----------------------------------------------------------------- #
+#                        SAMPLE TABLE JOIN                          #
+# ----------------------------------------------------------------- #
+
+# Microbial counts of micro_Air.csv (CFU per sample), keyed by the same
+# 'Sample' ids as the FTIR spectra. 'PCA' is the plate count agar total
+# count, not a principal component analysis.
+MICRO_TARGETS = [ 'PCA', 'CFC', 'MRS', 'STAA', 'VRBG' ]
+
+# Read a table of values per sample (e.g. micro_Air.csv)
+def read_sample_table( path, sample_column = 'Sample' ):
+    table = pd.read_csv( path, dtype = { sample_column : str } )
+    if sample_column not in table: raise ValueError( 'No ' + repr( sample_column ) + ' column in ' + path )
+    if table[ sample_column ].duplicated().any():
+        raise ValueError( 'Duplicate sample ids in ' + path + ': ' + ', '.join( table[ sample_column ][ table[ sample_column ].duplicated() ].astype( str ) ) )
+    return table.set_index( sample_column )
+
+# Join spectra (by their sample ids) to a sample table through an index of
+# the table's ids. Returns the spectrum rows which have a match and the
+# matching table rows (replicate spectra share their table row).
+def join_samples( sample_ids, table ):
+    table_rows = table.index.get_indexer( np.asarray( sample_ids, dtype = object ) )
+    spectrum_rows = np.flatnonzero( table_rows >= 0 )
+    return spectrum_rows, table_rows[ spectrum_rows ]
+
+# Counts on a log scale; zero counts are kept finite
+def log_counts( counts ):
+    return np.log10( np.asarray( counts, dtype = np.float64 ) + 1 )
+
+# ----------------------------------------------------------------- #
+#                        REGRESSION MODELS                          #
+# ----------------------------------------------------------------- #
+
+# Model kinds and their parameter: the number of latent variables of a PLS
+# model, or the penalty of a ridge model relative to the data (see fit_ridge)
+MODEL_METHODS = {
+    'pls'   : 5,
+    'ridge' : 0.01
+}
+
+# Ridge regression through the SVD of the centred data (cheap when there
+# are more wavenumbers than spectra). The penalty is alpha times the
+# largest squared singular value, so the same alpha shrinks the model as
+# much whatever the scale of the preprocessed spectra (a fixed penalty is
+# negligible for raw absorbances and removes everything but the intercept
+# for small values, e.g. derivatives). Returns ( coefficients, intercept )
+def fit_ridge( X, y, alpha ):
+    x_mean, y_mean = X.mean( axis = 0 ), y.mean()
+    u, s, vt       = np.linalg.svd( X - x_mean, full_matrices = False )
+    penalty        = alpha * s[ 0 ] ** 2 if len( s ) and s[ 0 ] > 0 else alpha
+    coefficients   = vt.T @ ( ( s / ( s * s + penalty ) ) * ( u.T @ ( y - y_mean ) ) )
+    return coefficients, y_mean - x_mean @ coefficients
+
+# PLS1 regression (NIPALS) with 'components' latent variables.
+# Returns ( coefficients, intercept )
+def fit_pls( X, y, components ):
+    x_mean, y_mean = X.mean( axis = 0 ), y.mean()
+    residual       = X - x_mean
+    target         = y - y_mean
+    components     = max( 1, min( components, X.shape[ 0 ] - 1, X.shape[ 1 ] ) )
+    weights        = np.zeros( ( X.shape[ 1 ], components ) )
+    loadings       = np.zeros( ( X.shape[ 1 ], components ) )
+    y_loadings     = np.zeros( components )
+    for component in range( components ):
+        weight = residual.T @ target
+        norm   = np.linalg.norm( weight )
+        if norm == 0: break
+        weight /= norm
+        score   = residual @ weight
+        scale   = score @ score
+        loadings  [ :, component ] = residual.T @ score / scale
+        y_loadings[ component ]    = target @ score / scale
+        weights   [ :, component ] = weight
+        residual = residual - np.outer( score, loadings[ :, component ] )
+        target   = target - score * y_loadings[ component ]
+    coefficients = weights @ np.linalg.pinv( loadings.T @ weights ) @ y_loadings
+    return coefficients, y_mean - x_mean @ coefficients
+
+def fit_model( method, X, y, parameter ):
+    if method == 'pls':   return fit_pls( X, y, int( parameter ) )
+    if method == 'ridge': return fit_ridge( X, y, float( parameter ) )
+    raise ValueError( 'Unknown model method: ' + str( method ) )
+
+# Root mean squared error and coefficient of determination
+def regression_metrics( measured, predicted ):
+    residual = measured - predicted
+    total    = ( ( measured - measured.mean() ) ** 2 ).sum()
+    return {
+        'rmse' : float( np.sqrt( ( residual ** 2 ).mean() ) ),
+        'r2'   : float( 1 - ( residual ** 2 ).sum() / total ) if total > 0 else 0.0
+    }
+
+# ----------------------------------------------------------------- #
+#                     PARALLEL CROSS-VALIDATION                     #
+# ----------------------------------------------------------------- #
+
+# Default number of cross-validation folds, and problems below which the
+# folds are run in the calling process (starting workers costs more)
+MODEL_FOLDS             = 5
+PARALLEL_MIN_CELLS      = 2000000
+
+# Fold of every row: whole groups (sample ids) go to the same fold, so
+# replicate spectra of a sample are never on both sides of a split
+def group_folds( groups, folds = MODEL_FOLDS, seed = 0 ):
+    codes, uniques = pd.factorize( np.asarray( groups, dtype = object ) )
+    group_fold     = np.random.default_rng( seed ).permutation( len( uniques ) ) % max( 1, min( folds, len( uniques ) ) )
+    return group_fold[ codes ]
+
+# Process pool shared by all the calls of train_models, e.g. by the
+# training callbacks of the dashboard, which run in the threads of the web
+# server: one pool is started on first use instead of one per request
+_model_pool      = None
+_model_pool_lock = threading.Lock()
+
+# The shared pool (with 'processes' workers, from the call starting it; later
+# calls use its workers whatever their 'processes'), or
+# None inside a worker process, which cannot start a pool (e.g. a spawned
+# worker re-importing the dashboard, see ledger_util.in_worker_process)
+def get_model_pool( processes = None ):
+    global _model_pool
+    if in_worker_process(): return None
+    with _model_pool_lock:
+        if _model_pool is None: _model_pool = ProcessPoolExecutor( processes )
+        return _model_pool
+
+# Drop a broken shared pool (a worker died), so the next call starts a new one
+def reset_model_pool( pool ):
+    global _model_pool
+    with _model_pool_lock:
+        if _model_pool is pool: _model_pool = None
+    pool.shutdown( wait = False )
+
+# One task: fit the model of one target without one fold (or with all the
+# rows if fold is None). Returns the task and the predictions of the
+# left-out rows, or the fitted model
+def _run_model_task( task, X, Y, fold_ids ):
+    target, fold, method, parameter = task
+    y              = Y[ :, target ]
+    known          = ~np.isnan( y )
+    train          = known if fold is None else known & ( fold_ids != fold )
+    coefficients, intercept = fit_model( method, X[ train ], y[ train ], parameter )
+    if fold is None: return task, ( coefficients, intercept )
+    test = np.flatnonzero( known & ( fold_ids == fold ) )
+    return task, ( test, X[ test ] @ coefficients + intercept )
+
+# Run a batch of tasks over the data of one call of train_models. The
+# data are sent to a worker once per batch instead of once per task
+def _run_model_batch( X, Y, fold_ids, tasks ):
+    return [ _run_model_task( task, X, Y, fold_ids ) for task in tasks ]
+
+# Fit one model per target column of Y and cross-validate it. Every
+# ( target, fold ) pair and every final fit is a separate task; for large
+# problems, the tasks run in the shared pool (see get_model_pool), in one
+# batch per worker, so the data are sent to every worker once. They run
+# in the calling process if the pool cannot be used.
+# Returns one result per target:
+#   'coefficients', 'intercept' : the model fitted on all the rows
+#   'predictions'               : cross-validated predictions (NaN if unknown)
+#   'cv', 'calibration'         : rmse and r2 of the CV and of the fit
+def train_models(
+    X,
+    Y,
+    groups,
+    targets,
+    method             = 'pls',
+    parameter          = None,
+    folds              = MODEL_FOLDS,
+    processes          = None,
+    parallel_min_cells = PARALLEL_MIN_CELLS
+):
+    if parameter is None: parameter = MODEL_METHODS[ method ]
+    X, Y     = np.asarray( X, dtype = np.float64 ), np.asarray( Y, dtype = np.float64 ).reshape( len( X ), -1 )
+    fold_ids = group_folds( groups, folds )
+    tasks    = [ ( target, fold, method, parameter ) for target in range( Y.shape[ 1 ] ) for fold in list( np.unique( fold_ids ) ) + [ None ] ]
+
+    outputs = None
+    pool    = get_model_pool( processes ) if X.size >= parallel_min_cells and processes != 1 else None
+    if pool is not None:
+        workers = pool._max_workers
+        futures = [ pool.submit( _run_model_batch, X, Y, fold_ids, tasks[ start :: workers ] ) for start in range( min( workers, len( tasks ) ) ) ]
+        try:
+            outputs = [ output for future in futures for output in future.result() ]
+        except BrokenProcessPool:
+            reset_model_pool( pool )
+    if outputs is None: outputs = _run_model_batch( X, Y, fold_ids, tasks )
+
+    results = {}
+    for target, name in enumerate( targets ):
+        predictions = np.full( len( X ), np.nan )
+        for ( task_target, fold, _, _ ), output in outputs:
+            if task_target != target: continue
+            if fold is None: coefficients, intercept = output
+            else:            predictions[ output[ 0 ] ] = output[ 1 ]
+        known = ~np.isnan( Y[ :, target ] ) & ~np.isnan( predictions )
+        results[ name ] = {
+            'coefficients' : coefficients,
+            'intercept'    : float( intercept ),
+            'predictions'  : predictions,
+            'cv'           : regression_metrics( Y[ known, target ], predictions[ known ] ),
+            'calibration'  : regression_metrics( Y[ known, target ], X[ known ] @ coefficients + intercept )
+        }
+    return results
+
+# Usage:
+#   python model_util.py testdata/FTIR_Air.csv testdata/micro_Air.csv   CV metrics of the log counts
+if __name__ == '__main__':
+    from spectra_util import load_spectra
+    spectra = load_spectra( sys.argv[ 1 ] if len( sys.argv ) > 1 else './testdata/FTIR_Air.csv' )
+    table   = read_sample_table( sys.argv[ 2 ] if len( sys.argv ) > 2 else './testdata/micro_Air.csv' )
+    spectrum_rows, table_rows = join_samples( spectra.samples, table )
+    for method in MODEL_METHODS:
+        results = train_models( spectra.matrix[ spectrum_rows ], log_counts( table[ MICRO_TARGETS ].to_numpy()[ table_rows ] ),
+                                spectra.samples[ spectrum_rows ], MICRO_TARGETS, method )
+        print( method, json.dumps( { target : result[ 'cv' ] for target, result in results.items() } ) )
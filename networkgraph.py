@@ -5,6 +5,7 @@ import dash_bootstrap_components as dbc                     # For align componen
 import dash_cytoscape as cyto                               # For network graph with Dash
 import json                                                 # For reading and parsing JSON file
 import seaborn as sns                                       # For colour palette to colorise nodes
+from   ledger_util import iter_ledger_records, BRANCHES_COLUMNS # For streaming the ledger file
 
 # ----------------------------------------------------------------- #
 #                               UTILS                               #
@@ -96,14 +97,9 @@ def showContent( content ):
 #                     JSON FILE READING SECTION                     #
 # ----------------------------------------------------------------- #
 
-# Read JSON file as raw txt data
-file_input = open( 'tx_monitor_milk_V2.json.txt' )
-
-# Load and parse the JSON data
-json_data = json.load( file_input )
-
-# Pick up branches object
-json_data = json_data[ 'branches' ]
+# Stream 'branches' records from the JSON file, keeping only the
+# properties used by the network graph
+json_data = [ record for section, record in iter_ledger_records( 'tx_monitor_milk_V2.json.txt', { 'branches' : BRANCHES_COLUMNS } ) ]
 
 # Loop to print every single object
 #for object in json_data: print( object )
@@ -4,90 +4,17 @@ from   dash import Dash, html, Input, Output, callback, dcc # For general Dash m
 import dash_bootstrap_components as dbc                     # For align component
 import dash_cytoscape as cyto                               # For network graph with Dash
 import json                                                 # For reading and parsing JSON file
+import copy                                                 # For copying the default stylesheet
+import zlib                                                 # For stable hashes of category names
+import numpy as np                                          # For category code arrays
+import pandas as pd                                         # For date filter bounds and category codes
 import seaborn as sns                                       # For colour palette to colorise nodes
+from   filter_util import FilterCondition, FilterExpression, highlighted_node_ids, node_ids_to_selector, edge_pairs_to_selector, NO_MATCH_SELECTOR # For node-highlighting filters
 
 # ----------------------------------------------------------------- #
 #                               UTILS                               #
 # ----------------------------------------------------------------- #
 
-# Function to update node-hilighting filter condition
-# arg is String argument value
-# property is target property which is changed
-# condition is original condition before chenged
-def setFilterCondition( value, target, condition ):
-    # Convert None as string
-    if value == None: value = 'None'
-
-    # Remove white space, '[' and ']'
-    condition_updated = condition
-    #condition_updated = condition_updated.replace( ' ', '' )
-    condition_updated = condition_updated[ 1 : -1 ]
-
-    # Make it Array with the delimiter ']['
-    condition_updated_array = condition_updated.split( '][' )
-
-    # If temperature is decoy(temperature_integer>999999), remove it
-    decoy = 'temperature_integer>999999'
-    if decoy in condition_updated_array:
-        condition_updated_array.remove( decoy )
-    print( condition_updated_array )
-
-    # Check if this filter condition already exist
-    condition_exist = False
-    for element in condition_updated_array:
-        if target in element: condition_exist = True
-
-    # Add the new condition
-    if condition_exist == False:
-        print( target, 'does not exist' )
-        if target == 'owner' or target == 'product_name':
-            print( '... and target is owner or product name' )
-            target_updated = target + '="' + value + '"'
-            condition_updated_array.append( target_updated )
-        else:
-            print( '... and taget is neither owner nor product name' )
-            target_updated = target + '>' + value
-            condition_updated_array.append( target_updated )
-
-    # Modify the existing condition
-    if condition_exist == True:
-        print( target, 'does exists' )
-        for i in range( len( condition_updated_array ) ):
-            if target in condition_updated_array[ i ]:
-                if target == 'owner' or target == 'product_name':
-                    print( '... and target is owner or product name' )
-                    target_updated = target + '="' + value + '"'
-                    condition_updated_array[ i ] = target_updated
-                    break
-                else:
-                    print( '... and target is neither owner nor product name' )
-                    target_updated = target + '>' + value
-                    condition_updated_array[ i ] = target_updated
-                    break
-
-    # If an element contains 'None' type, remove it
-    for element in condition_updated_array:
-        if 'None' in element:
-            print( 'None type found:', element )
-            condition_updated_array.remove( element )
-    print('after removed:', condition_updated_array)
-    print( len( condition_updated_array ) )
-
-    # Combine all the elements of array to String again
-    result = ''
-    if len( condition_updated_array ) == 0:
-        result = 'temperature_integer>999999'
-    else:
-        delimiter = ']['
-        result    = delimiter.join( condition_updated_array )
-
-    # Add '[' and ']'
-    result = '[' + result + ']'
-
-    print( 'RESULT:' )
-    print( result )
-    return result
-
 # show content
 def showContent( content ):
     print( '\n\nContent:' )
@@ -97,21 +24,64 @@ def showContent( content ):
 #                     JSON FILE READING SECTION                     #
 # ----------------------------------------------------------------- #
 
-def create_networkgraph_inputdata( json_data ):
-    result = json_data
-
-    # Convert 'Weight' and 'Temperature' into integer values
-    # They are assigned to newly defined properties 'WeightInteger'
-    # and 'TemperatureInteger'.
-    for i in range( len( result ) ):
-        # Convert string into integer
-        object          = result[ i ]
-        weight_int      = int( object[ 'Weight' ] )
-        temperature_int = int( object[ 'Temperature' ] )
-        # Define new properties, 'WeightInteger' and 'TemperatureInteger'
-        ( result[ i ] )[ 'WeightInteger' ]      = weight_int
-        ( result[ i ] )[ 'TemperatureInteger' ] = temperature_int
-    #print(result)
+# Range of node sizes which weight values are normalised into
+NODE_SIZE_MIN = 30
+NODE_SIZE_MAX = 100
+
+# Parse ledger values ('750', '750.5', ' 5 ', '', None, ...) into floats.
+# Values which cannot be parsed become NaN instead of raising an error.
+# Ledgers repeat the same few weights and temperatures, so each distinct
+# value is parsed once and the results are gathered by code.
+def parse_numeric_column( values ):
+    codes, uniques = pd.factorize( pd.Series( values ) )
+    uniques        = pd.Series( uniques, dtype = object )
+    parsed         = pd.to_numeric( uniques, errors = 'coerce' ).astype( float )
+    # Retry values with surrounding white space
+    failed = parsed.isna() & uniques.notna()
+    if failed.any():
+        parsed[ failed ] = pd.to_numeric( uniques[ failed ].astype( str ).str.strip(), errors = 'coerce' )
+    # Code -1 (missing value) picks the NaN appended at the end
+    return np.append( parsed.to_numpy( dtype = float ), np.nan )[ codes ]
+
+# Range ( minimum, maximum ) of the values which can be parsed, or None
+def value_range( values ):
+    values = np.asarray( values, dtype = float )
+    valid  = values[ ~np.isnan( values ) ]
+    if len( valid ) == 0: return None
+    return float( valid.min() ), float( valid.max() )
+
+# Normalise values into [ low, high ] with array operations.
+# The range of the values themselves is used, unless 'fixed_range' is given
+# (e.g. the range of the nodes which are already shown, so that the sizes
+# of new nodes match them); values outside it are clipped.
+# If all the values are the same (or none can be parsed) there is no range
+# to normalise over, so every node gets the middle size. Missing values
+# get the smallest size.
+def normalise_node_sizes( values, low = NODE_SIZE_MIN, high = NODE_SIZE_MAX, fixed_range = None ):
+    values = np.asarray( values, dtype = float )
+    valid  = ~np.isnan( values )
+    bounds = fixed_range if fixed_range is not None else value_range( values )
+    if bounds is None or bounds[ 1 ] == bounds[ 0 ]:
+        sizes = np.full( len( values ), ( low + high ) / 2 )
+    else:
+        sizes = ( values - bounds[ 0 ] ) / ( bounds[ 1 ] - bounds[ 0 ] ) * ( high - low ) + low
+        sizes = np.clip( sizes, low, high )
+    return np.where( valid, sizes, low )
+
+# 'weight_range' fixes the weights normalised to the smallest and largest
+# node sizes (see normalise_node_sizes)
+def create_networkgraph_inputdata( json_data, weight_range = None ):
+    # 'branches' records as a data frame (a list of records is accepted as well)
+    if isinstance( json_data, pd.DataFrame ): result = json_data.copy()
+    else:                                     result = pd.DataFrame( list( json_data ) )
+
+    # Convert 'Weight' and 'Temperature' into numbers, assigned to
+    # the properties 'WeightInteger' and 'TemperatureInteger'.
+    # Unparsable values become NaN (missing in the nodes).
+    weight      = parse_numeric_column( result[ 'Weight'      ] )
+    temperature = parse_numeric_column( result[ 'Temperature' ] )
+    result[ 'WeightInteger'      ] = weight
+    result[ 'TemperatureInteger' ] = temperature
 
     # After that, 'WeightInteger' values are normalised so that the
     # maxima are 100 and the minima are 30, because
@@ -119,32 +89,9 @@ def create_networkgraph_inputdata( json_data ):
 
     # Note that 'WeightTemperature' values are not actually normalised,
     # just being multiplied by 10 (because they should not relative values!)
-
-    # Get maxima and minima of weight values at the first place
-    weight_int_list = [ object[ 'WeightInteger' ] for object in result ]
-    #print( weight_int_list )
-    weight_int_max  = max( weight_int_list )
-    weight_int_min  = min( weight_int_list )
-
-    # So do in temperature values as well
-    temperature_int_list = [ object[ 'TemperatureInteger' ] for object in result ]
-    #print( temperature_int_list )
-    temperature_int_max = max( temperature_int_list )
-    temperature_int_min = min( temperature_int_list )
-
-    # Now normalise values - the result values are assigned to
-    # newly defined properties 'NodeSizeInWeight' and 'NodeSizeInTemperature'
-    for i in range( len( result ) ):
-        # Normalise weight
-        object     = result[ i ]
-        weight_int = object[ 'WeightInteger' ]
-        node_size_weight = ( ( weight_int     - weight_int_min ) / \
-                             ( weight_int_max - weight_int_min ) ) * 70 + 30
-        ( result[ i ] )[ 'NodeSizeInWeight' ] = node_size_weight
-        # Normalise temperature as well
-        temperature_int       = object[ 'TemperatureInteger' ]
-        node_size_temperature = temperature_int * 10
-        ( result[ i ] )[ 'NodeSizeInTemperature' ] = node_size_temperature
+    # Below-zero temperatures would give a negative size, so sizes are clipped at 0
+    result[ 'NodeSizeInWeight'      ] = normalise_node_sizes( weight, fixed_range = weight_range )
+    result[ 'NodeSizeInTemperature' ] = np.where( np.isnan( temperature ), NODE_SIZE_MIN, np.clip( temperature * 10, 0, None ) )
     #print( result )
 
     return result
@@ -153,133 +100,206 @@ def create_networkgraph_inputdata( json_data ):
 #                 NODES AND EDGES CREATING SECTION                  #
 # ----------------------------------------------------------------- #
 
-# Define nodes from Json data
+# Node data properties and the 'branches' columns they are taken from
+NODE_DATA_COLUMNS = {
+    'id'                    : 'Hash',                  # Let's Use hash as the node's unique ID
+    'owner'                 : 'Owner',                 # Let's Use owner organisation name as label of the node
+    'product_name'          : 'ProductName',           # Product name
+    'product_id'            : 'ProductID',             # Product ID
+    'weight'                : 'Weight',                # Weight
+    'weight_integer'        : 'WeightInteger',         # Weight as number
+    'temperature'           : 'Temperature',           # Temperature as string
+    'temperature_integer'   : 'TemperatureInteger',    # Temperature as number
+    'location'              : 'Location',              # Location
+    'timestamp'             : 'EventTimestamp',        # Timestamp
+    'node_size_weight'      : 'NodeSizeInWeight',      # Node size in weight
+    'node_size_temperature' : 'NodeSizeInTemperature', # Node size in temperature
+    'hash'                  : 'Hash',                  # Hash (it is same as 'id'. Is it needy???)
+    'previous_hash'         : 'PreviousHash'           # Previous hash
+}
+
+# Value of a node property as a plain Python object, with None for
+# missing values (NaN is not valid JSON)
+def json_value( value ):
+    if isinstance( value, np.generic ): value = value.item()
+    if isinstance( value, float ) and value != value: return None
+    return value
+
+# Column values as an array, with None for missing values in object
+# columns (numeric columns keep NaN, see json_value)
+def column_values( column ):
+    column = pd.Series( column )
+    if column.dtype.kind == 'M': column = column.astype( object )
+    if column.dtype.kind != 'O' or not column.hasnans: return column.to_numpy()
+    return column.where( column.notna(), None ).to_numpy( dtype = object )
+
+# Cytoscape node elements held as columns: one array per data property,
+# plus the preset positions. A node element is only built when it is
+# accessed (e.g. for the nodes of the overview or of a loaded subgraph),
+# so a ledger of a million blocks does not hold a million dicts.
+# Appended nodes are kept as chunks, which are only concatenated when a
+# whole column is read, so extending the records costs the new nodes only.
+# Supports len(), indexing (an element is a new dict on every access),
+# iteration and extend() with other node records.
+class NodeRecords:
+    def __init__( self, columns, x = None, y = None ):
+        self.chunks    = [ dict( columns ) ]     # Data property -> array, per chunk
+        self.positions = [ ( x, y ) ]            # Preset x/y arrays (or None), per chunk
+        self.ends      = [ len( next( iter( columns.values() ) ) ) if columns else 0 ]
+        self.missing   = set()                   # Properties whose missing values are None
+
+    def __len__( self ):
+        return self.ends[ -1 ]
+
+    def __getitem__( self, position ):
+        if isinstance( position, slice ): return [ self[ i ] for i in range( *position.indices( len( self ) ) ) ]
+        if position < 0: position += len( self )
+        if not 0 <= position < len( self ): raise IndexError( 'node position out of range' )
+        chunk = np.searchsorted( self.ends, position, side = 'right' )
+        local = position - ( self.ends[ chunk - 1 ] if chunk else 0 )
+        node  = { 'data' : { key : json_value( values[ local ] ) for key, values in self.chunks[ chunk ].items() } }
+        x, y  = self.positions[ chunk ]
+        if x is not None: node[ 'position' ] = { 'x' : json_value( x[ local ] ), 'y' : json_value( y[ local ] ) }
+        return node
+
+    def __iter__( self ):
+        for position in range( len( self ) ): yield self[ position ]
+
+    # Concatenate the chunks into one
+    def consolidate( self ):
+        if len( self.chunks ) == 1: return
+        columns = { key : np.concatenate( [ chunk[ key ] for chunk in self.chunks ] ) for key in self.chunks[ 0 ] }
+        x, y    = None, None
+        if all( x is not None for x, _ in self.positions ):
+            x = np.concatenate( [ x for x, _ in self.positions ] )
+            y = np.concatenate( [ y for _, y in self.positions ] )
+        self.chunks, self.positions, self.ends = [ columns ], [ ( x, y ) ], [ len( self ) ]
+
+    # Values of one data property, one per node (None if missing)
+    def column( self, key ):
+        self.consolidate()
+        if key not in self.missing:
+            self.chunks[ 0 ][ key ] = column_values( self.chunks[ 0 ][ key ] )
+            self.missing.add( key )
+        return self.chunks[ 0 ][ key ]
+
+    def set_column( self, key, values ):
+        self.consolidate()
+        self.chunks[ 0 ][ key ] = np.asarray( values )
+        self.missing.discard( key )
+
+    def set_positions( self, x, y ):
+        self.consolidate()
+        self.positions = [ ( np.asarray( x ), np.asarray( y ) ) ]
+
+    # Append the nodes of other node records (with the same properties)
+    def extend( self, other ):
+        self.chunks   .extend( other.chunks )
+        self.positions.extend( other.positions )
+        self.ends     .extend( self.ends[ -1 ] + end for end in other.ends )
+        self.missing   = set()
+
+# Define nodes from the pre-processed 'branches' data frame.
+# The columns are only referenced here; node elements are built on access.
 def get_nodes( json_data ):
-    nodes = []
-    for object in json_data:
-        # Set data object
-        data = {
-            'id'                    : object[ 'Hash'                  ], # Let's Use hash as the node's unique ID
-            'owner'                 : object[ 'Owner'                 ], # Let's Use owner organisation name as label of the node
-            'product_name'          : object[ 'ProductName'           ], # Product name
-            'product_id'            : object[ 'ProductID'             ], # Product ID
-            'weight'                : object[ 'Weight'                ], # Weight
-            'weight_integer'        : object[ 'WeightInteger'         ], # Weight as integer
-            'temperature'           : object[ 'Temperature'           ], # Temperature as string
-            'temperature_integer'   : object[ 'TemperatureInteger'    ], # Temperature as integer
-            'location'              : object[ 'Location'              ], # Location
-            'timestamp'             : object[ 'EventTimestamp'        ], # Timestamp
-            'node_size_weight'      : object[ 'NodeSizeInWeight'      ], # Node size in weight
-            'node_size_temperature' : object[ 'NodeSizeInTemperature' ], # Node size in temperature
-            'hash'                  : object[ 'Hash'                  ], # Hash (it is same as 'id'. Is it needy???)
-            'previous_hash'         : object[ 'PreviousHash'          ], # Previous hash
-        }
-        nodes.append( { 'data' : data } )
+    if not isinstance( json_data, pd.DataFrame ): json_data = pd.DataFrame( list( json_data ) )
+    nodes = NodeRecords( { key : json_data[ column ].to_numpy() for key, column in NODE_DATA_COLUMNS.items() } )
 
     #print( nodes )
     return nodes
 
-# Colourise nodes based on their information
-def set_node_colours( nodes ):
+# Node attributes which are colourised, and the node property of their colour
+NODE_COLOUR_ATTRIBUTES = {
+    'owner'        : 'colour_owner',
+    'product_name' : 'colour_product',
+    'location'     : 'colour_location'
+}
+
+# Lightness levels of category colours
+CATEGORY_LIGHTNESS = [ 0.55, 0.65, 0.75 ]
+
+# Registry of categories (owner, product name, location) and their colours.
+# Each category gets an integer code the first time it is seen, and codes
+# never change afterwards, so categories can be added incrementally.
+# The colour of a category only depends on its name (a hue taken from a
+# stable hash), so colours are the same across reloads whatever the order
+# or number of categories.
+class CategoryColourRegistry:
+    def __init__( self, attributes = tuple( NODE_COLOUR_ATTRIBUTES ) ):
+        self.codes      = { attribute : {} for attribute in attributes } # category -> code
+        self.categories = { attribute : [] for attribute in attributes } # code -> category
+        self.colours    = { attribute : [] for attribute in attributes } # code -> colour
+
+    # Stable colour of a category name, from the husl colour space.
+    # The lightness also depends on the name, so that two names with
+    # close hues are still told apart.
+    @staticmethod
+    def category_colour( category ):
+        name      = str( category ).encode( 'utf-8' )
+        hue       = zlib.crc32( name ) / 2 ** 32
+        lightness = CATEGORY_LIGHTNESS[ zlib.adler32( name ) % len( CATEGORY_LIGHTNESS ) ]
+        return sns.husl_palette( 1, h = hue, l = lightness ).as_hex()[ 0 ]
+
+    # Register the values of one attribute and return their codes.
+    # Missing values are one category, None (factorize returns a new NaN
+    # for them on every call, which would never be found in 'codes')
+    def register( self, attribute, values ):
+        value_codes, uniques = pd.factorize( pd.Series( values, dtype = object ), use_na_sentinel = False )
+        codes  = self.codes[ attribute ]
+        lookup = np.empty( len( uniques ), dtype = np.int64 )
+        for i, category in enumerate( uniques ):
+            if pd.isna( category ): category = None
+            if category not in codes:
+                codes[ category ] = len( self.categories[ attribute ] )
+                self.categories[ attribute ].append( category )
+                self.colours   [ attribute ].append( self.category_colour( category ) )
+            lookup[ i ] = codes[ category ]
+        return lookup[ value_codes ]
+
+    # Colours of the codes of one attribute
+    def colours_of( self, attribute, codes ):
+        return np.asarray( self.colours[ attribute ], dtype = object )[ codes ]
+
+    # Sorted categories of one attribute, e.g. for filter dropdowns
+    def get_categories( self, attribute ):
+        return sorted( ( category for category in self.categories[ attribute ] if category is not None ), key = str )
+
+    # Dropdown options of one attribute
+    def dropdown_options( self, attribute ):
+        return [ { 'label' : str( category ), 'value' : category } for category in self.get_categories( attribute ) ]
+
+# Colourise nodes based on their information (node records, see
+# NodeRecords, or a list of node elements, updated in place).
+# The categories are registered in 'registry' (a new one if not given),
+# which also holds the category lists for the filters.
+def set_node_colours( nodes, registry = None ):
+    if registry is None: registry = CategoryColourRegistry()
     result = nodes
-    # 1.   Add another property named 'colour' to colourise nodes
-    # 1-1. Set list of organisation at the first place
-    owner_list = [ object[ 'data' ][ 'owner' ] for object in result ]
-    owner_list = list( set( owner_list ) )
-
-    # 1-2. Make colour palette using seaborn
-    colour_palette = sns.color_palette( 'husl', len( owner_list ) )
-    colour_palette = colour_palette.as_hex()
-    print( colour_palette )
-
-    # 1-3. Make a dictionary to connect org name and its colour
-    label_color_dict = {}
-    for i in range( len( owner_list ) ) : label_color_dict[ owner_list[ i ] ] = colour_palette[ i ]
-    print( label_color_dict )
-
-    # 1-4. Then, assign all the colour list 
-    for object in result:
-        # Define color for the organisation
-        colour = label_color_dict[ object[ 'data' ][ 'owner' ] ]
-        # Append new property 'colour'
-        object[ 'data' ][ 'colour_owner' ] = colour
-
-    # 2.   Add another property named 'colour' to colourise nodes
-    # 2-1. Set list of organisation at the first place
-    product_list = [ object[ 'data' ][ 'product_name' ] for object in result ]
-    product_list = list( set( product_list ) )
-
-    # 2-2. Make colour palette using seaborn
-    colour_palette = sns.color_palette( 'husl', len( product_list ) )
-    colour_palette = colour_palette.as_hex()
-    print( colour_palette )
-
-    # 2-3. Make a dictionary to connect org name and its colour
-    label_color_dict = {}
-    for i in range( len( product_list ) ) : label_color_dict[ product_list[ i ] ] = colour_palette[ i ]
-    print( label_color_dict )
-
-    # 2-4. Then, assign all the colour list 
-    for object in result:
-        # Define color for the organisation
-        colour = label_color_dict[ object[ 'data' ][ 'product_name' ] ]
-        # Append new property 'colour'
-        object[ 'data' ][ 'colour_product' ] = colour
-
-    # 3.   Add another property named 'colour' to colourise nodes
-    # 3-1. Set list of organisation at the first place
-    location_list = [ object[ 'data' ][ 'location' ] for object in result ]
-    location_list = list( set( location_list ) )
-
-    # 3-2. Make colour palette using seaborn
-    colour_palette = sns.color_palette( 'husl', len( location_list ) )
-    colour_palette = colour_palette.as_hex()
-    print( colour_palette )
-
-    # 3-3. Make a dictionary to connect org name and its colour
-    label_color_dict = {}
-    for i in range( len( location_list ) ) : label_color_dict[ location_list[ i ] ] = colour_palette[ i ]
-    print( label_color_dict )
-
-    # 3-4. Then, assign all the colour list 
-    for object in result:
-        # Define color for the organisation
-        colour = label_color_dict[ object[ 'data' ][ 'location' ] ]
-        # Append new property 'colour'
-        object[ 'data' ][ 'colour_location' ] = colour
-
-    # 4.  Create Owner list for the owner filter
-    # 4-1. Define blank array
-    owner_dropdown = []
-
-    # 4-2. Create owner dictionary for drop down
-    #      Reuse the 'owner_list' variable which was defined in 1-1.
-    for owner in owner_list:
-        dictionary_owner = { 'label' : owner, 'value' : owner }
-        owner_dropdown.append( dictionary_owner )
-
-    # 5.   Create product list for the owner filter
-    # 5-1. Define blank array
-    product_dropdown = []
-
-    # 5-2. Create owner dictionary for drop down
-    #      Reuse the 'product_list' variable which was defined in 1-1.
-    for product in product_list:
-        dictionary_product = { 'label' : product, 'value' : product }
-        product_dropdown.append( dictionary_product )
 
-    #print( result )
+    # 1. Encode every attribute as integer codes and look up their colours
+    colours = {}
+    for attribute, colour_property in NODE_COLOUR_ATTRIBUTES.items():
+        values = result.column( attribute ) if isinstance( result, NodeRecords ) else [ object[ 'data' ][ attribute ] for object in result ]
+        codes  = registry.register( attribute, values )
+        colours[ colour_property ] = registry.colours_of( attribute, codes )
+
+    # 2. Then, assign all the colours as columns, or in one sweep over the nodes
+    if isinstance( result, NodeRecords ):
+        for colour_property, values in colours.items(): result.set_column( colour_property, values )
+        return result
+    colour_lists = list( zip( *( values.tolist() for values in colours.values() ) ) )
+    for object, node_colours in zip( result, colour_lists ):
+        object[ 'data' ].update( zip( colours.keys(), node_colours ) )
+
     return result
 
-# Define edges from JSON data
-def get_edges(json_data):
-    edges = []
-    for object in json_data:
-        if ( object[ 'PreviousHash' ] != 'GenesisBlock' ):    # Ignore Genesis Block edge (or it makes an error!)
-            source = object[ 'PreviousHash' ]                 # Start point is previous hash
-            target = object[ 'Hash'         ]                 # End point is current hash
-            data   = { 'source' : source, 'target' : target } # Set data object
-            edges.append( { 'data' : data } )
+# Define edges from the 'branches' data frame
+def get_edges( json_data ):
+    if not isinstance( json_data, pd.DataFrame ): json_data = pd.DataFrame( list( json_data ) )
+    keep    = ( json_data[ 'PreviousHash' ] != 'GenesisBlock' ).to_numpy() # Ignore Genesis Block edge (or it makes an error!)
+    sources = json_data[ 'PreviousHash' ].to_numpy()[ keep ].tolist()        # Start point is previous hash
+    targets = json_data[ 'Hash'         ].to_numpy()[ keep ].tolist()        # End point is current hash
+    edges   = [ { 'data' : { 'source' : source, 'target' : target } } for source, target in zip( sources, targets ) ]
     #print( edges )
 
     return edges
@@ -321,8 +341,8 @@ def set_networkgraph_default_stylesheet():
             'selector' : '[ previous_hash *= "GenesisBlock" ]',
             'style'    : {}
         },
-        { # Additional style: if tempetature > n, the nodes are red
-            'selector' : '[temperature_integer>999999]', # Dummy!
+        { # Additional style: highlighted nodes are red (see set_networkgraph_stylesheet)
+            'selector' : NO_MATCH_SELECTOR, # Nothing is highlighted by default
             'style'    : {
                 'border-color'     : 'red',
                 'background-color' : '#FF4A4A',
@@ -330,12 +350,103 @@ def set_networkgraph_default_stylesheet():
                 'width'            : '80px',
                 'height'           : '80px'
             }
+        },
+        { # Additional style: nodes on the traced lineage path are outlined
+            'selector' : NO_MATCH_SELECTOR, # Nothing is traced by default
+            'style'    : {
+                'border-color' : '#F2A900',
+                'border-width' : 12
+            }
+        },
+        { # Additional style: edges on the traced lineage path
+            'selector' : NO_MATCH_SELECTOR,
+            'style'    : {
+                'line-color' : '#F2A900',
+                'width'      : 8
+            }
         }
     ]
     #print(network_stylesheet)
 
     return network_stylesheet
 
+# Default options of the network graph style (see the sidebar menu)
+NETWORKGRAPH_DEFAULT_OPTIONS = {
+    'node_size'   : 'data(node_size_weight)',
+    'node_colour' : 'data(colour_owner)',
+    'temperature' : None,   # Highlight nodes warmer than this
+    'weight'      : None,   # Highlight nodes heavier than this
+    'owner'       : None,   # Highlight nodes of these owners (list)
+    'product'     : None,   # Highlight nodes of these product names (list)
+    'location'    : None,   # Highlight nodes at these locations (list)
+    'date_from'   : None,   # Highlight nodes on or after this date
+    'date_to'     : None,   # Highlight nodes on or before this date
+    'combine'     : 'and',  # Combine the highlighting filters with 'and' or 'or'
+    'trace'       : None    # Outline a lineage path: { 'nodes' : [ hash, ... ], 'edges' : [ ( previous hash, hash ), ... ] }
+}
+
+# Node label shown for each node colour option
+NODE_COLOUR_LABELS = {
+    'data(colour_owner)'    : 'data(owner)',
+    'data(colour_product)'  : 'data(product_name)',
+    'data(colour_location)' : 'data(location)'
+}
+
+# Build the highlighting filter expression from an options record
+def build_filter_expression( options ):
+    conditions = []
+    if options[ 'temperature' ] is not None: conditions.append( FilterCondition( 'temperature_integer', '>', options[ 'temperature' ] ) )
+    if options[ 'weight'      ] is not None: conditions.append( FilterCondition( 'weight_integer',      '>', options[ 'weight'      ] ) )
+    if options[ 'owner'       ]:             conditions.append( FilterCondition( 'owner',        'in', options[ 'owner'    ] ) )
+    if options[ 'product'     ]:             conditions.append( FilterCondition( 'product_name', 'in', options[ 'product'  ] ) )
+    if options[ 'location'    ]:             conditions.append( FilterCondition( 'location',     'in', options[ 'location' ] ) )
+
+    # Date range: the end date is included as a whole day
+    if options[ 'date_from' ] is not None or options[ 'date_to' ] is not None:
+        date_range = []
+        if options[ 'date_from' ] is not None:
+            date_range.append( FilterCondition( 'timestamp', '>=', pd.Timestamp( options[ 'date_from' ] ).normalize() ) )
+        if options[ 'date_to' ] is not None:
+            date_range.append( FilterCondition( 'timestamp', '<', pd.Timestamp( options[ 'date_to' ] ).normalize() + pd.Timedelta( days = 1 ) ) )
+        conditions.append( FilterExpression( date_range, 'and' ) )
+
+    return FilterExpression( conditions, options[ 'combine' ] )
+
+# Build a stylesheet from the base (default) stylesheet and an options record.
+# The base stylesheet is copied, never modified, so that it can be shared
+# between sessions, threads and workers. The highlighting filter is
+# evaluated over 'node_table' (see filter_util.build_node_table) and the
+# matching nodes are written into the selector of the highlight style.
+# Pass only the rows of the nodes shown in the graph: the selector lists
+# every matching node of the table.
+def set_networkgraph_stylesheet( options, node_table, base_stylesheet = None ):
+    if base_stylesheet is None: base_stylesheet = set_networkgraph_default_stylesheet()
+    stylesheet = copy.deepcopy( base_stylesheet )
+
+    # Options which are not set fall back to the defaults
+    merged = dict( NETWORKGRAPH_DEFAULT_OPTIONS )
+    for key, value in options.items():
+        if value is not None: merged[ key ] = value
+    options = merged
+
+    # Node size and colour
+    stylesheet[ 0 ][ 'style' ][ 'width'            ] = options[ 'node_size'   ]
+    stylesheet[ 0 ][ 'style' ][ 'height'           ] = options[ 'node_size'   ]
+    stylesheet[ 0 ][ 'style' ][ 'background-color' ] = options[ 'node_colour' ]
+    if options[ 'node_colour' ] in NODE_COLOUR_LABELS:
+        stylesheet[ 0 ][ 'style' ][ 'label' ] = NODE_COLOUR_LABELS[ options[ 'node_colour' ] ]
+
+    # Highlighting filter
+    expression = build_filter_expression( options )
+    stylesheet[ 3 ][ 'selector' ] = node_ids_to_selector( highlighted_node_ids( expression, node_table ) )
+
+    # Traced lineage path
+    if options[ 'trace' ] is not None:
+        stylesheet[ 4 ][ 'selector' ] = node_ids_to_selector( options[ 'trace' ][ 'nodes' ] )
+        stylesheet[ 5 ][ 'selector' ] = edge_pairs_to_selector( options[ 'trace' ][ 'edges' ] )
+
+    return stylesheet
+
 # Set app layout
 def set_networkgraph_tab_layout():
     network_tab_styles = {
@@ -0,0 +1,163 @@
+
+# Import libraries
+import sys                                                  # For command line arguments
+import time                                                 # For PCA benchmark
+import numpy as np                                          # For the streamed matrix products
+
+# ----------------------------------------------------------------- #
+#                      OUT-OF-CORE RANDOMIZED PCA                   #
+# ----------------------------------------------------------------- #
+
+# Rows of the (memory-mapped) matrix processed at once; only one block of
+# rows is in memory at a time, besides the ( rows x components ) results
+PCA_CHUNK_ROWS = 8192
+
+# Default number of components, and extra random directions used to catch
+# them (oversampling) and passes refining them (power iterations)
+PCA_COMPONENTS       = 10
+PCA_OVERSAMPLES      = 10
+PCA_POWER_ITERATIONS = 4
+
+# Scaling of the columns before PCA: 'centre' removes the mean spectrum,
+# 'autoscale' also divides every wavenumber by its standard deviation
+PCA_SCALINGS = [ 'centre', 'autoscale' ]
+
+# Iterate ( start, end, block ) over blocks of rows of a matrix as float64,
+# transformed by 'preprocess' (a function of a block of rows) if given
+def iter_row_blocks( matrix, preprocess = None, chunk_rows = PCA_CHUNK_ROWS ):
+    for start in range( 0, len( matrix ), chunk_rows ):
+        block = np.asarray( matrix[ start : start + chunk_rows ], dtype = np.float64 )
+        if preprocess is not None: block = preprocess( block )
+        yield start, start + len( block ), block
+
+# Principal components of a matrix and the scores of its rows.
+# Rows are projected with transform(), e.g. new spectra in live mode.
+class PCAModel:
+    def __init__( self, mean, scale, loadings, explained_variance, total_variance, scores, preprocess = None ):
+        self.mean               = mean                  # Mean of every column
+        self.scale              = scale                 # Divisor of every column (ones for 'centre')
+        self.loadings           = loadings              # ( components x columns )
+        self.explained_variance = explained_variance    # Variance of the scores of every component
+        self.total_variance     = total_variance        # Variance of all the scaled columns
+        self.scores             = scores                # ( rows x components )
+        self.preprocess         = preprocess
+
+    def __len__( self ):
+        return len( self.explained_variance )
+
+    # Part of the total variance explained by every component
+    def explained_variance_ratio( self ):
+        if self.total_variance <= 0: return np.zeros_like( self.explained_variance )
+        return self.explained_variance / self.total_variance
+
+    # Scores of new rows (preprocessed the same way as the fitted ones)
+    def transform( self, values ):
+        values = np.atleast_2d( np.asarray( values, dtype = np.float64 ) )
+        if self.preprocess is not None: values = self.preprocess( values )
+        return ( ( values - self.mean ) / self.scale ) @ self.loadings.T
+
+# Randomized PCA (Halko et al.) of a matrix which may not fit in memory,
+# e.g. a memory-mapped spectra matrix. The matrix is only read block by
+# block: one pass for the column statistics, two passes per power
+# iteration, and three for the components and scores. Memory use is
+# O( ( rows + columns ) x ( components + oversamples ) ).
+# 'preprocess' is applied to every block of rows before scaling.
+def randomized_pca(
+    matrix,
+    components       = PCA_COMPONENTS,
+    scaling          = 'centre',
+    preprocess       = None,
+    oversamples      = PCA_OVERSAMPLES,
+    power_iterations = PCA_POWER_ITERATIONS,
+    chunk_rows       = PCA_CHUNK_ROWS,
+    seed             = 0
+):
+    if scaling not in PCA_SCALINGS: raise ValueError( 'Unknown PCA scaling: ' + str( scaling ) )
+    blocks = lambda: iter_row_blocks( matrix, preprocess, chunk_rows )
+
+    # Column means and variances, accumulated block by block
+    n, total, squares = 0, 0.0, 0.0
+    for start, end, block in blocks():
+        n       += len( block )
+        total   = total   + block.sum( axis = 0 )
+        squares = squares + ( block * block ).sum( axis = 0 )
+    if n < 2: raise ValueError( 'PCA needs at least two rows' )
+    mean     = total / n
+    variance = np.maximum( squares / n - mean * mean, 0 ) * n / ( n - 1 )
+    scale    = np.sqrt( variance ) if scaling == 'autoscale' else np.ones_like( mean )
+    scale[ scale == 0 ] = 1
+    scaled   = lambda block: ( block - mean ) / scale
+
+    columns  = len( mean )
+    width    = min( components + oversamples, n, columns )
+    random   = np.random.default_rng( seed )
+
+    # Range of the scaled matrix: Y = A @ omega, refined by power iterations
+    # ( Y = A @ ( A.T @ Q ) ), each product computed one block of rows at a time
+    def times( right ):
+        result = np.empty( ( n, right.shape[ 1 ] ) )
+        for start, end, block in blocks(): result[ start : end ] = scaled( block ) @ right
+        return result
+
+    def transposed_times( left ):
+        result = np.zeros( ( columns, left.shape[ 1 ] ) )
+        for start, end, block in blocks(): result += scaled( block ).T @ left[ start : end ]
+        return result
+
+    q = np.linalg.qr( times( random.standard_normal( ( columns, width ) ) ) )[ 0 ]
+    for iteration in range( power_iterations ):
+        q = np.linalg.qr( times( np.linalg.qr( transposed_times( q ) )[ 0 ] ) )[ 0 ]
+
+    # SVD of the small projection B = Q.T @ A gives the components
+    u, singular_values, vt = np.linalg.svd( transposed_times( q ).T, full_matrices = False )
+    components = min( components, width )
+    loadings   = vt[ : components ]
+    # Sign convention: the largest loading of every component is positive
+    signs      = np.sign( loadings[ np.arange( components ), np.abs( loadings ).argmax( axis = 1 ) ] )
+    signs[ signs == 0 ] = 1
+    loadings   = loadings * signs[ :, None ]
+    # Scores are the exact projections of the rows, as for transform()
+    scores     = times( loadings.T )
+
+    return PCAModel(
+        mean,
+        scale,
+        loadings,
+        singular_values[ : components ] ** 2 / ( n - 1 ),
+        float( ( variance / scale ** 2 ).sum() ),
+        scores,
+        preprocess
+    )
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Compare randomized_pca with an exact SVD of the whole matrix
+def benchmark_pca( shapes = ( ( 1000, 1000 ), ( 10000, 2000 ), ( 100000, 1000 ) ), components = PCA_COMPONENTS ):
+    for rows, columns in shapes:
+        random = np.random.default_rng( 0 )
+        matrix = ( random.standard_normal( ( rows, 20 ) ) @ random.standard_normal( ( 20, columns ) )
+                 + 0.1 * random.standard_normal( ( rows, columns ) ) ).astype( np.float32 )
+        start  = time.perf_counter()
+        model  = randomized_pca( matrix, components )
+        print( 'randomized PCA of', rows, 'x', columns, ':', round( time.perf_counter() - start, 3 ), 's,',
+               'explained variance', round( float( model.explained_variance_ratio().sum() ), 4 ) )
+        if rows * columns <= 2 * 10 ** 7:
+            start    = time.perf_counter()
+            centred  = matrix - matrix.mean( axis = 0 )
+            exact    = np.linalg.svd( centred.astype( np.float64 ), compute_uv = False )
+            print( 'exact SVD                    :', round( time.perf_counter() - start, 3 ), 's,',
+                   'explained variance', round( float( ( exact[ : components ] ** 2 ).sum() / ( exact ** 2 ).sum() ), 4 ) )
+
+# Usage:
+#   python pca_util.py testdata/FTIR_Air.csv   explained variance of the FTIR spectra
+#   python pca_util.py                         run the benchmark
+if __name__ == '__main__':
+    if len( sys.argv ) > 1:
+        from spectra_util import load_spectra
+        model = randomized_pca( load_spectra( sys.argv[ 1 ] ).matrix )
+        for component, ratio in enumerate( model.explained_variance_ratio(), start = 1 ):
+            print( 'PC' + str( component ), round( float( ratio ) * 100, 2 ), '%' )
+    else:
+        benchmark_pca()
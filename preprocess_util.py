@@ -0,0 +1,238 @@
+
+# Import libraries
+import os                                                   # For deleting evicted stage outputs
+import math                                                 # For derivative scaling
+import atexit                                               # For removing the stage output directory
+import shutil                                               # For removing the stage output directory
+import tempfile                                             # For the stage output files
+import threading                                            # For computing stage outputs once
+import numpy as np                                          # For batched operations over the spectra matrix
+from   pca_util import iter_row_blocks, PCA_CHUNK_ROWS      # For fitting references block by block
+from   cache_util import LRUCache                           # For the stage outputs kept
+
+# ----------------------------------------------------------------- #
+#                       PREPROCESSING STAGES                        #
+# ----------------------------------------------------------------- #
+# Every stage works on a ( spectra x wavenumbers ) matrix (or a block of its
+# rows) at once, one spectrum independently of the others.
+
+# Keep the columns between two wavenumbers (inclusive)
+def trim_spectra( values, wavenumbers, low = None, high = None ):
+    keep = np.ones( len( wavenumbers ), dtype = bool )
+    if low  is not None: keep &= wavenumbers >= low
+    if high is not None: keep &= wavenumbers <= high
+    return values[ :, keep ], wavenumbers[ keep ]
+
+# Standard normal variate: centre and scale every spectrum by its own
+# mean and standard deviation (scaled in place, as blocks are preprocessed
+# on every pass of a streamed PCA)
+def standard_normal_variate( values ):
+    centred = values - values.mean( axis = 1, keepdims = True )
+    std     = np.sqrt( np.einsum( 'ij,ij->i', centred, centred ) / max( values.shape[ 1 ], 1 ) )[ :, None ]
+    std[ std == 0 ] = 1
+    centred /= std
+    return centred
+
+# Multiplicative scatter correction: fit every spectrum as a + b * reference
+# by least squares and return ( spectrum - a ) / b. The reference is the
+# mean spectrum unless given (e.g. the one fitted on the whole dataset).
+def multiplicative_scatter_correction( values, reference = None ):
+    if reference is None: reference = values.mean( axis = 0 )
+    centred_reference = reference - reference.mean()
+    denominator       = ( centred_reference * centred_reference ).sum()
+    slope             = ( values - values.mean( axis = 1, keepdims = True ) ) @ centred_reference / denominator if denominator > 0 else np.ones( len( values ) )
+    intercept         = values.mean( axis = 1 ) - slope * reference.mean()
+    slope[ slope == 0 ] = 1
+    corrected         = values - intercept[ :, None ]
+    corrected        /= slope[ :, None ]
+    return corrected, reference
+
+# Savitzky-Golay filter coefficients: the least-squares polynomial of
+# degree 'order' over 'window' points, evaluated (or differentiated
+# 'derivative' times) at the centre point. 'delta' is the axis spacing.
+def savitzky_golay_coefficients( window, order, derivative = 0, delta = 1.0 ):
+    if window % 2 == 0 or window < 1: raise ValueError( 'Savitzky-Golay window must be odd: ' + str( window ) )
+    if order >= window:               raise ValueError( 'Savitzky-Golay order must be less than the window' )
+    if derivative > order:            raise ValueError( 'Savitzky-Golay derivative must not exceed the order' )
+    half        = window // 2
+    vandermonde = np.vander( np.arange( -half, half + 1, dtype = np.float64 ), order + 1, increasing = True )
+    return np.linalg.pinv( vandermonde )[ derivative ] * math.factorial( derivative ) / delta ** derivative
+
+# Savitzky-Golay smoothing or derivative of every spectrum. The ends are
+# padded with the first and last values. The filter is one product of a
+# sliding window view of the whole matrix (no copy) with the coefficients.
+def savitzky_golay( values, window, order, derivative = 0, delta = 1.0 ):
+    coefficients = savitzky_golay_coefficients( window, order, derivative, delta )
+    half         = window // 2
+    padded       = np.pad( values, ( ( 0, 0 ), ( half, half ) ), mode = 'edge' )
+    return np.lib.stride_tricks.sliding_window_view( padded, window, axis = 1 ) @ coefficients
+
+# ----------------------------------------------------------------- #
+#                       PREPROCESSING PIPELINE                      #
+# ----------------------------------------------------------------- #
+
+# Stages and their parameters (with defaults)
+PREPROCESSING_STAGES = {
+    'trim'   : { 'low' : None, 'high' : None },
+    'snv'    : {},
+    'msc'    : {},
+    'savgol' : { 'window' : 11, 'order' : 2, 'derivative' : 0 }
+}
+
+# Sequence of preprocessing stages, e.g.
+#   PreprocessingPipeline( [ ( 'trim', { 'low' : 600 } ), ( 'snv', {} ), ( 'savgol', { 'derivative' : 1 } ) ] )
+# Stages are normalised into hashable ( name, ( ( parameter, value ), ... ) )
+# tuples, so that a pipeline can key a cache.
+# Every stage is row-wise once its parameters are fitted, so a fitted
+# pipeline preprocesses a (memory-mapped) matrix block by block, e.g. as
+# the 'preprocess' hook of pca_util.randomized_pca: the preprocessed
+# matrix is never held in memory as a whole.
+class PreprocessingPipeline:
+    def __init__( self, stages = () ):
+        self.stages            = tuple( self.normalise_stage( stage ) for stage in stages )
+        self.references        = {}    # Reference spectra fitted by 'msc' stages, by stage position
+        self.input_wavenumbers = None  # Wavenumbers of the fitted spectra
+        self.wavenumbers       = None  # Wavenumbers of the preprocessed spectra
+
+    @staticmethod
+    def normalise_stage( stage ):
+        name, parameters = ( stage, {} ) if isinstance( stage, str ) else ( stage[ 0 ], dict( stage[ 1 ] ) )
+        if name not in PREPROCESSING_STAGES: raise ValueError( 'Unknown preprocessing stage: ' + str( name ) )
+        unknown = set( parameters ) - set( PREPROCESSING_STAGES[ name ] )
+        if unknown: raise ValueError( 'Unknown parameters of ' + name + ': ' + ', '.join( sorted( unknown ) ) )
+        return name, tuple( sorted( dict( PREPROCESSING_STAGES[ name ], **parameters ).items() ) )
+
+    def key( self ):
+        return self.stages
+
+    # Apply one stage. Returns the values, the wavenumbers and the fitted
+    # reference (for 'msc')
+    @staticmethod
+    def apply_stage( stage, values, wavenumbers, reference = None ):
+        name, parameters = stage[ 0 ], dict( stage[ 1 ] )
+        values           = np.asarray( values, dtype = np.float64 )
+        if name == 'trim': return trim_spectra( values, wavenumbers, parameters[ 'low' ], parameters[ 'high' ] ) + ( None, )
+        if name == 'snv':  return standard_normal_variate( values ), wavenumbers, None
+        if name == 'msc':
+            values, reference = multiplicative_scatter_correction( values, reference )
+            return values, wavenumbers, reference
+        delta = float( np.abs( np.diff( wavenumbers ) ).mean() ) if len( wavenumbers ) > 1 else 1.0
+        return savitzky_golay( values, parameters[ 'window' ], parameters[ 'order' ], parameters[ 'derivative' ], delta ), wavenumbers, None
+
+    # Fit the pipeline on a matrix, reading it block by block. Only 'msc'
+    # stages have parameters: the reference of each is the mean spectrum
+    # after the stages before it, accumulated in one pass over the matrix.
+    # A pipeline without 'msc' reads nothing. Returns the pipeline.
+    def fit( self, matrix, wavenumbers, chunk_rows = PCA_CHUNK_ROWS ):
+        self.input_wavenumbers = np.asarray( wavenumbers )
+        self.references        = {}
+        for position, stage in enumerate( self.stages ):
+            if stage[ 0 ] != 'msc': continue
+            total, n = 0.0, 0
+            for start, end, block in iter_row_blocks( matrix, lambda block: self.transform( block, self.input_wavenumbers, position )[ 0 ], chunk_rows ):
+                total, n = total + block.sum( axis = 0, dtype = np.float64 ), n + len( block )
+            if n == 0: raise ValueError( 'Cannot fit a scatter correction reference without spectra' )
+            self.references[ position ] = total / n
+        self.wavenumbers = self.transform( np.zeros( ( 0, len( self.input_wavenumbers ) ) ), self.input_wavenumbers )[ 1 ]
+        return self
+
+    # Apply the fitted pipeline (or its first 'stop' stages) to spectra,
+    # e.g. a block of rows of the fitted matrix, or new spectra to score
+    # against a model built on preprocessed data. Stages run in float64.
+    # Returns the values (float32) and their wavenumbers.
+    def transform( self, values, wavenumbers, stop = None ):
+        values, wavenumbers = np.atleast_2d( values ), np.asarray( wavenumbers )
+        for position, stage in enumerate( self.stages[ : stop ] ):
+            if stage[ 0 ] == 'msc' and position not in self.references: raise ValueError( 'Preprocessing pipeline is not fitted' )
+            values, wavenumbers, reference = self.apply_stage( stage, values, wavenumbers, self.references.get( position ) )
+        return np.asarray( values, dtype = np.float32 ), wavenumbers
+
+    # Preprocess a block of rows of spectra over the fitted wavenumbers (the
+    # 'preprocess' hook of iter_row_blocks and randomized_pca)
+    def preprocess( self, block ):
+        return self.transform( block, self.input_wavenumbers )[ 0 ]
+
+    # Fit the pipeline and preprocess the whole matrix in memory (for
+    # matrices which fit in memory; see preprocess otherwise)
+    def fit_transform( self, values, wavenumbers ):
+        return self.fit( values, wavenumbers ).transform( values, wavenumbers )
+
+# ----------------------------------------------------------------- #
+#                       PREPROCESSED STAGE OUTPUTS                  #
+# ----------------------------------------------------------------- #
+
+# Stage outputs kept at once (each about the size of the spectra matrix)
+PREPROCESSED_CACHE_ENTRIES = 4
+
+# Outputs of the stage prefixes of preprocessing pipelines over a spectra
+# matrix, in an LRU keyed by ( matrix key, stages so far ). A pipeline
+# starts from the longest of its prefixes already computed and runs the
+# remaining stages one at a time, block by block, each writing its output
+# (float32) to a memory-mapped file in 'directory' (in memory if None)
+# which is cached in turn. Changing the last stage of a pipeline thus only
+# runs that stage, and analyses (the passes of a PCA, a similarity search)
+# read the output rather than preprocessing every block again. The files
+# of evicted outputs are deleted. 'stage_runs' counts the stages run over
+# a whole matrix.
+class PreprocessedSpectraCache:
+    def __init__( self, directory = None, max_entries = PREPROCESSED_CACHE_ENTRIES, chunk_rows = PCA_CHUNK_ROWS ):
+        if directory is not None:
+            os.makedirs( directory, exist_ok = True )
+            directory = tempfile.mkdtemp( prefix = 'preprocessed-', dir = directory )
+            atexit.register( shutil.rmtree, directory, True )
+        self.directory  = directory
+        self.chunk_rows = chunk_rows
+        self.outputs    = LRUCache( max_entries, on_evict = self.delete )
+        self.lock       = threading.Lock()
+        self.stage_runs = 0
+
+    # Delete the file of an evicted output (a mapped array stays readable
+    # until it is released)
+    @staticmethod
+    def delete( key, output ):
+        values = output[ 0 ]
+        if isinstance( values, np.memmap ) and os.path.exists( values.filename ): os.remove( values.filename )
+
+    # Output matrix of a stage
+    def allocate( self, shape ):
+        if self.directory is None or shape[ 0 ] == 0 or shape[ 1 ] == 0: return np.empty( shape, dtype = np.float32 )
+        handle, path = tempfile.mkstemp( suffix = '.f32', dir = self.directory )
+        os.close( handle )
+        return np.memmap( path, dtype = np.float32, mode = 'w+', shape = shape )
+
+    # Preprocessed matrix of a pipeline, as ( values, fitted pipeline ). The
+    # fitted pipeline preprocesses new spectra (e.g. queries or spectra to
+    # score) like the rows of 'values'. 'key' identifies the matrix (e.g.
+    # SpectraDataset.key), whose rows are those of 'values'.
+    def get( self, key, matrix, wavenumbers, stages ):
+        stages = PreprocessingPipeline( stages ).stages
+        with self.lock:
+            done = len( stages )
+            while done > 0 and ( key, stages[ : done ] ) not in self.outputs: done -= 1
+            if done > 0: values, fitted = self.outputs.get( ( key, stages[ : done ] ) )
+            else:        values, fitted = matrix, PreprocessingPipeline().fit( matrix, wavenumbers )
+
+            for position in range( done, len( stages ) ):
+                stage     = stages[ position ]
+                reference = None
+                if stage[ 0 ] == 'msc':
+                    total = sum( block.sum( axis = 0 ) for start, end, block in iter_row_blocks( values, None, self.chunk_rows ) )
+                    if len( values ) == 0: raise ValueError( 'Cannot fit a scatter correction reference without spectra' )
+                    reference = total / len( values )
+                columns, stage_wavenumbers = PreprocessingPipeline.apply_stage( stage, np.zeros( ( 1, values.shape[ 1 ] ) ), fitted.wavenumbers, reference )[ : 2 ]
+                output = self.allocate( ( len( values ), columns.shape[ 1 ] ) )
+                for start, end, block in iter_row_blocks( values, None, self.chunk_rows ):
+                    output[ start : end ] = PreprocessingPipeline.apply_stage( stage, block, fitted.wavenumbers, reference )[ 0 ]
+                if isinstance( output, np.memmap ): output.flush()
+
+                # The fitted pipeline of this prefix
+                prefix                   = PreprocessingPipeline( stages[ : position + 1 ] )
+                prefix.references        = dict( fitted.references )
+                if reference is not None: prefix.references[ position ] = reference
+                prefix.input_wavenumbers = fitted.input_wavenumbers
+                prefix.wavenumbers       = stage_wavenumbers
+                values, fitted           = output, prefix
+                self.outputs.put( ( key, stages[ : position + 1 ] ), ( values, fitted ) )
+                self.stage_runs += 1
+
+        return values, fitted
@@ -0,0 +1,97 @@
+
+# Import libraries
+import time                                                 # For query benchmark
+import numpy as np                                          # For blocked distance computation
+
+# ----------------------------------------------------------------- #
+#                       NEAREST-NEIGHBOUR SEARCH                    #
+# ----------------------------------------------------------------- #
+
+# Rows of the index compared with the queries at once: the distances of
+# one block are a single matrix product of ( queries x block_rows )
+SIMILARITY_BLOCK_ROWS = 16384
+
+# Supported distances
+SIMILARITY_METRICS = [ 'cosine', 'euclidean' ]
+
+# k-nearest-neighbour index over the rows of a matrix (e.g. preprocessed
+# spectra, or their PCA scores for a faster search in fewer dimensions).
+# The rows are not copied: a float32 matrix (e.g. a memory-mapped one) is
+# read block by block at every query, and only the squared norms of the
+# rows are held. For 'cosine', the rows of a block are divided by their
+# norms, so that a distance is one minus a dot product.
+class SimilarityIndex:
+    def __init__( self, values, metric = 'cosine', block_rows = SIMILARITY_BLOCK_ROWS ):
+        if metric not in SIMILARITY_METRICS: raise ValueError( 'Unknown similarity metric: ' + str( metric ) )
+        self.metric     = metric
+        self.block_rows = block_rows
+        self.values     = np.atleast_2d( np.asarray( values, dtype = np.float32 ) )
+        self.norms      = np.concatenate( [ np.einsum( 'ij,ij->i', self.values[ start : start + block_rows ], self.values[ start : start + block_rows ] )
+                                            for start in range( 0, len( self.values ), block_rows ) ] or [ np.zeros( 0, dtype = np.float32 ) ] )
+        # Divisor of every row for 'cosine' (zero rows stay zero)
+        self.divisors   = np.where( self.norms == 0, 1, np.sqrt( self.norms ) )
+
+    def __len__( self ):
+        return len( self.values )
+
+    # Queries as float32, normalised for 'cosine' (zero rows stay zero)
+    def prepare( self, values ):
+        values = np.atleast_2d( np.asarray( values, dtype = np.float32 ) )
+        if self.metric == 'cosine':
+            norms = np.linalg.norm( values, axis = 1, keepdims = True )
+            values = values / np.where( norms == 0, 1, norms )
+        return values
+
+    # Distances between queries (already prepared) and a block of rows
+    def block_distances( self, queries, query_norms, start, end ):
+        products = queries @ self.values[ start : end ].T
+        if self.metric == 'cosine': return 1 - products / self.divisors[ None, start : end ]
+        return np.sqrt( np.maximum( query_norms[ :, None ] + self.norms[ None, start : end ] - 2 * products, 0 ) )
+
+    # The k nearest rows of every query, nearest first. Rows in 'exclude'
+    # (e.g. the query's own row) are skipped. Only the best k of each block
+    # are kept, so memory does not grow with the size of the index.
+    # Returns the ( queries x k ) row numbers and distances.
+    def query( self, queries, k = 10, exclude = () ):
+        queries     = self.prepare( queries )
+        query_norms = ( queries * queries ).sum( axis = 1 )
+        exclude     = np.asarray( exclude, dtype = np.int64 )
+        k           = min( k, len( self ) - len( exclude ) )
+        if k <= 0: return np.zeros( ( len( queries ), 0 ), dtype = np.int64 ), np.zeros( ( len( queries ), 0 ) )
+
+        best_rows      = np.zeros( ( len( queries ), 0 ), dtype = np.int64 )
+        best_distances = np.zeros( ( len( queries ), 0 ), dtype = np.float32 )
+        for start in range( 0, len( self ), self.block_rows ):
+            end       = min( start + self.block_rows, len( self ) )
+            distances = self.block_distances( queries, query_norms, start, end )
+            excluded  = exclude[ ( exclude >= start ) & ( exclude < end ) ] - start
+            distances[ :, excluded ] = np.inf
+
+            rows           = np.concatenate( [ best_rows, np.broadcast_to( np.arange( start, end ), distances.shape ) ], axis = 1 )
+            distances      = np.concatenate( [ best_distances, distances ], axis = 1 )
+            keep           = np.argpartition( distances, k - 1, axis = 1 )[ :, : k ] if distances.shape[ 1 ] > k else np.argsort( distances, axis = 1 )
+            best_rows      = np.take_along_axis( rows,      keep, axis = 1 )
+            best_distances = np.take_along_axis( distances, keep, axis = 1 )
+
+        order = np.argsort( best_distances, axis = 1, kind = 'stable' )
+        return np.take_along_axis( best_rows, order, axis = 1 ), np.take_along_axis( best_distances, order, axis = 1 )
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Time single-spectrum queries against random spectra, in the full space
+# and in a 10-dimensional (PCA-like) space
+def benchmark_similarity( rows = 100000, columns = 1000, queries = 20 ):
+    random = np.random.default_rng( 0 )
+    for dimensions in [ columns, 10 ]:
+        values = random.standard_normal( ( rows, dimensions ) ).astype( np.float32 )
+        for metric in SIMILARITY_METRICS:
+            index = SimilarityIndex( values, metric )
+            start = time.perf_counter()
+            for query in range( queries ): index.query( values[ query ], k = 10, exclude = [ query ] )
+            print( metric, 'k-NN query over', rows, 'x', dimensions, ':',
+                   round( ( time.perf_counter() - start ) / queries * 1000, 2 ), 'ms' )
+
+if __name__ == '__main__':
+    benchmark_similarity()
@@ -0,0 +1,264 @@
+
+# Import libraries
+import os                                                   # For cache file names and time stamps
+import sys                                                  # For command line arguments
+import io                                                   # For parsing appended rows
+import json                                                 # For the cache metadata file
+import time                                                 # For load time benchmark
+import hashlib                                              # For naming cache files after their source
+import threading                                            # For polling from concurrent callbacks
+import numpy as np                                          # For the memory-mapped spectra matrix
+import pandas as pd                                         # For reading the CSV file in chunks
+from   graph_util import build_group_index                  # For the sample id index
+
+# ----------------------------------------------------------------- #
+#                          FTIR CSV FORMAT                          #
+# ----------------------------------------------------------------- #
+
+# An FTIR file has one spectrum per row: a 'Sample' column followed by one
+# column per wavenumber, named 'X<wavenumber>' (e.g. 'X399.1927').
+# Several rows (replicates) may have the same sample id.
+SAMPLE_COLUMN          = 'Sample'
+WAVENUMBER_PREFIX      = 'X'
+
+# Rows of the CSV file converted at once when the binary cache is built
+SPECTRA_CHUNK_ROWS     = 4096
+
+# Directory of the binary caches, and version of their format
+SPECTRA_CACHE_DIRECTORY = './spectra_cache'
+SPECTRA_CACHE_FORMAT    = 1
+
+# Wavenumbers of the spectral columns, from their names
+def parse_wavenumbers( columns ):
+    wavenumbers = []
+    for column in columns:
+        if not column.startswith( WAVENUMBER_PREFIX ):
+            raise ValueError( 'Invalid FTIR column: ' + repr( column ) + ' (expected ' + WAVENUMBER_PREFIX + '<wavenumber>)' )
+        wavenumbers.append( float( column[ len( WAVENUMBER_PREFIX ) : ] ) )
+    return np.asarray( wavenumbers )
+
+# ----------------------------------------------------------------- #
+#                          BINARY CACHE                             #
+# ----------------------------------------------------------------- #
+
+# Paths of the cache files of a CSV file: the float32 matrix (row-major,
+# one spectrum after the other) and its metadata
+def spectra_cache_paths( path, cache_directory = SPECTRA_CACHE_DIRECTORY ):
+    name   = os.path.splitext( os.path.basename( path ) )[ 0 ]
+    digest = hashlib.sha1( os.path.abspath( path ).encode( 'utf-8' ) ).hexdigest()[ : 12 ]
+    base   = os.path.join( cache_directory, name + '-' + digest )
+    return base + '.f32', base + '.json'
+
+# Size and modification time of the source file; the cache is rebuilt
+# when they change
+def source_signature( path ):
+    status = os.stat( path )
+    return { 'format' : SPECTRA_CACHE_FORMAT, 'size' : status.st_size, 'mtime_ns' : status.st_mtime_ns }
+
+# Convert an FTIR CSV file into the binary cache, chunk by chunk, so the
+# whole text is never held in memory. Returns the metadata.
+def build_spectra_cache( path, cache_directory = SPECTRA_CACHE_DIRECTORY, chunk_rows = SPECTRA_CHUNK_ROWS ):
+    matrix_path, metadata_path = spectra_cache_paths( path, cache_directory )
+    os.makedirs( cache_directory, exist_ok = True )
+
+    columns = pd.read_csv( path, nrows = 0 ).columns.tolist()
+    if len( columns ) == 0 or columns[ 0 ] != SAMPLE_COLUMN:
+        raise ValueError( 'Invalid FTIR file: the first column must be ' + repr( SAMPLE_COLUMN ) + ' in ' + path )
+    wavenumbers = parse_wavenumbers( columns[ 1 : ] )
+
+    samples = []
+    with open( matrix_path + '.tmp', 'wb' ) as file:
+        for chunk in pd.read_csv( path, dtype = { SAMPLE_COLUMN : str }, chunksize = chunk_rows ):
+            samples += chunk[ SAMPLE_COLUMN ].tolist()
+            file.write( np.ascontiguousarray( chunk[ columns[ 1 : ] ].to_numpy( dtype = np.float32 ) ).tobytes() )
+
+    metadata = dict(
+        source_signature( path ),
+        rows        = len( samples ),
+        samples     = samples,
+        wavenumbers = wavenumbers.tolist()
+    )
+    # The metadata is written last: a cache without it is rebuilt
+    os.replace( matrix_path + '.tmp', matrix_path )
+    with open( metadata_path + '.tmp', 'w' ) as file: json.dump( metadata, file )
+    os.replace( metadata_path + '.tmp', metadata_path )
+    return metadata
+
+# Metadata of a valid cache of the CSV file, or None
+def read_spectra_cache_metadata( path, cache_directory = SPECTRA_CACHE_DIRECTORY ):
+    matrix_path, metadata_path = spectra_cache_paths( path, cache_directory )
+    if not os.path.exists( metadata_path ) or not os.path.exists( matrix_path ): return None
+    try:
+        with open( metadata_path ) as file: metadata = json.load( file )
+    except ( OSError, ValueError ):
+        return None
+    signature = source_signature( path )
+    if any( metadata.get( key ) != value for key, value in signature.items() ): return None
+    if os.path.getsize( matrix_path ) != 4 * metadata[ 'rows' ] * len( metadata[ 'wavenumbers' ] ): return None
+    return metadata
+
+# ----------------------------------------------------------------- #
+#                          SPECTRA DATASET                          #
+# ----------------------------------------------------------------- #
+
+# FTIR spectra held as a read-only float32 matrix (rows = spectra, columns
+# = wavenumbers), memory-mapped from the binary cache: only the pages of
+# the rows which are read are loaded. Spectra are looked up by row or by
+# sample id through a CSR index of the rows of every sample.
+# 'key' names the version of the data, for caching results derived from it.
+class SpectraDataset:
+    def __init__( self, matrix, samples, wavenumbers, path = None, key = None ):
+        self.matrix      = matrix
+        self.samples     = np.asarray( samples, dtype = object )
+        self.wavenumbers = np.asarray( wavenumbers, dtype = np.float64 )
+        self.path        = path
+        self.key         = key
+        self.sample_keys, self.sample_row_ids, self.sample_offsets = build_group_index( self.samples )
+
+    def __len__( self ):
+        return len( self.samples )
+
+    # Sample ids, in order of first appearance
+    def sample_ids( self ):
+        return self.sample_keys.tolist()
+
+    # Spectrum of one row (a view of the matrix, nothing is copied)
+    def spectrum( self, row ):
+        return self.matrix[ row ]
+
+    # Rows of a sample id (empty if unknown)
+    def rows( self, sample_id ):
+        code = self.sample_keys.get_indexer( [ sample_id ] )[ 0 ]
+        if code < 0: return np.zeros( 0, dtype = np.int64 )
+        return self.sample_row_ids[ self.sample_offsets[ code ] : self.sample_offsets[ code + 1 ] ]
+
+    # Spectra of a sample id. Replicates are usually stored next to each
+    # other, and are then returned as a view; otherwise only their rows
+    # are copied
+    def sample_spectra( self, sample_id ):
+        rows = self.rows( sample_id )
+        if len( rows ) > 0 and rows[ -1 ] - rows[ 0 ] == len( rows ) - 1:
+            return self.matrix[ rows[ 0 ] : rows[ -1 ] + 1 ]
+        return self.matrix[ rows ]
+
+    # Column slice of the wavenumbers between low and high (inclusive)
+    def column_range( self, low = None, high = None ):
+        ascending = len( self.wavenumbers ) < 2 or self.wavenumbers[ 0 ] <= self.wavenumbers[ -1 ]
+        axis      = self.wavenumbers if ascending else -self.wavenumbers
+        if not ascending: low, high = ( None if high is None else -high ), ( None if low is None else -low )
+        start = 0            if low  is None else int( np.searchsorted( axis, low,  side = 'left'  ) )
+        end   = len( axis )  if high is None else int( np.searchsorted( axis, high, side = 'right' ) )
+        return slice( start, max( start, end ) )
+
+# Load an FTIR CSV file. The first load converts it into a float32 binary
+# cache in 'cache_directory'; later loads memory-map that cache and skip
+# the CSV parsing. The cache is rebuilt when the CSV file changes.
+def load_spectra( path, cache_directory = SPECTRA_CACHE_DIRECTORY ):
+    metadata = read_spectra_cache_metadata( path, cache_directory )
+    if metadata is None: metadata = build_spectra_cache( path, cache_directory )
+
+    matrix_path = spectra_cache_paths( path, cache_directory )[ 0 ]
+    shape       = ( metadata[ 'rows' ], len( metadata[ 'wavenumbers' ] ) )
+    if shape[ 0 ] == 0 or shape[ 1 ] == 0: matrix = np.zeros( shape, dtype = np.float32 )
+    else:                                  matrix = np.memmap( matrix_path, dtype = np.float32, mode = 'r', shape = shape )
+    key = os.path.splitext( os.path.basename( matrix_path ) )[ 0 ] + '-' + str( metadata[ 'mtime_ns' ] )
+    return SpectraDataset( matrix, metadata[ 'samples' ], metadata[ 'wavenumbers' ], path, key )
+
+# ----------------------------------------------------------------- #
+#                         INCOMING SPECTRA                          #
+# ----------------------------------------------------------------- #
+
+# Read the complete rows of an FTIR CSV file from byte 'offset' on (0
+# reads the header first). A row still being written (no end of line yet)
+# is left for the next read. Returns the sample ids, the ( rows x
+# wavenumbers ) float32 values, the wavenumbers and the offset after the
+# last complete row.
+def read_spectra_rows( path, offset = 0 ):
+    with open( path, 'rb' ) as file:
+        header = file.readline()
+        file.seek( max( offset, len( header ) ) )
+        text = file.read()
+    if not header.endswith( b'\n' ): return np.zeros( 0, dtype = object ), np.zeros( ( 0, 0 ), dtype = np.float32 ), np.zeros( 0 ), 0
+
+    columns = header.decode( 'utf-8' ).strip().split( ',' )
+    if columns[ 0 ].strip( '"' ) != SAMPLE_COLUMN:
+        raise ValueError( 'Invalid FTIR file: the first column must be ' + repr( SAMPLE_COLUMN ) + ' in ' + path )
+    wavenumbers = parse_wavenumbers( [ column.strip( '"' ) for column in columns[ 1 : ] ] )
+    end         = text.rfind( b'\n' ) + 1
+    if end == 0: return np.zeros( 0, dtype = object ), np.zeros( ( 0, len( wavenumbers ) ), dtype = np.float32 ), wavenumbers, max( offset, len( header ) )
+
+    rows = pd.read_csv( io.BytesIO( text[ : end ] ), header = None, names = [ SAMPLE_COLUMN ] + columns[ 1 : ], dtype = { SAMPLE_COLUMN : str } )
+    return rows[ SAMPLE_COLUMN ].to_numpy( dtype = object ), rows[ columns[ 1 : ] ].to_numpy( dtype = np.float32 ), wavenumbers, max( offset, len( header ) ) + end
+
+# Watch an FTIR CSV file to which new spectra are appended (e.g. by the
+# spectrometer): every poll returns the rows added since the previous one.
+# The file may not exist yet. Like LedgerTail, a truncated file is read
+# again from its start.
+class SpectraTail:
+    def __init__( self, path ):
+        self.path   = path
+        self.offset = 0
+        self.lock   = threading.Lock()
+
+    # New ( sample ids, values, wavenumbers ), or None if nothing changed
+    def poll( self ):
+        with self.lock:
+            if not os.path.exists( self.path ) or os.path.getsize( self.path ) == self.offset: return None
+            if os.path.getsize( self.path ) < self.offset: self.offset = 0
+            samples, values, wavenumbers, self.offset = read_spectra_rows( self.path, self.offset )
+        if len( samples ) == 0: return None
+        return samples, values, wavenumbers
+
+# ----------------------------------------------------------------- #
+#                           DOWNSAMPLING                            #
+# ----------------------------------------------------------------- #
+
+# Points sent per spectrum: about two per horizontal pixel of the chart
+SPECTRA_MAX_POINTS = 1600
+
+# Min/max decimation of spectra sharing the axis 'x' ('values' has one
+# spectrum per row). The axis is cut into max_points / 2 buckets, and each
+# bucket keeps the lowest and highest point of every spectrum, in axis
+# order, so peaks and valleys survive whatever the zoom level. All the
+# spectra are reduced at once. Returns the x and y of every spectrum, as
+# two ( spectra, points ) arrays.
+def downsample_minmax( x, values, max_points = SPECTRA_MAX_POINTS ):
+    values = np.atleast_2d( np.asarray( values ) )
+    n      = values.shape[ 1 ]
+    if n <= max_points: return np.broadcast_to( x, values.shape ), values
+
+    buckets = max( 1, max_points // 2 )
+    size    = -( -n // buckets )
+    # The last bucket is padded with its last value, which is never a new extreme
+    padded  = np.pad( values, ( ( 0, 0 ), ( 0, buckets * size - n ) ), mode = 'edge' ).reshape( len( values ), buckets, size )
+    low     = np.argmin( padded, axis = 2 )
+    high    = np.argmax( padded, axis = 2 )
+    first   = np.minimum( low, high )
+    second  = np.maximum( low, high )
+    start   = ( np.arange( buckets ) * size )[ None, : ]
+    columns = np.minimum( np.stack( [ start + first, start + second ], axis = 2 ).reshape( len( values ), -1 ), n - 1 )
+    return np.asarray( x )[ columns ], np.take_along_axis( values, columns, axis = 1 )
+
+# ----------------------------------------------------------------- #
+#                             BENCHMARK                             #
+# ----------------------------------------------------------------- #
+
+# Compare parsing the CSV file with loading its binary cache
+def benchmark_spectra_loading( path, cache_directory = SPECTRA_CACHE_DIRECTORY ):
+    start = time.perf_counter()
+    pd.read_csv( path )
+    print( 'CSV parsing:        ', round( time.perf_counter() - start, 4 ), 's' )
+
+    start = time.perf_counter()
+    build_spectra_cache( path, cache_directory )
+    print( 'binary cache build: ', round( time.perf_counter() - start, 4 ), 's' )
+
+    start   = time.perf_counter()
+    spectra = load_spectra( path, cache_directory )
+    print( 'memory-mapped load: ', round( time.perf_counter() - start, 4 ), 's',
+           '(' + str( len( spectra ) ) + ' spectra,', str( len( spectra.wavenumbers ) ) + ' wavenumbers)' )
+
+# Usage:
+#   python spectra_util.py testdata/FTIR_Air.csv
+if __name__ == '__main__':
+    benchmark_spectra_loading( sys.argv[ 1 ] if len( sys.argv ) > 1 else './testdata/FTIR_Air.csv' )
@@ -0,0 +1,7 @@
+
+# Import libraries
+import os                                                   # For the repository path
+import sys                                                  # For importing the dashboard modules
+
+# The modules live at the top of the repository, next to the dashboard
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
@@ -0,0 +1,89 @@
+# Import libraries
+import numpy as np                                          # For random events
+import pandas as pd                                         # For event data frames
+from   datetime import date                                 # For the current date
+from   alert_util import compute_product_alerts, merge_product_alerts, products_failing, expired_product_locations, all_products_in_date
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+CURRENT_DATE = date( 2024, 3, 6 )
+
+# Random 'txHistory' events of a few products, with repeated and missing
+# temperatures and weights
+def make_events( n, seed = 0 ):
+    random   = np.random.default_rng( seed )
+    products = random.integers( 0, 12, n )
+    return pd.DataFrame( {
+        'ProductID'   : [ 'P%d' % product for product in products ],
+        'UseByDate'   : [ '2024-03-%02d' % ( 1 + product ) for product in products ],
+        'Location'    : random.choice( [ 'Leeds', 'York', 'Cork' ], n ),
+        'Temperature' : np.where( random.random( n ) < 0.1, np.nan, np.where( random.random( n ) < 0.7, 4, random.integers( 2, 8, n ) ) ),
+        'Weight'      : np.where( random.random( n ) < 0.1, np.nan, np.where( products % 3 == 0, 10, random.integers( 9, 12, n ) ) )
+    } )
+
+# Alerts of one product at a time, as the dashboard first computed them
+def reference_alerts( events, current_date ):
+    rows = {}
+    for product in events[ 'ProductID' ].unique():
+        product_events = events[ events[ 'ProductID' ] == product ]
+        first          = product_events.iloc[ 0 ]
+        expiry         = pd.Timestamp( first[ 'UseByDate' ] ).normalize()
+        rows[ product ] = {
+            'ExpiryDate'          : expiry,
+            'ExpiryLocation'      : first[ 'Location' ],
+            'Expired'             : expiry <= pd.Timestamp( current_date ),
+            'TemperatureConstant' : product_events[ 'Temperature' ].dropna().nunique() <= 1,
+            'WeightConstant'      : product_events[ 'Weight' ].dropna().nunique() <= 1
+        }
+    return pd.DataFrame.from_dict( rows, orient = 'index' )
+
+# ----------------------------------------------------------------- #
+#                           PRODUCT ALERTS                          #
+# ----------------------------------------------------------------- #
+
+def test_alerts_match_product_by_product():
+    events   = make_events( 400 )
+    alerts   = compute_product_alerts( events, CURRENT_DATE )
+    expected = reference_alerts( events, CURRENT_DATE )
+    assert alerts.index.tolist() == expected.index.tolist()
+    for column in expected:
+        assert alerts[ column ].tolist() == expected[ column ].tolist(), column
+    assert not alerts[ 'TemperatureConstant' ].all() and alerts[ 'WeightConstant' ].any()
+
+def test_alert_queries():
+    events = pd.DataFrame( {
+        'ProductID'   : [ 'A', 'A', 'B', 'C' ],
+        'UseByDate'   : [ '2024-03-01', '2024-03-01', '2024-03-06', '2024-04-01' ],
+        'Location'    : [ 'Leeds', 'York', 'Cork', 'York' ],
+        'Temperature' : [ 4, 5, 4, 4 ],
+        'Weight'      : [ 10, 10, 12, 12 ]
+    } )
+    alerts = compute_product_alerts( events, CURRENT_DATE )
+    assert products_failing( alerts, 'TemperatureConstant' ) == [ 'A' ]
+    assert products_failing( alerts, 'WeightConstant' ) == []
+    assert expired_product_locations( alerts ) == [ ( 'A', 'Leeds' ), ( 'B', 'Cork' ) ]
+    assert not all_products_in_date( alerts, CURRENT_DATE )
+    assert all_products_in_date( alerts, date( 2024, 3, 1 ) )
+
+# ----------------------------------------------------------------- #
+#                         INCREMENTAL ALERTS                        #
+# ----------------------------------------------------------------- #
+
+# Merging the alerts of new events, a chunk at a time, gives the alerts
+# of all the events at once
+def test_merged_alerts_match_one_computation():
+    events = make_events( 600, seed = 1 )
+    alerts = compute_product_alerts( events[ : 100 ], CURRENT_DATE )
+    for start, end in [ ( 100, 101 ), ( 101, 350 ), ( 350, 600 ) ]:
+        alerts = merge_product_alerts( alerts, events[ start : end ], CURRENT_DATE )
+    pd.testing.assert_frame_equal( alerts, compute_product_alerts( events, CURRENT_DATE ), check_dtype = False )
+
+# A product whose first values were missing takes them from new events
+def test_merged_alerts_fill_missing_first_values():
+    old    = pd.DataFrame( { 'ProductID' : [ 'A' ], 'UseByDate' : [ '2024-04-01' ], 'Location' : [ 'Leeds' ], 'Temperature' : [ np.nan ], 'Weight' : [ 10.0 ] } )
+    new    = pd.DataFrame( { 'ProductID' : [ 'A', 'A' ], 'UseByDate' : [ '2024-04-01' ] * 2, 'Location' : [ 'York' ] * 2, 'Temperature' : [ 4.0, 4.0 ], 'Weight' : [ 10.0, 11.0 ] } )
+    alerts = merge_product_alerts( compute_product_alerts( old, CURRENT_DATE ), new, CURRENT_DATE )
+    assert alerts.loc[ 'A', 'FirstTemperature' ] == 4.0 and alerts.loc[ 'A', 'ExpiryLocation' ] == 'Leeds'
+    assert alerts.loc[ 'A', 'TemperatureConstant' ] and not alerts.loc[ 'A', 'WeightConstant' ]
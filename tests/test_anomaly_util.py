@@ -0,0 +1,79 @@
+# Import libraries
+import numpy as np                                          # For random spectra
+import pytest                                               # For checking errors
+from   anomaly_util import AnomalyMonitor, chi2_quantile, f_quantile
+from   pca_util import randomized_pca
+from   preprocess_util import PreprocessingPipeline
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Spectra made of three latent components plus noise
+def make_spectra( rows = 2000, columns = 60, seed = 0 ):
+    random = np.random.default_rng( seed )
+    return random.standard_normal( ( rows, 3 ) ) * [ 5, 3, 2 ] @ random.standard_normal( ( 3, columns ) ) + 0.1 * random.standard_normal( ( rows, columns ) )
+
+def make_monitor( spectra ):
+    return AnomalyMonitor( randomized_pca( spectra, 3 ), spectra )
+
+# ----------------------------------------------------------------- #
+#                          CONTROL LIMITS                           #
+# ----------------------------------------------------------------- #
+
+# Approximations against tabulated quantiles
+def test_quantile_approximations():
+    assert chi2_quantile( 0.99, 10 ) == pytest.approx( 23.209, rel = 0.01 )
+    assert chi2_quantile( 0.95, 2 )  == pytest.approx( 5.991,  rel = 0.02 )
+    assert f_quantile( 0.99, 5, 100 ) == pytest.approx( 3.206, rel = 0.02 )
+    assert f_quantile( 0.95, 3, 30 )  == pytest.approx( 2.922, rel = 0.02 )
+
+def test_own_spectra_are_rarely_flagged():
+    spectra = make_spectra()
+    flagged = make_monitor( spectra ).score( spectra )[ 2 ]
+    assert flagged.mean() < 0.05
+
+def test_too_few_spectra():
+    spectra = make_spectra( 5 )
+    with pytest.raises( ValueError ): AnomalyMonitor( randomized_pca( spectra, 3 ), spectra )
+
+# ----------------------------------------------------------------- #
+#                              SCORING                              #
+# ----------------------------------------------------------------- #
+
+# T2 and Q of every spectrum against their definitions
+def test_statistics_match_definitions():
+    spectra  = make_spectra()
+    monitor  = make_monitor( spectra )
+    model    = monitor.model
+    t2, q, _ = monitor.score( spectra[ : 50 ] )
+    centred  = spectra[ : 50 ] - model.mean
+    scores   = centred @ model.loadings.T
+    np.testing.assert_allclose( t2, ( scores ** 2 / model.explained_variance ).sum( axis = 1 ) )
+    np.testing.assert_allclose( q, ( ( centred - scores @ model.loadings ) ** 2 ).sum( axis = 1 ), rtol = 1e-6, atol = 1e-9 )
+
+# A spectrum off the model plane is flagged by Q only; one far along a
+# component is flagged by T2 only
+def test_injected_outliers_are_flagged():
+    spectra = make_spectra( 2010 )
+    monitor = make_monitor( spectra[ : 2000 ] )
+    normal  = spectra[ 2000 : ]
+    spike   = normal[ 0 ].copy()
+    spike[ 20 ] += 3
+    far     = monitor.model.mean + 10 * np.sqrt( monitor.model.explained_variance[ 0 ] ) * monitor.model.loadings[ 0 ]
+    t2, q, flagged = monitor.score( np.vstack( [ normal[ 1 : ], spike, far ] ) )
+    assert flagged.tolist() == [ False ] * 9 + [ True, True ]
+    assert q[ 9 ] > monitor.q_limit and t2[ 9 ] < monitor.t2_limit
+    assert t2[ 10 ] > monitor.t2_limit and q[ 10 ] < monitor.q_limit
+
+# Raw spectra scored through the pipeline, in small batches, score as the
+# preprocessed spectra do
+def test_scoring_raw_spectra_through_pipeline():
+    spectra     = make_spectra() + 50
+    wavenumbers = np.linspace( 4000, 400, spectra.shape[ 1 ] )
+    pipeline    = PreprocessingPipeline( [ 'snv' ] ).fit( spectra, wavenumbers )
+    processed   = pipeline.transform( spectra, wavenumbers )[ 0 ]
+    monitor     = AnomalyMonitor( randomized_pca( processed, 3 ), processed, pipeline, wavenumbers, batch_rows = 7 )
+    expected    = AnomalyMonitor( randomized_pca( processed, 3 ), processed )
+    for result, reference in zip( monitor.score( spectra[ : 30 ] ), expected.score( processed[ : 30 ] ) ):
+        np.testing.assert_allclose( result, reference )
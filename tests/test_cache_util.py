@@ -0,0 +1,31 @@
+# Import libraries
+import pandas as pd                                         # For the cached data frames
+from   cache_util import DatasetCache, LRUCache
+
+# ----------------------------------------------------------------- #
+#                              CACHES                               #
+# ----------------------------------------------------------------- #
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache( max_entries = 2 )
+    cache.put( 'a', 1 )
+    cache.put( 'b', 2 )
+    assert cache.get( 'a' ) == 1
+    cache.put( 'c', 3 )
+    assert 'b' not in cache and cache.get( 'a' ) == 1 and cache.get( 'c' ) == 3
+
+def test_pinned_dataset_survives_eviction():
+    cache = DatasetCache( max_entries = 2 )
+    full  = cache.put( pd.DataFrame( { 'x' : range( 10 ) } ), pinned = True )
+    keys  = [ cache.put( pd.DataFrame( { 'x' : [ i ] } ) ) for i in range( 10 ) ]
+    assert cache.get( full ) is not None and len( cache.get( full ) ) == 10
+    assert cache.get( keys[ 0 ] ) is None and cache.get( keys[ -1 ] ) is not None
+
+def test_unpinned_dataset_goes_to_lru():
+    cache = DatasetCache( max_entries = 1 )
+    old   = cache.put( pd.DataFrame( { 'x' : [ 1 ] } ), pinned = True )
+    new   = cache.put( pd.DataFrame( { 'x' : [ 1, 2 ] } ), pinned = True )
+    cache.unpin( old )
+    assert cache.get( old ) is not None
+    cache.put( pd.DataFrame( { 'x' : [ 3 ] } ) )
+    assert cache.get( old ) is None and cache.get( new ) is not None
@@ -0,0 +1,68 @@
+# Import libraries
+import os                                                   # For the repository path
+import sys                                                  # For the dashboard's command line
+import runpy                                                # For loading the dashboard script
+import shutil                                               # For copying the test data
+import itertools                                            # For the ledger combinations
+import pytest                                               # For the dashboard fixture
+import geopy.geocoders                                      # For replacing the online geocoder
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+REPO_PATH = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+# Online geocoder replaced by a fixed answer
+class OfflineGeocoder:
+    def __init__( self, **options ):
+        pass
+
+    def geocode( self, query, **options ):
+        return None
+
+# The dashboard over four ledgers (copies of the test ledgers), run in a
+# copy of its data directory so its caches are written there
+@pytest.fixture( scope = 'module' )
+def dashboard( tmp_path_factory ):
+    directory = tmp_path_factory.mktemp( 'dashboard' )
+    shutil.copytree( os.path.join( REPO_PATH, 'testdata' ), directory / 'testdata' )
+    for name in [ 'token.txt', 'gazetteer.csv' ]: shutil.copy( os.path.join( REPO_PATH, name ), directory )
+    ledgers = directory / 'ledgers'
+    ledgers.mkdir()
+    for name, source in [ ( 'a', 'beef' ), ( 'b', 'milk_V2' ), ( 'c', 'beef' ), ( 'd', 'milk_V2' ) ]:
+        shutil.copy( directory / 'testdata' / ( 'tx_monitor_' + source + '.json.txt' ), ledgers / ( 'tx_monitor_' + name + '.json.txt' ) )
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir( directory )
+        patch.setattr( sys, 'argv', [ 'dashboard_v3.1.py', str( ledgers ) ] )
+        patch.setattr( geopy.geocoders, 'Nominatim', OfflineGeocoder )
+        yield runpy.run_path( os.path.join( REPO_PATH, 'dashboard_v3.1.py' ), run_name = 'dashboard' )
+
+# ----------------------------------------------------------------- #
+#                          LEDGER SELECTION                         #
+# ----------------------------------------------------------------- #
+
+# Selecting every combination of ledgers evicts slices from the dataset
+# cache; the full dataset and the evicted slices must still be served
+def test_every_ledger_combination_then_layout( dashboard ):
+    sources      = dashboard[ 'ledger_sources' ]
+    combinations = [ None, [] ] + [ list( chosen ) for size in range( 1, len( sources ) + 1 ) for chosen in itertools.combinations( sources, size ) ]
+    assert sources == [ 'a', 'b', 'c', 'd' ]
+    keys = [ dashboard[ 'select_sources' ]( chosen ) for chosen in combinations ]
+    for chosen, key in zip( combinations, keys ):
+        df = dashboard[ 'get_dataset' ]( key )
+        assert df is not None
+        assert set( df[ 'source' ].unique() ) == set( chosen or sources )
+        assert dashboard[ 'get_dataset_alerts' ]( key ) is not None
+
+    full_key = dashboard[ 'select_sources' ]( sources )
+    assert full_key == dashboard[ 'dataset_key' ]
+    assert getattr( dashboard[ 'render_main_content' ]( full_key, 'tab1', None ), 'children', None ) != 'No data available.'
+    client = dashboard[ 'app' ].server.test_client()
+    assert client.get( '/' ).status_code == 200
+    assert client.get( '/_dash-layout' ).status_code == 200
+
+def test_unknown_dataset_key( dashboard ):
+    assert dashboard[ 'get_dataset' ]( 'unknown-0' ) is None
+    assert dashboard[ 'get_dataset_alerts' ]( 'unknown-0' ) is None
+    assert dashboard[ 'get_alert_messages' ]( None ) == ( '', '', '' )
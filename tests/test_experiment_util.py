@@ -0,0 +1,83 @@
+# Import libraries
+import os                                                   # For the test data path
+import numpy as np                                          # For spectra arrays
+from   experiment_util import experiment_sample_ids, ExperimentLinkIndex, ExperimentLoader
+from   spectra_util import load_spectra
+from   model_util import read_sample_table
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+TESTDATA_PATH = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), 'testdata' )
+
+# 'LinkedExperiments' values of a few blocks, in every accepted form
+LINKS = [
+    [ '1A1' ],
+    None,
+    [ { 'Sample' : '1A2' }, { 'ExperimentID' : '2A1' }, '' ],
+    'not a list',
+    [],
+    [ { 'Other' : 'x' }, 3 ],
+    [ '2A2', { 'SampleID' : '0Z1', 'Sample' : None } ]
+]
+
+def make_loader( tmp_path, max_entries = 3 ):
+    spectra = load_spectra( os.path.join( TESTDATA_PATH, 'FTIR_Air.csv' ), str( tmp_path / 'spectra_cache' ) )
+    table   = read_sample_table( os.path.join( TESTDATA_PATH, 'micro_Air.csv' ) )
+    return ExperimentLoader( spectra, table, max_entries ), spectra
+
+# ----------------------------------------------------------------- #
+#                       LINKED EXPERIMENT INDEX                     #
+# ----------------------------------------------------------------- #
+
+def test_sample_ids_of_links():
+    assert [ experiment_sample_ids( links ) for links in LINKS ] == [ [ '1A1' ], [], [ '1A2', '2A1' ], [], [], [ '3' ], [ '2A2', '0Z1' ] ]
+
+def test_link_index_resolves_blocks():
+    index = ExperimentLinkIndex( LINKS )
+    assert len( index ) == len( LINKS )
+    assert [ index.links( block ) for block in range( len( LINKS ) ) ] == [ experiment_sample_ids( links ) for links in LINKS ]
+    assert index.links( -1 ) == [] and index.links( len( LINKS ) ) == []
+    assert index.linked_blocks() == 4
+
+# Links of new blocks appended in pieces (as in live mode) resolve as
+# those of an index built at once
+def test_extended_link_index_matches_one_build():
+    index = ExperimentLinkIndex( LINKS[ : 2 ] )
+    index.extend( [] )
+    for start, end in [ ( 2, 3 ), ( 3, 7 ) ]: index.extend( LINKS[ start : end ] )
+    whole = ExperimentLinkIndex( LINKS )
+    assert len( index ) == len( whole )
+    assert [ index.links( block ) for block in range( len( index ) ) ] == [ whole.links( block ) for block in range( len( whole ) ) ]
+    assert index.linked_blocks() == whole.linked_blocks()
+
+# ----------------------------------------------------------------- #
+#                       LAZY EXPERIMENT LOADING                     #
+# ----------------------------------------------------------------- #
+
+def test_loader_reads_spectra_and_counts( tmp_path ):
+    loader, spectra = make_loader( tmp_path )
+    data = loader.load( '1A1' )
+    np.testing.assert_array_equal( data[ 'spectra' ], spectra.matrix[ spectra.rows( '1A1' ) ] )
+    assert data[ 'spectra' ].shape[ 0 ] == 2 and not isinstance( data[ 'spectra' ], np.memmap )
+    np.testing.assert_array_equal( data[ 'wavenumbers' ], spectra.wavenumbers )
+    assert data[ 'counts' ][ 'PCA' ] == 850000 and set( data[ 'counts' ] ) == { 'PCA', 'CFC', 'MRS', 'STAA', 'VRBG' }
+
+    unknown = loader.load( 'missing' )
+    assert len( unknown[ 'spectra' ] ) == 0 and unknown[ 'counts' ] is None
+    assert ExperimentLoader().load( '1A1' )[ 'counts' ] is None
+
+# The cache holds at most 'max_entries' samples, dropping the least
+# recently used, and repeated lookups do not read again
+def test_loader_cache_is_bounded( tmp_path ):
+    loader, _ = make_loader( tmp_path, max_entries = 3 )
+    first     = loader.load( '1A1' )
+    assert loader.load( '1A1' ) is first
+    for sample_id in [ '1A2', '2A1', '2A2' ]: loader.load( sample_id )
+    assert len( loader.cache ) == 3 and '1A1' not in loader.cache
+    assert loader.cache.stats()[ 'hits' ] == 1 and loader.cache.stats()[ 'misses' ] == 4
+    loader.load( '1A2' )
+    loader.load( '0Z1' )
+    assert '1A2' in loader.cache and '2A1' not in loader.cache
+    assert loader.load( '1A1' ) is not first
@@ -0,0 +1,80 @@
+# Import libraries
+import numpy as np                                          # For boolean masks
+import pytest                                               # For checking errors
+from   filter_util import build_node_table, FilterCondition, FilterExpression, highlighted_node_ids, node_ids_to_selector, edge_pairs_to_selector, NO_MATCH_SELECTOR
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Cytoscape node elements, with a missing temperature and a bad date
+def make_nodes():
+    rows = [
+        ( 'a', 4,    10, 'Farm A', 'milk', 'Leeds', '2024-01-01T08:00:00Z' ),
+        ( 'b', 7,    12, 'Farm B', 'milk', 'York',  '2024-01-02T08:00:00Z' ),
+        ( 'c', None, 15, 'Farm A', 'beef', 'Cork',  '2024-01-03T08:00:00Z' ),
+        ( 'd', 2,    20, 'Farm C', 'beef', 'Leeds', 'not a date'           ),
+        ( 'e', 9,    25, 'Farm B', 'milk', None,    '2024-01-05T08:00:00Z' )
+    ]
+    return [ { 'data' : { 'id' : node_id, 'temperature_integer' : temperature, 'weight_integer' : weight, 'owner' : owner,
+                          'product_name' : product, 'product_id' : product + node_id, 'location' : location, 'timestamp' : timestamp } }
+             for node_id, temperature, weight, owner, product, location, timestamp in rows ]
+
+def matching( expression ):
+    return highlighted_node_ids( expression, build_node_table( make_nodes() ) )
+
+# ----------------------------------------------------------------- #
+#                             CONDITIONS                            #
+# ----------------------------------------------------------------- #
+
+def test_node_table_types():
+    table = build_node_table( make_nodes() )
+    assert table[ 'temperature_integer' ].dtype.kind == 'f' and np.isnan( table[ 'temperature_integer' ][ 2 ] )
+    assert table[ 'timestamp' ].dtype.kind == 'M' and table[ 'timestamp' ].isna().tolist() == [ False, False, False, True, False ]
+
+def test_numeric_conditions():
+    assert matching( FilterExpression( [ FilterCondition( 'temperature_integer', '>', 4 ) ] ) ) == [ 'b', 'e' ]
+    assert matching( FilterExpression( [ FilterCondition( 'weight_integer', '<=', '15' ) ] ) ) == [ 'a', 'b', 'c' ]
+    assert matching( FilterExpression( [ FilterCondition( 'weight_integer', 'between', ( 12, 20 ) ) ] ) ) == [ 'b', 'c', 'd' ]
+    assert matching( FilterExpression( [ FilterCondition( 'temperature_integer', 'in', [ '2', 9 ] ) ] ) ) == [ 'd', 'e' ]
+    # A missing value matches no ordering
+    assert 'c' not in matching( FilterExpression( [ FilterCondition( 'temperature_integer', '<', 100 ) ] ) )
+
+def test_date_conditions():
+    assert matching( FilterExpression( [ FilterCondition( 'timestamp', '>=', '2024-01-02' ) ] ) ) == [ 'b', 'c', 'e' ]
+    assert matching( FilterExpression( [ FilterCondition( 'timestamp', 'between', ( '2024-01-01', '2024-01-03T12:00' ) ) ] ) ) == [ 'a', 'b', 'c' ]
+    assert matching( FilterExpression( [ FilterCondition( 'timestamp', 'in', [ '2024-01-05T08:00:00' ] ) ] ) ) == [ 'e' ]
+
+def test_categorical_conditions():
+    assert matching( FilterExpression( [ FilterCondition( 'owner', '=', 'Farm A' ) ] ) ) == [ 'a', 'c' ]
+    assert matching( FilterExpression( [ FilterCondition( 'location', 'in', [ 'Leeds', 'Cork' ] ) ] ) ) == [ 'a', 'c', 'd' ]
+    assert matching( FilterExpression( [ FilterCondition( 'product_name', '!=', 'milk' ) ] ) ) == [ 'c', 'd' ]
+
+def test_unknown_operator_and_combination():
+    with pytest.raises( ValueError ): FilterCondition( 'owner', '~', 'Farm A' )
+    with pytest.raises( ValueError ): FilterExpression( [], 'xor' )
+
+# ----------------------------------------------------------------- #
+#                            EXPRESSIONS                            #
+# ----------------------------------------------------------------- #
+
+def test_and_or_across_column_types():
+    milk    = FilterCondition( 'product_name', '=', 'milk' )
+    warm    = FilterCondition( 'temperature_integer', '>=', 7 )
+    january = FilterCondition( 'timestamp', 'between', ( '2024-01-01', '2024-01-02T23:59' ) )
+    assert matching( FilterExpression( [ milk, warm ] ) ) == [ 'b', 'e' ]
+    assert matching( FilterExpression( [ milk, warm, january ] ) ) == [ 'b' ]
+    assert matching( FilterExpression( [ warm, FilterCondition( 'owner', '=', 'Farm C' ) ], 'or' ) ) == [ 'b', 'd', 'e' ]
+    # Nested expressions: beef, or milk in Leeds
+    leeds_milk = FilterExpression( [ milk, FilterCondition( 'location', '=', 'Leeds' ) ] )
+    assert matching( FilterExpression( [ FilterCondition( 'product_name', '=', 'beef' ), leeds_milk ], 'or' ) ) == [ 'a', 'c', 'd' ]
+
+def test_empty_expression_matches_nothing():
+    expression = FilterExpression( [] )
+    assert expression.is_empty() and matching( expression ) == []
+    assert node_ids_to_selector( matching( expression ) ) == NO_MATCH_SELECTOR
+
+def test_selectors():
+    assert node_ids_to_selector( [ 'a', 'b' ] ) == '[id = "a"], [id = "b"]'
+    assert edge_pairs_to_selector( [ ( 'a', 'b' ) ] ) == 'edge[source = "a"][target = "b"]'
+    assert edge_pairs_to_selector( [] ) == NO_MATCH_SELECTOR
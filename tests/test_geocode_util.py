@@ -0,0 +1,111 @@
+
+# Import libraries
+import numpy as np                                          # For NaN checks
+import pandas as pd                                         # For location columns
+from   geocode_util import GeocodeCache, Gazetteer, StaticGeocoder, geocode_locations, resolve_locations
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Geocoder which fails like Nominatim without network
+class FailingGeocoder:
+    def __init__( self ):
+        self.calls = 0
+
+    def geocode( self, name ):
+        self.calls += 1
+        raise OSError( 'no network' )
+
+def make_gazetteer():
+    return Gazetteer( [ 'Bristol, UK', 'Cardiff, UK' ], [ 51.45, 51.48 ], [ -2.59, -3.18 ] )
+
+# ----------------------------------------------------------------- #
+#                             GAZETTEER                             #
+# ----------------------------------------------------------------- #
+
+def test_gazetteer_lookup_normalises_names():
+    latitudes, longitudes = make_gazetteer().lookup( [ 'bristol uk', ' CARDIFF,  UK ', 'Nowhere' ] )
+    assert latitudes[ : 2 ].tolist() == [ 51.45, 51.48 ]
+    assert longitudes[ : 2 ].tolist() == [ -2.59, -3.18 ]
+    assert np.isnan( latitudes[ 2 ] ) and np.isnan( longitudes[ 2 ] )
+
+def test_gazetteer_keeps_first_duplicate():
+    gazetteer = Gazetteer( [ 'Bristol, UK', 'bristol uk' ], [ 1.0, 2.0 ], [ 3.0, 4.0 ] )
+    assert len( gazetteer ) == 1
+    assert gazetteer.lookup( [ 'Bristol, UK' ] )[ 0 ].tolist() == [ 1.0 ]
+
+def test_gazetteer_resolves_without_geocoder():
+    geocoder = StaticGeocoder( {} )
+    result   = geocode_locations( pd.Series( [ 'Bristol, UK', 'Cardiff, UK', 'Bristol, UK' ] ), geocoder, gazetteer = make_gazetteer() )
+    assert result[ 'Latitude' ].tolist() == [ 51.45, 51.48, 51.45 ]
+    assert geocoder.calls == 0
+
+# ----------------------------------------------------------------- #
+#                              CACHE                                #
+# ----------------------------------------------------------------- #
+
+def test_cache_hit_skips_geocoder( tmp_path ):
+    cache = GeocodeCache( str( tmp_path / 'cache.json' ) )
+    cache.update( { 'Cork, Ireland' : ( 51.9, -8.47 ) } )
+    geocoder = StaticGeocoder( { 'Cork, Ireland' : ( 0.0, 0.0 ) } )
+    result   = geocode_locations( pd.Series( [ 'Cork, Ireland' ] ), geocoder, cache )
+    assert result.iloc[ 0 ].tolist() == [ 51.9, -8.47 ]
+    assert geocoder.calls == 0
+
+def test_cache_entries_expire():
+    cache = GeocodeCache( None, ttl = 10 )
+    cache.update( { 'Cork, Ireland' : ( 51.9, -8.47 ) }, now = 100 )
+    assert cache.get( 'Cork, Ireland', now = 105 ) == ( 51.9, -8.47 )
+    assert cache.get( 'Cork, Ireland', now = 111 ) is None
+    assert 'Cork, Ireland' not in cache.entries
+
+def test_cache_evicts_oldest_entries():
+    cache = GeocodeCache( None, max_entries = 2 )
+    for now, name in enumerate( [ 'a', 'b', 'c' ] ): cache.update( { name : ( 1.0, 2.0 ) }, now = now )
+    assert sorted( cache.entries ) == [ 'b', 'c' ]
+
+def test_cache_round_trip_and_broken_file( tmp_path ):
+    path  = str( tmp_path / 'cache.json' )
+    cache = GeocodeCache( path )
+    cache.update( { 'Cork, Ireland' : ( 51.9, -8.47 ) } )
+    cache.save()
+    assert GeocodeCache( path ).get( 'Cork, Ireland' ) == ( 51.9, -8.47 )
+
+    with open( path, 'w' ) as file: file.write( '{ broken' )
+    assert GeocodeCache( path ).entries == {}
+
+def test_misses_are_geocoded_once_and_cached( tmp_path ):
+    cache    = GeocodeCache( str( tmp_path / 'cache.json' ) )
+    geocoder = StaticGeocoder( { 'Cork, Ireland' : ( 51.9, -8.47 ) } )
+    locations = pd.Series( [ 'Cork, Ireland', 'Atlantis', 'Cork, Ireland', 'Atlantis' ] )
+    result   = geocode_locations( locations, geocoder, cache )
+    assert geocoder.calls == 2
+    assert result[ 'Latitude' ].tolist()[ : 1 ] == [ 51.9 ] and result[ 'Latitude' ].isna().tolist() == [ False, True, False, True ]
+    # Names which could not be found are cached too, so they are not asked again
+    assert GeocodeCache( cache.path ).get( 'Atlantis' ) == ( None, None )
+    geocode_locations( locations, geocoder, GeocodeCache( cache.path ) )
+    assert geocoder.calls == 2
+
+# ----------------------------------------------------------------- #
+#                         FAILURE FALLBACK                          #
+# ----------------------------------------------------------------- #
+
+def test_geocoder_errors_leave_names_unresolved_and_uncached( tmp_path ):
+    cache    = GeocodeCache( str( tmp_path / 'cache.json' ) )
+    geocoder = FailingGeocoder()
+    result   = geocode_locations( pd.Series( [ 'Bristol, UK', 'Cork, Ireland' ] ), geocoder, cache, make_gazetteer() )
+    assert result[ 'Latitude' ].tolist()[ 0 ] == 51.45
+    assert np.isnan( result[ 'Latitude' ].iloc[ 1 ] )
+    assert geocoder.calls == 1
+    # A failed lookup is retried next time rather than cached as unknown
+    assert cache.get( 'Cork, Ireland' ) is None
+
+def test_resolve_locations_reports_failures():
+    assert resolve_locations( [ 'Cork, Ireland' ], FailingGeocoder() ) == {}
+
+def test_missing_locations_and_no_geocoder():
+    locations = pd.Series( [ None, 'Cork, Ireland' ], index = [ 10, 11 ] )
+    result    = geocode_locations( locations, None )
+    assert result.index.tolist() == [ 10, 11 ]
+    assert result[ 'Latitude' ].isna().all()
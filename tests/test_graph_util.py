@@ -0,0 +1,148 @@
+
+# Import libraries
+import numpy as np                                          # For layout and trace arrays
+from   graph_util import GraphIndex, GrowingArray, compute_layered_layout, layout_layer_ends, extend_layered_layout, gather_children, generate_random_chain, generate_linear_chains, LAYOUT_X_SPACING, LAYOUT_Y_SPACING
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Layer-by-layer breadth-first layout, as the layout was first written
+def reference_layout( graph_index ):
+    parents = graph_index.parents
+    n       = len( parents )
+    x, y    = np.zeros( n ), np.zeros( n )
+    done    = np.zeros( n, dtype = bool )
+    depth   = 0
+    frontier = np.flatnonzero( parents < 0 )
+    while len( frontier ) > 0:
+        done[ frontier ] = True
+        x[ frontier ]    = ( np.arange( len( frontier ) ) - ( len( frontier ) - 1 ) / 2 ) * LAYOUT_X_SPACING
+        y[ frontier ]    = depth * LAYOUT_Y_SPACING
+        depth           += 1
+        frontier         = gather_children( frontier, graph_index.child_offsets, graph_index.child_ids )
+        frontier         = frontier[ ~done[ frontier ] ]
+    rest = np.flatnonzero( ~done )
+    x[ rest ] = ( np.arange( len( rest ) ) - ( len( rest ) - 1 ) / 2 ) * LAYOUT_X_SPACING
+    y[ rest ] = depth * LAYOUT_Y_SPACING
+    return x, y
+
+def assert_same_layout( graph_index ):
+    x, y = compute_layered_layout( graph_index )
+    expected_x, expected_y = reference_layout( graph_index )
+    np.testing.assert_array_equal( y, expected_y )
+    np.testing.assert_array_equal( x, expected_x )
+
+# ----------------------------------------------------------------- #
+#                          LAYERED LAYOUT                           #
+# ----------------------------------------------------------------- #
+
+def test_layout_of_random_chain_matches_breadth_first_order():
+    assert_same_layout( GraphIndex( *generate_random_chain( 5000 ) ) )
+
+def test_layout_of_deep_linear_chains():
+    graph_index = GraphIndex( *generate_linear_chains( 3000, chains = 3 ) )
+    x, y = compute_layered_layout( graph_index )
+    assert y.max() == 999 * LAYOUT_Y_SPACING
+    assert_same_layout( graph_index )
+
+def test_layout_of_branches_and_unknown_parents():
+    hashes          = [ 'a', 'b', 'c', 'd', 'e', 'f', 'g' ]
+    previous_hashes = [ 'GenesisBlock', 'a', 'a', 'c', 'b', 'missing', 'f' ]
+    assert_same_layout( GraphIndex( hashes, previous_hashes ) )
+
+def test_layout_puts_cycles_on_a_bottom_layer():
+    hashes          = [ 'a', 'b', 'c', 'd', 'e' ]
+    previous_hashes = [ 'GenesisBlock', 'a', 'd', 'c', 'c' ]
+    x, y = compute_layered_layout( GraphIndex( hashes, previous_hashes ) )
+    assert y.tolist() == [ 0, LAYOUT_Y_SPACING, 2 * LAYOUT_Y_SPACING, 2 * LAYOUT_Y_SPACING, 2 * LAYOUT_Y_SPACING ]
+    assert_same_layout( GraphIndex( hashes, previous_hashes ) )
+
+def test_layout_of_empty_chain():
+    x, y = compute_layered_layout( GraphIndex( [], [] ) )
+    assert len( x ) == 0 and len( y ) == 0
+
+# ----------------------------------------------------------------- #
+#                          LINEAGE QUERIES                          #
+# ----------------------------------------------------------------- #
+
+# Descendants by a plain breadth-first search over the parent array
+def reference_descendants( parents, block_ids ):
+    children = {}
+    for block, parent in enumerate( parents.tolist() ): children.setdefault( parent, [] ).append( block )
+    found, frontier = set( block_ids ), list( block_ids )
+    while frontier:
+        frontier = [ child for block in frontier for child in children.get( block, [] ) if child not in found ]
+        found.update( frontier )
+    return sorted( found - set( block_ids ) )
+
+def test_descendants_of_deep_linear_chain():
+    graph_index = GraphIndex( *generate_linear_chains( 20000, chains = 2 ) )
+    assert graph_index.descendants( [ 0 ] ).tolist() == list( range( 1, 10000 ) )
+    assert graph_index.descendants( [ 9990, 19990 ] ).tolist() == list( range( 9991, 10000 ) ) + list( range( 19991, 20000 ) )
+    assert graph_index.ancestors( [ 19999 ] ).tolist() == list( range( 19998, 9999, -1 ) )
+    assert graph_index.trace( [ 15000 ] ).tolist() == list( range( 10000, 20000 ) )
+
+def test_descendants_of_random_chain():
+    graph_index = GraphIndex( *generate_random_chain( 3000 ) )
+    for seeds in [ [ 0 ], [ 5, 17, 400 ], list( range( 100, 200 ) ) ]:
+        assert graph_index.descendants( seeds ).tolist() == reference_descendants( graph_index.parents, seeds )
+
+def test_descendants_stop_at_cycles():
+    graph_index = GraphIndex( [ 'a', 'b', 'c', 'd' ], [ 'GenesisBlock', 'c', 'b', 'b' ] )
+    assert graph_index.descendants( [ 1 ] ).tolist() == [ 2, 3 ]
+    assert graph_index.descendants( [ 0 ] ).tolist() == []
+
+# ----------------------------------------------------------------- #
+#                          LIVE EXTENSION                           #
+# ----------------------------------------------------------------- #
+
+# Index of a random chain, built at once or from a prefix extended in parts
+def build_index( hashes, previous_hashes, products, parts ):
+    graph_index = GraphIndex( hashes[ : parts[ 0 ] ], previous_hashes[ : parts[ 0 ] ], product_ids = products[ : parts[ 0 ] ] )
+    for start, end in zip( parts[ : -1 ], parts[ 1 : ] ):
+        new_ids = graph_index.extend( hashes[ start:end ], previous_hashes[ start:end ], product_ids = products[ start:end ] )
+        assert new_ids.tolist() == list( range( start, end ) )
+    return graph_index
+
+def test_extended_index_matches_index_built_at_once():
+    hashes, previous_hashes = generate_random_chain( 2000, seed = 3 )
+    products = np.array( [ 'P%d' % ( i % 37 ) if i % 11 else None for i in range( 2000 ) ], dtype = object )
+    whole    = GraphIndex( hashes, previous_hashes, product_ids = products )
+    extended = build_index( hashes, previous_hashes, products, [ 500, 501, 900, 1500, 2000 ] )
+    assert len( extended ) == 2000
+    np.testing.assert_array_equal( extended.parents, whole.parents )
+    np.testing.assert_array_equal( extended.hashes, whole.hashes )
+    np.testing.assert_array_equal( extended.child_offsets, whole.child_offsets )
+    np.testing.assert_array_equal( extended.child_ids, whole.child_ids )
+    assert extended.block_ids( hashes[ ::97 ] ).tolist() == whole.block_ids( hashes[ ::97 ] ).tolist()
+    for product in [ 'P0', 'P5', 'P36', 'unknown' ]:
+        assert extended.product_blocks( product ).tolist() == whole.product_blocks( product ).tolist()
+    assert extended.descendants( [ 0 ] ).tolist() == whole.descendants( [ 0 ] ).tolist()
+
+def test_extend_links_new_blocks_to_each_other():
+    graph_index = GraphIndex( [ 'a', 'b' ], [ 'GenesisBlock', 'a' ], product_ids = [ 'P1', 'P1' ] )
+    graph_index.descendants( [ 0 ] )   # The child lists are read before the extension
+    new_ids = graph_index.extend( [ 'd', 'c', 'e' ], [ 'c', 'b', 'unknown' ], product_ids = [ 'P2', 'P1', 'P2' ] )
+    assert new_ids.tolist() == [ 2, 3, 4 ]
+    # 'd' comes before its parent 'c' in the new blocks
+    assert graph_index.parents.tolist() == [ -1, 0, 3, 1, -1 ]
+    assert graph_index.descendants( [ 0 ] ).tolist() == [ 1, 2, 3 ]
+    assert graph_index.product_blocks( 'P2' ).tolist() == [ 2, 4 ]
+    assert graph_index.group_keys( 'ProductID' ).tolist() == [ 'P1', 'P2' ]
+
+def test_extended_layout_places_new_blocks_below_their_parents():
+    graph_index = GraphIndex( [ 'a', 'b' ], [ 'GenesisBlock', 'a' ] )
+    x, y        = compute_layered_layout( graph_index )
+    layer_ends  = layout_layer_ends( x, y )
+    x, y        = GrowingArray( x, float ), GrowingArray( y, float )
+    new_ids     = graph_index.extend( [ 'c', 'd', 'e' ], [ 'b', 'b', 'GenesisBlock' ] )
+    new_x, new_y = extend_layered_layout( graph_index, x, y, new_ids, layer_ends )
+    assert new_y.tolist() == [ 2 * LAYOUT_Y_SPACING, 2 * LAYOUT_Y_SPACING, 0.0 ]
+    assert new_x.tolist() == [ 0.0, LAYOUT_X_SPACING, LAYOUT_X_SPACING ]
+    assert len( x ) == 5 and x.values()[ 2: ].tolist() == new_x.tolist()
+
+def test_growing_array_appends_in_place():
+    values = GrowingArray( [ 1, 2 ], np.int64 )
+    for start in range( 3, 100, 7 ): values.append( np.arange( start, start + 7 ) )
+    assert len( values ) == 100 and values.values().tolist() == [ 1, 2 ] + list( range( 3, 101 ) )
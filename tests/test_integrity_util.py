@@ -0,0 +1,48 @@
+# Import libraries
+import numpy as np                                          # For parent arrays
+from   integrity_util import find_cycle_blocks, check_ledger_integrity, generate_random_ledger, generate_linear_ledger
+
+# ----------------------------------------------------------------- #
+#                            CYCLE BLOCKS                           #
+# ----------------------------------------------------------------- #
+
+def test_no_cycle_in_chains():
+    parents = np.array( [ -1, 0, 1, 1, -1, 4, 5 ] )
+    assert find_cycle_blocks( parents ).tolist() == []
+
+def test_cycle_with_branching_tails():
+    # 0 -> 1 -> 2 -> 0 is a cycle; 3, 4 and 5 hang below it, 6 and 7 are a chain
+    parents = np.array( [ 2, 0, 1, 0, 3, 1, -1, 6 ] )
+    assert find_cycle_blocks( parents ).tolist() == [ 0, 1, 2 ]
+
+def test_self_loop():
+    parents = np.array( [ 0, 0, -1 ] )
+    assert find_cycle_blocks( parents ).tolist() == [ 0 ]
+
+def test_cycle_below_deep_tail():
+    n       = 100000
+    parents = np.arange( n ) - 1
+    parents[ 0 ] = 1
+    assert find_cycle_blocks( parents ).tolist() == [ 0, 1 ]
+
+def test_wide_tails_below_cycles():
+    # Many cycles of two, each with a wide fan of leaves and a deep tail
+    cycles  = 100
+    parents = np.array( [ block ^ 1 for block in range( 2 * cycles ) ] + [ 2 * ( i % cycles ) for i in range( 5000 ) ] )
+    tail    = np.arange( len( parents ), len( parents ) + 1000 ) - 1
+    parents = np.concatenate( [ parents, tail ] )
+    assert find_cycle_blocks( parents ).tolist() == list( range( 2 * cycles ) )
+
+# ----------------------------------------------------------------- #
+#                           LEDGER CHECKS                           #
+# ----------------------------------------------------------------- #
+
+def test_generated_ledgers_pass():
+    for branches in [ generate_random_ledger( 5000, roots = 50 ), generate_linear_ledger( 5000, roots = 50 ) ]:
+        report = check_ledger_integrity( branches, processes = 1 )
+        assert report[ 'ok' ] and report[ 'blocks' ] == 5000
+
+def test_cycle_below_deep_linear_chain():
+    report = check_ledger_integrity( generate_linear_ledger( 20000, roots = 1, cycle = True ), processes = 1 )
+    assert report[ 'counts' ][ 'cycle' ] == 2
+    assert sum( report[ 'counts' ].values() ) == 2
@@ -0,0 +1,37 @@
+# Import libraries
+import os                                                   # For the test data paths
+import sys                                                  # For running a script with this interpreter
+import subprocess                                           # For running a script in a fresh process
+from   ledger_util import read_ledgers, SOURCE_COLUMN
+
+# ----------------------------------------------------------------- #
+#                          READING LEDGERS                          #
+# ----------------------------------------------------------------- #
+
+REPO_PATH     = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+TESTDATA_PATH = os.path.join( REPO_PATH, 'testdata' )
+
+def test_parallel_read_matches_serial_read():
+    tx_serial,   branches_serial   = read_ledgers( [ TESTDATA_PATH ], processes = 1 )
+    tx_parallel, branches_parallel = read_ledgers( [ TESTDATA_PATH ], processes = 2 )
+    assert tx_serial[ SOURCE_COLUMN ].cat.categories.tolist() == [ 'beef', 'milk_V2' ]
+    assert tx_serial.equals( tx_parallel ) and branches_serial.equals( branches_parallel )
+
+# A script reading and checking ledgers at import time, like the
+# dashboard, is re-imported by every spawned worker; the workers must run
+# serially instead of starting a pool while bootstrapping
+def test_read_at_import_time_under_spawn( tmp_path ):
+    script = tmp_path / 'read_at_import.py'
+    script.write_text(
+        'import sys, multiprocessing\n'
+        'sys.path.insert( 0, ' + repr( REPO_PATH ) + ' )\n'
+        'multiprocessing.set_start_method( "spawn", force = True )\n'
+        'from ledger_util import read_ledgers\n'
+        'from integrity_util import check_ledger_integrity\n'
+        'txhistory, branches = read_ledgers( [ ' + repr( TESTDATA_PATH ) + ' ] )\n'
+        'report = check_ledger_integrity( branches, parallel_min_blocks = 0 )\n'
+        'if __name__ == "__main__": print( report[ "blocks" ] )\n'
+    )
+    result = subprocess.run( [ sys.executable, str( script ) ], capture_output = True, text = True, timeout = 120 )
+    assert result.returncode == 0, result.stderr
+    assert int( result.stdout ) > 0
@@ -0,0 +1,141 @@
+# Import libraries
+import os                                                   # For truncating event logs
+import json                                                 # For writing event logs
+import shutil                                               # For copying ledger documents
+import numpy as np                                          # For row numbers
+import pandas as pd                                         # For data frames of new rows
+from   ledger_util import read_event_log, read_ledgers, SOURCE_COLUMN
+from   live_util import LedgerTail, ChunkedFrame
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+TESTDATA_PATH = os.path.join( os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ), 'testdata' )
+
+# Ledger event (a block of 'branches') number i, extending block i - 1
+def make_event( i, status = 'Transferred' ):
+    return {
+        'ProductID'         : 'P%d' % i,
+        'PreviousProductID' : 'P%d' % ( i - 1 ),
+        'RootProductID'     : 'P0',
+        'Owner'             : 'Farm A',
+        'ProductName'       : 'milk',
+        'Location'          : 'Leeds',
+        'Weight'            : str( 10 + i ),
+        'Temperature'       : '4',
+        'EventTimestamp'    : '2024-03-06T10:00:%02dZ' % i,
+        'AssetStatus'       : status,
+        'Hash'              : 'h%d' % i,
+        'PreviousHash'      : 'h%d' % ( i - 1 ) if i else 'GenesisBlock'
+    }
+
+def write_events( path, events, mode = 'a' ):
+    with open( path, mode ) as file:
+        for event in events: file.write( json.dumps( event ) + '\n' )
+
+# ----------------------------------------------------------------- #
+#                          EVENT LOG READING                        #
+# ----------------------------------------------------------------- #
+
+def test_read_event_log_from_offsets( tmp_path ):
+    path = str( tmp_path / 'tx_monitor_milk.jsonl' )
+    write_events( path, [ make_event( 0 ), make_event( 1 ) ] )
+    txhistory, branches, offset = read_event_log( path )
+    assert branches[ 'Hash' ].tolist() == [ 'h0', 'h1' ] and offset == os.path.getsize( path )
+    assert txhistory[ 'Weight' ].tolist() == [ 10, 11 ]
+
+    # Only the new lines are read, and skipped events have no 'txHistory' row
+    write_events( path, [ make_event( 2, 'Edited' ), make_event( 3 ) ] )
+    txhistory, branches, offset = read_event_log( path, offset )
+    assert branches[ 'Hash' ].tolist() == [ 'h2', 'h3' ]
+    assert txhistory[ 'ProductID' ].tolist() == [ 'P3' ]
+
+    # Nothing new
+    txhistory, branches, same_offset = read_event_log( path, offset )
+    assert len( branches ) == 0 and same_offset == offset
+
+def test_read_event_log_leaves_partial_line( tmp_path ):
+    path = str( tmp_path / 'tx_monitor_milk.jsonl' )
+    line = json.dumps( make_event( 1 ) )
+    write_events( path, [ make_event( 0 ) ] )
+    with open( path, 'a' ) as file: file.write( line[ : 20 ] )
+    txhistory, branches, offset = read_event_log( path )
+    assert branches[ 'Hash' ].tolist() == [ 'h0' ]
+    with open( path, 'a' ) as file: file.write( line[ 20 : ] + '\n' )
+    txhistory, branches, offset = read_event_log( path, offset )
+    assert branches[ 'Hash' ].tolist() == [ 'h1' ] and offset == os.path.getsize( path )
+
+# ----------------------------------------------------------------- #
+#                             LEDGER TAIL                           #
+# ----------------------------------------------------------------- #
+
+def test_poll_reads_new_events_only( tmp_path ):
+    path = str( tmp_path / 'tx_monitor_milk.jsonl' )
+    write_events( path, [ make_event( 0 ), make_event( 1 ) ] )
+    tail = LedgerTail( [ str( tmp_path ) ] )
+    txhistory, branches = tail.poll()
+    assert branches[ 'Hash' ].tolist() == [ 'h0', 'h1' ]
+    assert branches[ SOURCE_COLUMN ].tolist() == [ 'milk', 'milk' ]
+    assert tail.poll() == ( None, None )
+
+    write_events( path, [ make_event( 2 ) ] )
+    txhistory, branches = tail.poll()
+    assert branches[ 'Hash' ].tolist() == [ 'h2' ] and txhistory[ 'ProductID' ].tolist() == [ 'P2' ]
+
+def test_poll_restarts_truncated_log( tmp_path ):
+    path = str( tmp_path / 'tx_monitor_milk.jsonl' )
+    write_events( path, [ make_event( 0 ), make_event( 1 ), make_event( 2 ) ] )
+    tail = LedgerTail( [ path ] )
+    tail.poll()
+    # The log is rotated: it starts again, shorter than what was read
+    write_events( path, [ make_event( 3 ) ], mode = 'w' )
+    txhistory, branches = tail.poll()
+    assert branches[ 'Hash' ].tolist() == [ 'h3' ]
+
+def test_poll_reads_new_ledger_documents_once( tmp_path ):
+    shutil.copy( os.path.join( TESTDATA_PATH, 'tx_monitor_beef.json.txt' ), tmp_path )
+    tail = LedgerTail( [ str( tmp_path ) ], loaded_files = [ str( tmp_path / 'tx_monitor_beef.json.txt' ) ] )
+    assert tail.poll() == ( None, None )
+
+    shutil.copy( os.path.join( TESTDATA_PATH, 'tx_monitor_milk_V2.json.txt' ), tmp_path )
+    txhistory, branches = tail.poll()
+    expected_branches   = read_ledgers( [ os.path.join( TESTDATA_PATH, 'tx_monitor_milk_V2.json.txt' ) ] )[ 1 ]
+    assert branches[ 'Hash' ].tolist() == expected_branches[ 'Hash' ].tolist()
+    assert set( branches[ SOURCE_COLUMN ] ) == { 'milk_V2' }
+    assert tail.poll() == ( None, None )
+
+# ----------------------------------------------------------------- #
+#                           CHUNKED FRAMES                          #
+# ----------------------------------------------------------------- #
+
+def make_rows( sources, start = 0 ):
+    return pd.DataFrame( { 'Value' : np.arange( start, start + len( sources ) ), SOURCE_COLUMN : sources } )
+
+def test_append_rows_numbers_rows_and_adds_sources():
+    first  = make_rows( [ 'beef', 'milk', 'beef' ] )
+    first[ SOURCE_COLUMN ] = first[ SOURCE_COLUMN ].astype( 'category' )
+    chunks = ChunkedFrame( [ first ] )
+
+    extended, new_rows = chunks.append_rows( make_rows( [ 'milk', 'cheese' ], 3 ) )
+    assert new_rows.index.tolist() == [ 3, 4 ]
+    assert new_rows[ SOURCE_COLUMN ].cat.categories.tolist() == [ 'beef', 'milk', 'cheese' ]
+    assert extended.categories[ SOURCE_COLUMN ] == [ 'beef', 'milk', 'cheese' ]
+    extended, new_rows = extended.append_rows( make_rows( [ 'beef' ], 5 ) )
+    assert len( extended ) == 6 and new_rows.index.tolist() == [ 5 ]
+
+    frame = extended.frame()
+    assert frame.index.tolist() == list( range( 6 ) )
+    assert frame[ 'Value' ].tolist() == list( range( 6 ) )
+    assert frame[ SOURCE_COLUMN ].tolist() == [ 'beef', 'milk', 'beef', 'milk', 'cheese', 'beef' ]
+    assert frame[ SOURCE_COLUMN ].cat.categories.tolist() == [ 'beef', 'milk', 'cheese' ]
+    assert len( extended.chunks ) == 1
+
+def test_append_rows_leaves_older_version_unchanged():
+    first  = make_rows( [ 'beef' ] )
+    first[ SOURCE_COLUMN ] = first[ SOURCE_COLUMN ].astype( 'category' )
+    chunks = ChunkedFrame( [ first ] )
+    extended, new_rows = chunks.append_rows( make_rows( [ 'milk' ], 1 ) )
+    assert len( chunks ) == 1 and len( chunks.frame() ) == 1
+    assert chunks.frame()[ SOURCE_COLUMN ].cat.categories.tolist() == [ 'beef' ]
+    assert len( extended.frame() ) == 2
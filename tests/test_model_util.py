@@ -0,0 +1,117 @@
+# Import libraries
+import multiprocessing                                      # For a spawned worker process
+import numpy as np                                          # For random regression problems
+from   concurrent.futures import Future, ProcessPoolExecutor
+from   concurrent.futures.process import BrokenProcessPool
+import model_util
+from   model_util import train_models, fit_ridge, group_folds
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+def random_problem( rows = 300, columns = 40 ):
+    random = np.random.default_rng( 0 )
+    X      = random.standard_normal( ( rows, columns ) )
+    Y      = X[ :, : 3 ] @ random.standard_normal( ( 3, 2 ) ) + 0.1 * random.standard_normal( ( rows, 2 ) )
+    return X, Y, np.arange( rows ) // 3
+
+def assert_same_results( results, expected ):
+    assert results.keys() == expected.keys()
+    for target in expected:
+        np.testing.assert_allclose( results[ target ][ 'predictions' ], expected[ target ][ 'predictions' ] )
+        np.testing.assert_allclose( results[ target ][ 'coefficients' ], expected[ target ][ 'coefficients' ] )
+
+# Pool whose workers have died
+class BrokenPool:
+    _max_workers = 2
+
+    def submit( self, *args ):
+        future = Future()
+        future.set_exception( BrokenProcessPool( 'worker died' ) )
+        return future
+
+    def shutdown( self, wait = True ):
+        pass
+
+# Pool running its tasks in the calling process, recording them
+class RecordingPool:
+    def __init__( self, workers ):
+        self._max_workers = workers
+        self.batches      = []
+
+    def submit( self, function, *args ):
+        self.batches.append( args[ -1 ] )
+        future = Future()
+        future.set_result( function( *args ) )
+        return future
+
+# ----------------------------------------------------------------- #
+#                           RIDGE PENALTY                           #
+# ----------------------------------------------------------------- #
+
+# The penalty follows the scale of the data: scaled spectra give the
+# same predictions, not an intercept-only model
+def test_ridge_penalty_is_relative_to_the_data():
+    X, Y, groups = random_problem()
+    expected     = train_models( X, Y, groups, [ 'a', 'b' ], 'ridge', processes = 1 )
+    for scale in [ 1e-4, 1e3 ]:
+        results = train_models( X * scale, Y, groups, [ 'a', 'b' ], 'ridge', processes = 1 )
+        for target in expected:
+            np.testing.assert_allclose( results[ target ][ 'predictions' ], expected[ target ][ 'predictions' ] )
+            assert results[ target ][ 'cv' ][ 'r2' ] > 0.9
+
+def test_ridge_shrinks_with_alpha():
+    X, Y, _ = random_problem()
+    norms   = [ np.linalg.norm( fit_ridge( X, Y[ :, 0 ], alpha )[ 0 ] ) for alpha in [ 0, 0.01, 1, 100 ] ]
+    assert norms == sorted( norms, reverse = True ) and norms[ -1 ] < 0.05 * norms[ 0 ]
+    coefficients, intercept = fit_ridge( X, Y[ :, 0 ], 0 )
+    np.testing.assert_allclose( X @ coefficients + intercept, np.c_[ X, np.ones( len( X ) ) ] @ np.linalg.lstsq( np.c_[ X, np.ones( len( X ) ) ], Y[ :, 0 ], rcond = None )[ 0 ] )
+
+# ----------------------------------------------------------------- #
+#                          GROUPED FOLDS                            #
+# ----------------------------------------------------------------- #
+
+def test_group_folds_keep_replicates_together():
+    groups = np.repeat( [ 's%d' % i for i in range( 20 ) ], 3 )
+    folds  = group_folds( groups, 5 )
+    assert set( folds ) == set( range( 5 ) )
+    assert all( len( set( folds[ groups == group ] ) ) == 1 for group in set( groups ) )
+
+# ----------------------------------------------------------------- #
+#                           SHARED POOL                             #
+# ----------------------------------------------------------------- #
+
+def test_pool_matches_serial_and_is_reused():
+    X, Y, groups = random_problem()
+    expected     = train_models( X, Y, groups, [ 'a', 'b' ], processes = 1 )
+    assert_same_results( train_models( X, Y, groups, [ 'a', 'b' ], processes = 2, parallel_min_cells = 0 ), expected )
+    pool = model_util._model_pool
+    assert pool is not None
+    train_models( X, Y, groups, [ 'a', 'b' ], 'ridge', 0.01, parallel_min_cells = 0 )
+    assert_same_results( train_models( X, Y, groups, [ 'a', 'b' ], parallel_min_cells = 0 ), expected )
+    assert model_util._model_pool is pool
+
+# The tasks are split over the workers of the existing pool, whatever
+# the number of processes asked for
+def test_tasks_split_over_pool_workers( monkeypatch ):
+    X, Y, groups = random_problem()
+    pool         = RecordingPool( 3 )
+    monkeypatch.setattr( model_util, '_model_pool', pool )
+    assert_same_results( train_models( X, Y, groups, [ 'a', 'b' ], processes = 8, parallel_min_cells = 0 ),
+                         train_models( X, Y, groups, [ 'a', 'b' ], processes = 1 ) )
+    assert len( pool.batches ) == 3
+    assert sum( len( batch ) for batch in pool.batches ) == 2 * ( 5 + 1 )
+
+def test_broken_pool_falls_back_to_serial( monkeypatch ):
+    X, Y, groups = random_problem()
+    monkeypatch.setattr( model_util, '_model_pool', BrokenPool() )
+    assert_same_results( train_models( X, Y, groups, [ 'a', 'b' ], parallel_min_cells = 0 ),
+                         train_models( X, Y, groups, [ 'a', 'b' ], processes = 1 ) )
+    assert model_util._model_pool is None
+
+def test_serial_inside_worker_process():
+    X, Y, groups = random_problem()
+    with ProcessPoolExecutor( 1, mp_context = multiprocessing.get_context( 'spawn' ) ) as pool:
+        results = pool.submit( train_models, X, Y, groups, [ 'a', 'b' ], parallel_min_cells = 0 ).result( timeout = 120 )
+    assert_same_results( results, train_models( X, Y, groups, [ 'a', 'b' ], processes = 1 ) )
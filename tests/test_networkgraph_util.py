@@ -0,0 +1,108 @@
+# Import libraries
+import json                                                 # For checking that node elements are valid JSON
+import numpy as np                                          # For node positions
+import pandas as pd                                         # For branch data frames
+from   networkgraph_util import get_nodes, set_node_colours, CategoryColourRegistry, NODE_DATA_COLUMNS, NODE_COLOUR_ATTRIBUTES
+from   graph_util import set_node_positions
+from   filter_util import build_node_table
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Small 'branches' data frame, with missing values in some columns
+def make_branches( n, start = 0 ):
+    blocks = np.arange( start, start + n )
+    return pd.DataFrame( {
+        'Hash'                  : [ format( i, '064x' ) for i in blocks ],
+        'Owner'                 : [ [ 'Farm A', 'Farm B', None ][ i % 3 ] for i in blocks ],
+        'ProductName'           : [ [ 'beef', 'milk' ][ i % 2 ] for i in blocks ],
+        'ProductID'             : [ 'P%d' % ( i % 4 ) for i in blocks ],
+        'Weight'                : [ '%d kg' % i for i in blocks ],
+        'WeightInteger'         : blocks.astype( np.int64 ),
+        'Temperature'           : [ '%d C' % ( i % 7 ) for i in blocks ],
+        'TemperatureInteger'    : np.where( blocks % 5 == 0, np.nan, blocks % 7 ),
+        'Location'              : [ [ 'Leeds', 'York', np.nan ][ i % 3 ] for i in blocks ],
+        'EventTimestamp'        : [ '2024-01-%02dT00:00:00Z' % ( 1 + i % 28 ) for i in blocks ],
+        'NodeSizeInWeight'      : blocks / 10,
+        'NodeSizeInTemperature' : ( blocks % 7 ) / 10,
+        'PreviousHash'          : [ format( i - 1, '064x' ) if i else 'GenesisBlock' for i in blocks ],
+    } )
+
+# Node elements built one dict per row, as the nodes were first built
+def reference_nodes( branches ):
+    nodes = []
+    for _, row in branches.iterrows():
+        data = { key : ( None if pd.isna( row[ column ] ) else row[ column ] ) for key, column in NODE_DATA_COLUMNS.items() }
+        data = { key : ( value.item() if isinstance( value, np.generic ) else value ) for key, value in data.items() }
+        nodes.append( { 'data' : data } )
+    return nodes
+
+# ----------------------------------------------------------------- #
+#                           NODE RECORDS                            #
+# ----------------------------------------------------------------- #
+
+def test_node_records_match_row_by_row_nodes():
+    branches = make_branches( 30 )
+    nodes    = get_nodes( branches )
+    assert len( nodes ) == 30
+    assert list( nodes ) == reference_nodes( branches )
+    assert nodes[ -1 ] == nodes[ 29 ]
+    assert nodes[ 2:5 ] == reference_nodes( branches )[ 2:5 ]
+    json.dumps( list( nodes ) )
+
+def test_node_colours_and_positions_match_node_lists():
+    branches = make_branches( 30 )
+    x, y     = np.arange( 30 ) * 2.0, np.arange( 30 ) * 3.0
+    records  = set_node_positions( set_node_colours( get_nodes( branches ), CategoryColourRegistry() ), x, y )
+    expected = set_node_positions( set_node_colours( reference_nodes( branches ), CategoryColourRegistry() ), x, y )
+    assert list( records ) == expected
+    for colour_property in NODE_COLOUR_ATTRIBUTES.values():
+        assert all( isinstance( node[ 'data' ][ colour_property ], str ) for node in records )
+
+def test_extended_node_records_match_one_build():
+    registry = CategoryColourRegistry()
+    x, y     = np.arange( 50 ) * 1.0, np.zeros( 50 )
+    nodes    = set_node_positions( set_node_colours( get_nodes( make_branches( 30 ) ), registry ), x[ :30 ], y[ :30 ] )
+    for start, end in [ ( 30, 42 ), ( 42, 50 ) ]:
+        new_nodes = set_node_colours( get_nodes( make_branches( end - start, start ) ), registry )
+        nodes.extend( set_node_positions( new_nodes, x[ start:end ], y[ start:end ] ) )
+    whole = set_node_positions( set_node_colours( get_nodes( make_branches( 50 ) ), CategoryColourRegistry() ), x, y )
+    assert len( nodes ) == 50
+    assert list( nodes ) == list( whole )
+    pd.testing.assert_frame_equal( build_node_table( nodes ), build_node_table( whole ) )
+
+def test_node_table_of_records_matches_node_lists():
+    branches = make_branches( 30 )
+    pd.testing.assert_frame_equal( build_node_table( get_nodes( branches ) ), build_node_table( reference_nodes( branches ) ) )
+
+# ----------------------------------------------------------------- #
+#                          COLOUR REGISTRY                          #
+# ----------------------------------------------------------------- #
+
+# A category keeps its colour whatever the order (or the registry) it is
+# first seen in, and keeps its code when it is registered again
+def test_category_colours_are_stable():
+    registry = CategoryColourRegistry()
+    codes    = registry.register( 'owner', [ 'Farm A', 'Farm B', 'Farm A', None ] )
+    assert codes.tolist() == [ 0, 1, 0, 2 ]
+    assert registry.register( 'owner', [ 'Farm C', 'Farm B' ] ).tolist() == [ 3, 1 ]
+    other   = CategoryColourRegistry()
+    colours = other.colours_of( 'owner', other.register( 'owner', [ 'Farm C', None, 'Farm B', 'Farm A' ] ) )
+    assert colours.tolist() == registry.colours_of( 'owner', [ 3, 2, 1, 0 ] ).tolist()
+    assert colours[ 0 ] == CategoryColourRegistry.category_colour( 'Farm C' )
+
+def test_category_colours_are_distinct():
+    names   = [ 'Farm %d' % i for i in range( 40 ) ]
+    colours = [ CategoryColourRegistry.category_colour( name ) for name in names ]
+    assert all( colour.startswith( '#' ) and len( colour ) == 7 for colour in colours )
+    assert len( set( colours ) ) == len( names )
+
+def test_registry_categories_and_options():
+    registry = CategoryColourRegistry()
+    registry.register( 'location', [ 'York', None, 'Leeds', 'York' ] )
+    set_node_colours( get_nodes( make_branches( 6 ) ), registry )
+    assert registry.get_categories( 'location' ) == [ 'Leeds', 'York' ]
+    assert registry.categories[ 'location' ].count( None ) == 1
+    assert registry.get_categories( 'owner' ) == [ 'Farm A', 'Farm B' ]
+    assert registry.dropdown_options( 'product_name' ) == [ { 'label' : 'beef', 'value' : 'beef' }, { 'label' : 'milk', 'value' : 'milk' } ]
@@ -0,0 +1,107 @@
+# Import libraries
+import os                                                   # For the stage output files
+import numpy as np                                          # For random spectra
+import pytest                                               # For expected errors
+from   preprocess_util import PreprocessingPipeline, PreprocessedSpectraCache, multiplicative_scatter_correction
+from   pca_util import iter_row_blocks, randomized_pca
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+STAGES = [ ( 'trim', { 'low' : 800, 'high' : 3500 } ), 'snv', 'msc', ( 'savgol', { 'derivative' : 1 } ) ]
+
+def random_spectra( rows = 3000, columns = 300 ):
+    random      = np.random.default_rng( 0 )
+    wavenumbers = np.linspace( 4000, 400, columns )
+    matrix      = ( random.standard_normal( ( rows, 8 ) ) @ random.standard_normal( ( 8, columns ) ) + 5
+                  + 0.1 * random.standard_normal( ( rows, columns ) ) ).astype( np.float32 )
+    return matrix, wavenumbers
+
+# Stages applied one after the other to the whole matrix, the MSC
+# reference being the mean of the whole matrix at that stage (of its
+# float32 values, as the pipeline outputs float32)
+def reference_preprocessing( matrix, wavenumbers ):
+    pipeline = PreprocessingPipeline( STAGES )
+    values   = matrix.astype( np.float64 )
+    for stage in pipeline.stages:
+        if stage[ 0 ] == 'msc': values = multiplicative_scatter_correction( values, values.astype( np.float32 ).mean( axis = 0, dtype = np.float64 ) )[ 0 ]
+        else:                   values, wavenumbers = pipeline.apply_stage( stage, values, wavenumbers )[ : 2 ]
+    return values.astype( np.float32 ), wavenumbers
+
+# ----------------------------------------------------------------- #
+#                        STREAMED PREPROCESSING                     #
+# ----------------------------------------------------------------- #
+
+def test_streamed_fit_matches_whole_matrix():
+    matrix, wavenumbers = random_spectra()
+    expected, expected_wavenumbers = reference_preprocessing( matrix, wavenumbers )
+    pipeline = PreprocessingPipeline( STAGES ).fit( matrix, wavenumbers, chunk_rows = 700 )
+    blocks   = np.concatenate( [ block for start, end, block in iter_row_blocks( matrix, pipeline.preprocess, 700 ) ] )
+    np.testing.assert_array_equal( pipeline.wavenumbers, expected_wavenumbers )
+    np.testing.assert_allclose( blocks, expected, rtol = 1e-5, atol = 1e-5 )
+    np.testing.assert_allclose( pipeline.fit_transform( matrix, wavenumbers )[ 0 ], expected, rtol = 1e-5, atol = 1e-5 )
+
+def test_pca_with_preprocess_hook_matches_preprocessed_matrix():
+    matrix, wavenumbers = random_spectra()
+    pipeline = PreprocessingPipeline( STAGES ).fit( matrix, wavenumbers )
+    streamed = randomized_pca( matrix, 5, 'autoscale', pipeline.preprocess, chunk_rows = 500 )
+    whole    = randomized_pca( pipeline.preprocess( matrix ), 5, 'autoscale' )
+    np.testing.assert_allclose( streamed.explained_variance, whole.explained_variance, rtol = 1e-4 )
+    np.testing.assert_allclose( np.abs( streamed.scores ), np.abs( whole.scores ), rtol = 1e-3, atol = 1e-3 * np.abs( whole.scores ).max() )
+
+def test_pipeline_without_fitted_parameters_reads_nothing():
+    matrix, wavenumbers = random_spectra( rows = 10 )
+    class Unreadable:
+        def __len__( self ): return len( matrix )
+        def __getitem__( self, rows ): raise AssertionError( 'matrix read' )
+    pipeline = PreprocessingPipeline( [ 'snv', ( 'savgol', { 'derivative' : 2, 'order' : 3 } ) ] ).fit( Unreadable(), wavenumbers )
+    assert pipeline.preprocess( matrix ).shape == matrix.shape
+
+def test_transform_needs_fitted_references():
+    matrix, wavenumbers = random_spectra( rows = 10 )
+    with pytest.raises( ValueError ):
+        PreprocessingPipeline( [ 'msc' ] ).transform( matrix, wavenumbers )
+
+# ----------------------------------------------------------------- #
+#                      PREPROCESSED STAGE OUTPUTS                   #
+# ----------------------------------------------------------------- #
+
+def test_cached_stage_outputs_match_pipeline( tmp_path ):
+    matrix, wavenumbers = random_spectra()
+    expected, expected_wavenumbers = reference_preprocessing( matrix, wavenumbers )
+    cache            = PreprocessedSpectraCache( str( tmp_path ), chunk_rows = 700 )
+    values, pipeline = cache.get( 'spectra', matrix, wavenumbers, STAGES )
+    assert isinstance( values, np.memmap ) and cache.stage_runs == len( STAGES )
+    np.testing.assert_array_equal( pipeline.wavenumbers, expected_wavenumbers )
+    # Every stage output is stored as float32, so the error adds up a little
+    np.testing.assert_allclose( values, expected, rtol = 1e-3, atol = 1e-3 )
+    # The fitted pipeline preprocesses new spectra like the cached rows
+    np.testing.assert_allclose( pipeline.preprocess( matrix[ :5 ] ), values[ :5 ], rtol = 1e-3, atol = 1e-3 )
+
+def test_changing_last_stage_only_runs_last_stage():
+    matrix, wavenumbers = random_spectra( rows = 500 )
+    cache = PreprocessedSpectraCache()
+    cache.get( 'spectra', matrix, wavenumbers, STAGES )
+    cache.get( 'spectra', matrix, wavenumbers, STAGES )
+    assert cache.stage_runs == len( STAGES )
+
+    # A new derivative: only the Savitzky-Golay stage runs again
+    changed = STAGES[ : -1 ] + [ ( 'savgol', { 'derivative' : 2, 'order' : 3 } ) ]
+    values, pipeline = cache.get( 'spectra', matrix, wavenumbers, changed )
+    assert cache.stage_runs == len( STAGES ) + 1
+    np.testing.assert_allclose( values, PreprocessingPipeline( changed ).fit_transform( matrix, wavenumbers )[ 0 ], rtol = 1e-3, atol = 1e-3 )
+
+    # Dropping it reuses the prefix; another matrix key starts again
+    cache.get( 'spectra', matrix, wavenumbers, STAGES[ : -1 ] )
+    assert cache.stage_runs == len( STAGES ) + 1
+    cache.get( 'other', matrix, wavenumbers, STAGES[ : 1 ] )
+    assert cache.stage_runs == len( STAGES ) + 2
+
+def test_evicted_stage_outputs_are_deleted( tmp_path ):
+    matrix, wavenumbers = random_spectra( rows = 200 )
+    cache = PreprocessedSpectraCache( str( tmp_path ), max_entries = 2 )
+    cache.get( 'spectra', matrix, wavenumbers, STAGES )
+    assert len( os.listdir( cache.directory ) ) == 2
+    values, pipeline = cache.get( 'spectra', matrix, wavenumbers, [ 'snv' ] )
+    assert len( os.listdir( cache.directory ) ) == 2 and values.shape == matrix.shape
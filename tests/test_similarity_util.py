@@ -0,0 +1,79 @@
+# Import libraries
+import numpy as np                                          # For random rows and brute-force distances
+import pytest                                               # For the metrics and checking errors
+from   similarity_util import SimilarityIndex, SIMILARITY_METRICS
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Random rows of different scales, one of them (row 7) zero
+def make_rows( rows = 500, columns = 30, seed = 0 ):
+    random = np.random.default_rng( seed )
+    values = random.standard_normal( ( rows, columns ) ) * random.uniform( 0.1, 10, ( rows, 1 ) )
+    values[ 7 : 8 ] = 0
+    return values
+
+# All the distances between queries and rows, in float64
+def brute_force_distances( queries, values, metric ):
+    if metric == 'euclidean': return np.linalg.norm( queries[ :, None, : ] - values[ None, :, : ], axis = 2 )
+    query_norms = np.linalg.norm( queries, axis = 1, keepdims = True )
+    row_norms   = np.linalg.norm( values,  axis = 1, keepdims = True )
+    return 1 - ( queries / np.where( query_norms == 0, 1, query_norms ) ) @ ( values / np.where( row_norms == 0, 1, row_norms ) ).T
+
+# ----------------------------------------------------------------- #
+#                         NEAREST NEIGHBOURS                        #
+# ----------------------------------------------------------------- #
+
+# Several blocks, with the best k kept across them, give the brute-force
+# neighbours
+@pytest.mark.parametrize( 'metric', SIMILARITY_METRICS )
+def test_query_matches_brute_force( metric ):
+    values  = make_rows()
+    queries = np.r_[ values[ [ 3, 100, 499 ] ], np.random.default_rng( 1 ).standard_normal( ( 2, 30 ) ) ]
+    index   = SimilarityIndex( values, metric, block_rows = 64 )
+    rows, distances = index.query( queries, k = 10 )
+    expected        = brute_force_distances( queries, values, metric )
+    assert rows.shape == distances.shape == ( 5, 10 )
+    np.testing.assert_array_equal( rows, np.argsort( expected, axis = 1, kind = 'stable' )[ :, : 10 ] )
+    # Euclidean distances come from float32 norms and products: compare
+    # their squares, up to the rounding of the largest squared norm
+    scale = 1 if metric == 'cosine' else ( values ** 2 ).sum( axis = 1 ).max()
+    np.testing.assert_allclose( distances ** 2, np.take_along_axis( expected, rows, axis = 1 ) ** 2, rtol = 1e-4, atol = 1e-6 * scale )
+    # A row is its own nearest neighbour
+    assert rows[ :3, 0 ].tolist() == [ 3, 100, 499 ]
+
+@pytest.mark.parametrize( 'metric', SIMILARITY_METRICS )
+def test_excluded_rows_are_skipped( metric ):
+    values = make_rows()
+    index  = SimilarityIndex( values, metric, block_rows = 64 )
+    rows, _ = index.query( values[ 3 ], k = 5, exclude = [ 3 ] )
+    expected = brute_force_distances( values[ [ 3 ] ], values, metric )[ 0 ]
+    expected[ 3 ] = np.inf
+    assert rows[ 0 ].tolist() == np.argsort( expected, kind = 'stable' )[ :5 ].tolist()
+
+# Cosine distances do not depend on the scale of the rows, and a zero row
+# is at distance one from every query
+def test_cosine_ignores_scale():
+    values = make_rows()
+    index  = SimilarityIndex( values, 'cosine' )
+    rows, distances = index.query( values[ 3 ] * 1000, k = len( values ) )
+    assert rows[ 0, 0 ] == 3 and abs( distances[ 0, 0 ] ) < 1e-5
+    assert np.isclose( distances[ 0, rows[ 0 ].tolist().index( 7 ) ], 1 )
+
+def test_index_of_memory_mapped_rows( tmp_path ):
+    values = make_rows().astype( np.float32 )
+    mapped = np.lib.format.open_memmap( str( tmp_path / 'rows.npy' ), mode = 'w+', dtype = np.float32, shape = values.shape )
+    mapped[ : ] = values
+    index  = SimilarityIndex( mapped, 'euclidean', block_rows = 100 )
+    assert np.shares_memory( index.values, mapped )
+    rows, _ = index.query( values[ 42 ], k = 3 )
+    assert rows[ 0, 0 ] == 42
+
+def test_k_larger_than_index():
+    index = SimilarityIndex( make_rows( 4 ), 'euclidean' )
+    rows, distances = index.query( make_rows( 4 )[ 0 ], k = 10, exclude = [ 0 ] )
+    assert sorted( rows[ 0 ].tolist() ) == [ 1, 2, 3 ]
+    rows, distances = SimilarityIndex( make_rows( 1 ), 'euclidean' ).query( np.zeros( 30 ), exclude = [ 0 ] )
+    assert rows.shape == ( 1, 0 )
+    with pytest.raises( ValueError ): SimilarityIndex( make_rows( 4 ), 'manhattan' )
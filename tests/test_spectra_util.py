@@ -0,0 +1,62 @@
+# Import libraries
+import numpy as np                                          # For random spectra
+from   spectra_util import downsample_minmax
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+# Noisy spectra with one sharp peak and one sharp valley each, on a
+# decreasing wavenumber axis (as in the FTIR files)
+def make_spectra( spectra = 4, points = 5003, seed = 0 ):
+    random = np.random.default_rng( seed )
+    x      = np.linspace( 4000, 400, points )
+    values = np.cumsum( random.standard_normal( ( spectra, points ) ), axis = 1 )
+    for row in range( spectra ):
+        values[ row, random.integers( points ) ] += 1000
+        values[ row, random.integers( points ) ] -= 1000
+    return x, values
+
+# ----------------------------------------------------------------- #
+#                         MIN/MAX DOWNSAMPLING                      #
+# ----------------------------------------------------------------- #
+
+def test_downsampling_keeps_extremes():
+    x, values = make_spectra()
+    xs, ys    = downsample_minmax( x, values, 400 )
+    assert xs.shape == ys.shape == ( 4, 400 )
+    np.testing.assert_array_equal( ys.max( axis = 1 ), values.max( axis = 1 ) )
+    np.testing.assert_array_equal( ys.min( axis = 1 ), values.min( axis = 1 ) )
+    # The peak and the valley are at their own wavenumbers
+    for row in range( len( values ) ):
+        assert xs[ row, np.argmax( ys[ row ] ) ] == x[ np.argmax( values[ row ] ) ]
+        assert xs[ row, np.argmin( ys[ row ] ) ] == x[ np.argmin( values[ row ] ) ]
+
+# Every bucket keeps its lowest and highest point, in axis order, and the
+# kept points are points of the spectrum
+def test_downsampling_keeps_bucket_extremes_in_order():
+    x, values = make_spectra( 2, 1000 )
+    xs, ys    = downsample_minmax( x, values, 100 )
+    size      = 20
+    columns   = { wavenumber : column for column, wavenumber in enumerate( x ) }
+    for row in range( 2 ):
+        assert np.all( np.diff( xs[ row ] ) <= 0 )
+        buckets = values[ row ].reshape( 50, size )
+        np.testing.assert_array_equal( ys[ row ].reshape( 50, 2 ).min( axis = 1 ), buckets.min( axis = 1 ) )
+        np.testing.assert_array_equal( ys[ row ].reshape( 50, 2 ).max( axis = 1 ), buckets.max( axis = 1 ) )
+        np.testing.assert_array_equal( values[ row, [ columns[ wavenumber ] for wavenumber in xs[ row ] ] ], ys[ row ] )
+
+def test_last_partial_bucket_is_kept():
+    x, values = make_spectra( 1, 1001 )
+    values[ 0, -1 ] = 1e6
+    xs, ys    = downsample_minmax( x, values, 100 )
+    assert ys[ 0 ].max() == 1e6 and xs[ 0, np.argmax( ys[ 0 ] ) ] == x[ -1 ]
+    assert xs.shape[ 1 ] <= 100
+
+def test_short_spectra_are_unchanged():
+    x, values = make_spectra( 3, 300 )
+    xs, ys    = downsample_minmax( x, values, 400 )
+    np.testing.assert_array_equal( ys, values )
+    np.testing.assert_array_equal( xs, np.broadcast_to( x, values.shape ) )
+    xs, ys    = downsample_minmax( x, values[ 0 ], 400 )
+    assert ys.shape == ( 1, 300 )
@@ -0,0 +1,81 @@
+# Import libraries
+import numpy as np                                          # For node arrays
+import pandas as pd                                         # For event data frames
+from   treemap_util import build_treemap_cube, merge_treemap_cubes, select_treemap_nodes, build_treemap_trace, TREEMAP_PATH, TREEMAP_ROOT
+
+# ----------------------------------------------------------------- #
+#                              HELPERS                              #
+# ----------------------------------------------------------------- #
+
+def make_events():
+    return pd.DataFrame( {
+        'ProductType' : [ 'Derived', 'Derived', 'Derived', 'Raw', 'Raw' ],
+        'EventDate'   : [ '2024-01-01', '2024-01-01', '2024-01-02', '2024-01-01', '2024-01-01' ],
+        'Location'    : [ 'Leeds', 'York', 'Leeds', 'Leeds', 'Leeds' ],
+        'Owner'       : [ 'Farm A', 'Farm A', 'Farm B', 'Farm A', 'Farm B' ],
+        'Weight'      : [ 1.0, 2.0, 3.0, 4.0, 'unknown' ]
+    } )
+
+def selected_ids( cube, root_id = None, depth = 2 ):
+    root_id, selected = select_treemap_nodes( cube, root_id, depth )
+    return root_id, set( cube[ 'ids' ][ selected ] )
+
+# Cube nodes by id, for comparing cubes built in a different order
+def cube_by_id( cube ):
+    return pd.DataFrame( { key : cube[ key ] for key in [ 'parents', 'labels', 'values', 'colors', 'depths' ] }, index = cube[ 'ids' ] ).sort_index()
+
+# ----------------------------------------------------------------- #
+#                          AGGREGATION CUBE                         #
+# ----------------------------------------------------------------- #
+
+def test_cube_sums_every_level():
+    cube  = cube_by_id( build_treemap_cube( make_events(), 'Weight' ) )
+    assert cube.loc[ TREEMAP_ROOT, 'values' ] == 10.0 and cube.loc[ TREEMAP_ROOT, 'parents' ] == ''
+    assert cube.loc[ 'Products/Derived', 'values' ] == 6.0
+    assert cube.loc[ 'Products/Derived/2024-01-01', 'values' ] == 3.0
+    assert cube.loc[ 'Products/Derived/2024-01-01/York/Farm A', 'parents' ] == 'Products/Derived/2024-01-01/York'
+    # Value-weighted mean colour, and no value for the non-numeric weight
+    assert np.isclose( cube.loc[ 'Products/Derived', 'colors' ], ( 1 + 4 + 9 ) / 6 )
+    assert cube.loc[ 'Products/Raw/2024-01-01/Leeds/Farm B', 'values' ] == 0.0
+    assert cube[ 'depths' ].max() == len( TREEMAP_PATH )
+    # Every parent is a node one level up
+    assert all( cube.loc[ cube.loc[ node, 'parents' ], 'depths' ] == cube.loc[ node, 'depths' ] - 1 for node in cube.index if node != TREEMAP_ROOT )
+
+def test_merged_cubes_match_one_build():
+    events = make_events()
+    cube   = merge_treemap_cubes( build_treemap_cube( events[ : 2 ], 'Weight' ), build_treemap_cube( events[ 2 : ], 'Weight' ) )
+    pd.testing.assert_frame_equal( cube_by_id( cube ), cube_by_id( build_treemap_cube( events, 'Weight' ) ) )
+
+# ----------------------------------------------------------------- #
+#                          NODE SELECTION                           #
+# ----------------------------------------------------------------- #
+
+# The root and its children and grandchildren, down to 'depth' levels
+def test_select_root_and_children():
+    cube = build_treemap_cube( make_events(), 'Weight' )
+    root_id, ids = selected_ids( cube )
+    assert root_id == TREEMAP_ROOT
+    assert ids == { TREEMAP_ROOT, 'Products/Derived', 'Products/Raw', 'Products/Derived/2024-01-01', 'Products/Derived/2024-01-02', 'Products/Raw/2024-01-01' }
+    assert selected_ids( cube, depth = 1 )[ 1 ] == { TREEMAP_ROOT, 'Products/Derived', 'Products/Raw' }
+
+# Below the top, the ancestors of the root are kept for the path bar, and
+# nodes whose id only starts like the root's are not its children
+def test_select_subtree_with_ancestors():
+    events = pd.concat( [ make_events(), make_events().assign( ProductType = 'Derived2' ) ] )
+    cube   = build_treemap_cube( events, 'Weight' )
+    root_id, ids = selected_ids( cube, 'Products/Derived/2024-01-01' )
+    assert root_id == 'Products/Derived/2024-01-01'
+    assert ids == { TREEMAP_ROOT, 'Products/Derived', 'Products/Derived/2024-01-01',
+                    'Products/Derived/2024-01-01/Leeds', 'Products/Derived/2024-01-01/York',
+                    'Products/Derived/2024-01-01/Leeds/Farm A', 'Products/Derived/2024-01-01/York/Farm A' }
+
+def test_unknown_root_selects_top():
+    cube = build_treemap_cube( make_events(), 'Weight' )
+    assert selected_ids( cube, 'Products/Missing' ) == selected_ids( cube )
+
+def test_trace_of_selected_nodes():
+    cube  = build_treemap_cube( make_events(), 'Weight' )
+    trace = build_treemap_trace( cube, 'Products/Raw' )
+    assert trace.level == 'Products/Raw'
+    assert set( trace.ids ) == selected_ids( cube, 'Products/Raw' )[ 1 ]
+    assert len( trace.ids ) == len( trace.parents ) == len( trace.values ) == len( trace.marker.colors )
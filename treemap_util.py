@@ -0,0 +1,124 @@
+
+# Import libraries
+import numpy as np                                          # For value and colour arrays
+import pandas as pd                                         # For grouped sums per hierarchy level
+import plotly.graph_objects as go                           # For the treemap trace
+
+# ----------------------------------------------------------------- #
+#                      TREEMAP AGGREGATION CUBE                     #
+# ----------------------------------------------------------------- #
+
+# Hierarchy of the treemap, from the top level to the leaves
+TREEMAP_PATH = [ 'ProductType', 'EventDate', 'Location', 'Owner' ]
+
+# Label (and id) of the root node
+TREEMAP_ROOT = 'Products'
+
+# Number of levels sent to the browser below the current root
+TREEMAP_VISIBLE_DEPTH = 2
+
+# Aggregate 'value_column' over the hierarchy once.
+# Returns a dictionary of arrays, one element per treemap node:
+#   'ids', 'parents', 'labels' : node id ('Products/Derived/...'), parent id and label
+#   'values'                   : sum of the values below the node
+#   'colors'                   : value-weighted mean of the values (as px.treemap does
+#                                when 'color' and 'values' are the same column)
+#   'depths'                   : 0 for the root, 1 for the first level, ...
+def build_treemap_cube( df, value_column, path = TREEMAP_PATH, root = TREEMAP_ROOT ):
+    values = pd.to_numeric( df[ value_column ], errors = 'coerce' ).fillna( 0 ).to_numpy( dtype = float )
+    frame  = df[ path ].astype( str )
+    frame[ '_value'    ] = values
+    frame[ '_weighted' ] = values * values
+
+    ids     = [ np.array( [ root ], dtype = object ) ]
+    parents = [ np.array( [ ''   ], dtype = object ) ]
+    labels  = [ np.array( [ root ], dtype = object ) ]
+    sums    = [ np.array( [ values.sum() ] ) ]
+    weights = [ np.array( [ ( values * values ).sum() ] ) ]
+    depths  = [ np.array( [ 0 ] ) ]
+
+    # One grouped sum per level of the hierarchy
+    for level in range( len( path ) ):
+        grouped = frame.groupby( path[ : level + 1 ], sort = True )[ [ '_value', '_weighted' ] ].sum()
+        keys    = grouped.index.to_frame( index = False )
+        parent  = pd.Series( root, index = keys.index )
+        for column in path[ : level ]: parent = parent + '/' + keys[ column ]
+        ids    .append( ( parent + '/' + keys[ path[ level ] ] ).to_numpy( dtype = object ) )
+        parents.append( parent.to_numpy( dtype = object ) )
+        labels .append( keys[ path[ level ] ].to_numpy( dtype = object ) )
+        sums   .append( grouped[ '_value'    ].to_numpy() )
+        weights.append( grouped[ '_weighted' ].to_numpy() )
+        depths .append( np.full( len( grouped ), level + 1 ) )
+
+    sums    = np.concatenate( sums )
+    weights = np.concatenate( weights )
+    colors  = np.divide( weights, sums, out = np.zeros_like( sums ), where = sums != 0 )
+
+    return {
+        'ids'     : np.concatenate( ids     ),
+        'parents' : np.concatenate( parents ),
+        'labels'  : np.concatenate( labels  ),
+        'values'  : sums,
+        'colors'  : colors,
+        'depths'  : np.concatenate( depths  )
+    }
+
+# Add the cube of new events to a cube (both built with the same path and
+# root), e.g. in live mode. Only the cube nodes are combined, not the events:
+# nodes of both cubes get the sum of their values, new nodes are appended.
+def merge_treemap_cubes( cube, new_cube ):
+    positions = pd.Index( cube[ 'ids' ] ).get_indexer( new_cube[ 'ids' ] )
+    known     = positions >= 0
+    values    = cube[ 'values' ].copy()
+    weights   = cube[ 'colors' ] * cube[ 'values' ]
+    np.add.at( values,  positions[ known ], new_cube[ 'values' ][ known ] )
+    np.add.at( weights, positions[ known ], ( new_cube[ 'colors' ] * new_cube[ 'values' ] )[ known ] )
+
+    result = {}
+    for key in [ 'ids', 'parents', 'labels', 'depths' ]:
+        result[ key ] = np.concatenate( [ cube[ key ], new_cube[ key ][ ~known ] ] )
+    result[ 'values' ] = np.concatenate( [ values,  new_cube[ 'values' ][ ~known ] ] )
+    weights            = np.concatenate( [ weights, ( new_cube[ 'colors' ] * new_cube[ 'values' ] )[ ~known ] ] )
+    result[ 'colors' ] = np.divide( weights, result[ 'values' ], out = np.zeros_like( weights ), where = result[ 'values' ] != 0 )
+    return result
+
+# Select the nodes to send for the current root: the root itself, its
+# ancestors (so that the path bar can go back up) and its descendants
+# down to 'depth' levels below it
+def select_treemap_nodes( cube, root_id = None, depth = TREEMAP_VISIBLE_DEPTH ):
+    ids      = cube[ 'ids' ]
+    position = np.flatnonzero( ids == root_id ) if root_id is not None else []
+    if len( position ) == 0:
+        root_id, position = ids[ 0 ], [ 0 ]
+    root_depth = cube[ 'depths' ][ position[ 0 ] ]
+
+    id_series   = pd.Series( ids )
+    descendants = ( id_series.str.startswith( root_id + '/' ) | ( id_series == root_id ) ).to_numpy()
+    descendants &= cube[ 'depths' ] <= root_depth + depth
+
+    # Walk up the parent chain of the root
+    ancestors = np.zeros( len( ids ), dtype = bool )
+    parent    = cube[ 'parents' ][ position[ 0 ] ]
+    while parent != '':
+        position              = np.flatnonzero( ids == parent )
+        ancestors[ position ] = True
+        parent                = cube[ 'parents' ][ position[ 0 ] ]
+    return root_id, descendants | ancestors
+
+# Build the treemap trace of the selected part of the cube
+def build_treemap_trace( cube, root_id = None, depth = TREEMAP_VISIBLE_DEPTH, colorscale = 'Blues' ):
+    root_id, selected = select_treemap_nodes( cube, root_id, depth )
+    return go.Treemap(
+        ids          = cube[ 'ids'     ][ selected ],
+        parents      = cube[ 'parents' ][ selected ],
+        labels       = cube[ 'labels'  ][ selected ],
+        values       = cube[ 'values'  ][ selected ],
+        branchvalues = 'total',
+        level        = root_id,
+        marker       = dict(
+            colors       = cube[ 'colors' ][ selected ],
+            colorscale   = colorscale,
+            showscale    = True,
+            cornerradius = 5
+        )
+    )